@@ -0,0 +1,137 @@
+import json
+import queue
+import threading
+import time
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+
+class AdmissionController:
+    """Global budget of in-flight upload bytes and concurrent sends.
+
+    Checked from the request headers before the body is read, so a burst of
+    large uploads is turned away instead of being spooled to disk and
+    parked in threads waiting on the bot.
+    """
+
+    def __init__(self, max_inflight_bytes, max_concurrent_sends):
+        self.max_inflight_bytes = max_inflight_bytes
+        self.max_concurrent_sends = max_concurrent_sends
+        self.inflight_bytes = 0
+        self.inflight_sends = 0
+        self.admitted = 0
+        self.rejected_bytes = 0
+        self.rejected_sends = 0
+        self._lock = threading.Lock()
+
+    def try_admit(self, nbytes):
+        """Reserve budget for one send; returns None on success or the rejection reason"""
+        with self._lock:
+            if self.inflight_sends >= self.max_concurrent_sends:
+                self.rejected_sends += 1
+                return "sends"
+            if self.inflight_bytes + nbytes > self.max_inflight_bytes:
+                self.rejected_bytes += 1
+                return "bytes"
+            self.inflight_sends += 1
+            self.inflight_bytes += nbytes
+            self.admitted += 1
+            return None
+
+    def release(self, nbytes):
+        with self._lock:
+            self.inflight_sends -= 1
+            self.inflight_bytes -= nbytes
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "inflight_bytes": self.inflight_bytes,
+                "max_inflight_bytes": self.max_inflight_bytes,
+                "inflight_sends": self.inflight_sends,
+                "max_concurrent_sends": self.max_concurrent_sends,
+                "admitted": self.admitted,
+                "rejected_bytes": self.rejected_bytes,
+                "rejected_sends": self.rejected_sends
+            }
+
+
+class BoundedWSGIServer(BaseWSGIServer):
+    """Werkzeug server with a fixed pool of request threads and a bounded accept queue.
+
+    Replaces threaded=True (one new thread per connection). When every
+    worker is busy and the queue is full, the connection gets an immediate
+    503 without its request being parsed.
+    """
+
+    multithread = True
+    daemon_threads = True
+
+    def __init__(self, host, port, app, workers=32, queue_size=64, handler=None):
+        super().__init__(host, port, app, handler or WSGIRequestHandler)
+        self.workers = workers
+        self.pending = queue.Queue(maxsize=queue_size)
+        self.busy = 0
+        self.served = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        for i in range(workers):
+            threading.Thread(target=self._worker, name=f"http-worker-{i}", daemon=True).start()
+
+    def process_request(self, request, client_address):
+        try:
+            self.pending.put_nowait((request, client_address))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            self._reject(request)
+
+    def _reject(self, request):
+        body = json.dumps({"status": "error", "message": "Server busy, retry later"}).encode()
+        try:
+            request.sendall(
+                b"HTTP/1.1 503 Service Unavailable\r\n"
+                b"Content-Type: application/json\r\n"
+                b"Retry-After: 1\r\n"
+                b"Connection: close\r\n"
+                b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body
+            )
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def _worker(self):
+        while True:
+            request, client_address = self.pending.get()
+            with self._lock:
+                self.busy += 1
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+                with self._lock:
+                    self.busy -= 1
+                    self.served += 1
+
+    def wait_idle(self, timeout):
+        """Wait until no request is queued or being handled; True if that happened in time"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._lock:
+                if not self.busy and self.pending.empty():
+                    return True
+            time.sleep(0.05)
+        return False
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "busy": self.busy,
+                "queue_depth": self.pending.qsize(),
+                "queue_size": self.pending.maxsize,
+                "served": self.served,
+                "rejected": self.rejected
+            }
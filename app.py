@@ -1,9 +1,26 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, send_file
+import io
+import json
+import mimetypes
 import re
 import os
+import uuid
+import signal
+import sys
+import threading
 from werkzeug.utils import secure_filename
-from bot import bot_instance
+from bot import BATCH_METHODS, bot_instance
+from bulk_actions import BULK_ACTIONS, campaign_tag
+from groups import normalize_group_jid
+from session_store import SessionMaintenance
+from message_store import SEARCH_WINDOW
+from scheduler import DEFAULT_LANE, LANES
+from admission import AdmissionController, BoundedWSGIServer
+from tracing import tracer
+from recorder import recorder
+from thumbnails import THUMBNAIL_SIZES, ThumbnailCache
 from datetime import datetime
+import time
 
 app = Flask(__name__)
 
@@ -25,9 +42,64 @@ FILE_SIZE_LIMITS = {
     'sticker': 1 * 1024 * 1024      # 1MB
 }
 
+# Campaigns
+CAMPAIGN_FORMATS = {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}
+CAMPAIGN_DEFAULT_RATE = 5.0   # messages per second
+CAMPAIGN_MAX_RATE = 50.0
+
+SEARCH_MAX_LIMIT = 100
+
+# Stored media, addressed by SHA-256 of the content
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+MEDIA_MAX_AGE = 365 * 24 * 3600   # content never changes under its hash
+# Inbound mimetypes are whatever the sender declared; only these are shown inline, the rest are downloads
+INLINE_MEDIA_TYPES = ('image/', 'audio/', 'video/')
+SCRIPTABLE_MEDIA_TYPES = ('image/svg+xml',)
+THUMBNAIL_DEFAULT_SIZE = 256
+THUMBNAIL_CACHE_BYTES = 32 * 1024 * 1024
+# Hand media files to a fronting Apache/lighttpd (X-Sendfile) instead of streaming them from Python
+app.config['USE_X_SENDFILE'] = os.environ.get('WA_MEDIA_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+DEAD_LETTER_MAX_LIMIT = 200
+
+# Send batches (ordered chains of sends)
+BATCH_STEP_TYPES = tuple(BATCH_METHODS)
+SEND_BATCH_MAX_STEPS = 20
+SEND_BATCH_MAX_WAIT = 120     # seconds a waiting client is held before getting 202
+
+# Bulk revoke/edit of tagged sends
+MAX_TAG_LENGTH = 128
+BULK_PROGRESS_INTERVAL = 1.0  # seconds between streamed progress lines
+
+# Admission control - checked from headers before a request body is read
+REQUEST_WORKERS = 32      # fixed HTTP worker threads
+REQUEST_QUEUE_SIZE = 64   # accepted connections waiting for a worker
+MAX_INFLIGHT_UPLOAD_BYTES = 256 * 1024 * 1024  # across all requests in progress
+MAX_CONCURRENT_SENDS = REQUEST_WORKERS - 8     # leaves workers free for status, metrics and reads
+MAX_JSON_REQUEST_SIZE = 1024 * 1024            # any body without a larger limit below, incl. /api/send-message
+MAX_SEND_REQUEST_SIZE = MAX_FILE_SIZE + 1024 * 1024  # largest file plus form overhead
+MAX_CAMPAIGN_UPLOAD_SIZE = 128 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = MAX_JSON_REQUEST_SIZE
+
+# HTTP status per send error code; anything else is a 500
+ERROR_STATUS_CODES = {
+    'transient': 503,
+    'rate_limited': 429,
+    'permanent_recipient': 400,
+    'permanent_media': 422,
+    'session': 503,
+    'timeout': 504,
+    'circuit_open': 503,
+    'shutting_down': 503,
+    'handed_over': 202   # accepted; sent by the next process after a restart
+}
+
 # Ensure upload directory exists
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+admission = AdmissionController(MAX_INFLIGHT_UPLOAD_BYTES, MAX_CONCURRENT_SENDS)
+thumbnails = ThumbnailCache(THUMBNAIL_CACHE_BYTES)
+http_server = None
+
 def validate_phone(phone):
     """Validate phone number format"""
     phone = re.sub(r'\D', '', phone)
@@ -39,6 +111,13 @@ def validate_phone(phone):
         phone = '62' + phone
     return phone
 
+def validate_recipient(recipient):
+    """Validate a phone number or group JID (`<id>@g.us` or bare group ID)"""
+    group_jid = normalize_group_jid(recipient)
+    if group_jid:
+        return group_jid
+    return validate_phone(recipient)
+
 def get_file_type(filename):
     """Determine file type based on extension"""
     if '.' not in filename:
@@ -62,13 +141,17 @@ def allowed_file(filename, expected_type):
     file_type = get_file_type(filename)
     return file_type == expected_type
 
-def save_uploaded_file(file):
-    """Save uploaded file and return path"""
+def save_uploaded_file(file, unique=False):
+    """Save uploaded file and return path; `unique` prefixes a random id so concurrent uploads never collide"""
     if file and file.filename:
         filename = secure_filename(file.filename)
         if filename:
+            if unique:
+                filename = f"{uuid.uuid4().hex[:12]}-{filename}"
             filepath = os.path.join(UPLOAD_FOLDER, filename)
-            file.save(filepath)
+            with tracer.span("save_uploaded_file") as span:
+                file.save(filepath)
+                span.set_attribute("message.bytes", os.path.getsize(filepath))
             return filepath
     return None
 
@@ -77,11 +160,178 @@ def validate_file_size(file_size, file_type):
     max_size = FILE_SIZE_LIMITS.get(file_type, MAX_FILE_SIZE)
     return file_size <= max_size
 
+def get_request_deadline():
+    """Absolute client deadline (epoch seconds) from headers or payload, if any.
+    
+    X-Request-Deadline carries an absolute epoch timestamp, X-Request-Timeout
+    (or a `timeout` field) a relative number of seconds.
+    """
+    deadline = request.headers.get('X-Request-Deadline')
+    if deadline:
+        try:
+            return float(deadline)
+        except ValueError:
+            pass
+    
+    timeout = request.headers.get('X-Request-Timeout')
+    if not timeout:
+        if request.is_json:
+            timeout = (request.get_json(silent=True) or {}).get('timeout')
+        else:
+            timeout = request.form.get('timeout')
+    if timeout:
+        try:
+            return time.time() + float(timeout)
+        except (TypeError, ValueError):
+            pass
+    return None
+
+def parse_time_param(value):
+    """Epoch seconds or ISO date/datetime (2025-08-15, 2025-08-15T10:00:00) to epoch seconds"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def get_request_priority():
+    """Priority lane from the X-Priority header or a `priority` field"""
+    priority = request.headers.get('X-Priority')
+    if not priority:
+        if request.is_json:
+            priority = (request.get_json(silent=True) or {}).get('priority')
+        else:
+            priority = request.form.get('priority')
+    return (priority or DEFAULT_LANE).lower()
+
+def get_request_tag():
+    """Tag to record with the sent message, from the X-Message-Tag header or a `tag` field"""
+    tag = request.headers.get('X-Message-Tag')
+    if not tag:
+        if request.is_json:
+            tag = (request.get_json(silent=True) or {}).get('tag')
+        else:
+            tag = request.form.get('tag')
+    tag = str(tag or '').strip()[:MAX_TAG_LENGTH]
+    return tag or None
+
+def send_options():
+    """Per-request keyword arguments forwarded to the bot send wrappers"""
+    return {"priority": get_request_priority(), "deadline": get_request_deadline(), "tag": get_request_tag()}
+
+def error_status(result):
+    """HTTP status for a failed send result"""
+    return ERROR_STATUS_CODES.get(result.get("code"), 500)
+
+@app.before_request
+def start_recording():
+    if recorder.enabled:
+        g.record_started = (time.time(), time.perf_counter())
+
+@app.after_request
+def record_traffic(response):
+    """Request metadata for the opt-in traffic recording (WA_TRAFFIC_RECORD)"""
+    started = g.pop('record_started', None)
+    if started is not None:
+        recorder.record(request, response, time.perf_counter() - started[1], started[0])
+    return response
+
+@app.before_request
+def start_trace():
+    """Root span per request, continuing the caller's trace from a W3C traceparent header"""
+    parent = tracer.from_traceparent(request.headers.get('traceparent'))
+    span = tracer.start_span(f"{request.method} {request.path}", {
+        "http.method": request.method,
+        "http.target": request.path,
+        "http.request_content_length": request.content_length or 0
+    }, parent=parent)
+    g.trace_span = span
+    g.trace_token = tracer.attach(span)
+
+@app.after_request
+def tag_trace(response):
+    span = g.get('trace_span')
+    if span is not None and span.sampled:
+        span.set_attribute("http.status_code", response.status_code)
+        if response.status_code >= 500:
+            span.set_error(f"HTTP {response.status_code}")
+        response.headers['traceparent'] = span.traceparent
+    return response
+
+@app.teardown_request
+def end_trace(exc):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        tracer.detach(token)
+        g.pop('trace_span').end()
+
+@app.before_request
+def reject_while_draining():
+    """Stop accepting new work once a graceful shutdown has started"""
+    if bot_instance.draining and request.method == 'POST':
+        return jsonify({"status": "error", "code": "shutting_down", "message": "Server restarting, retry later"}), 503, {'Retry-After': '5'}
+
+@app.before_request
+def admit_request():
+    """Reserve in-flight byte and send budget for uploads and sends, or reject fast"""
+    if request.method != 'POST':
+        return None
+    if request.path == '/api/send-message':
+        max_size = MAX_JSON_REQUEST_SIZE
+    elif request.path.startswith('/api/send-'):
+        max_size = MAX_SEND_REQUEST_SIZE
+    elif request.path == '/api/campaigns':
+        max_size = MAX_CAMPAIGN_UPLOAD_SIZE
+    else:
+        return None
+    
+    nbytes = request.content_length
+    if nbytes is None:
+        # A chunked body would be admitted without reserving its size
+        return jsonify({"status": "error", "message": "Content-Length required"}), 411
+    request.max_content_length = max_size
+    if nbytes > max_size:
+        return jsonify({
+            "status": "error",
+            "message": f"Request too large. Max size: {max_size // (1024*1024)}MB"
+        }), 413
+    
+    reason = admission.try_admit(nbytes)
+    if reason == 'sends':
+        return jsonify({"status": "error", "message": "Too many concurrent sends, retry later"}), 429, {'Retry-After': '1'}
+    if reason == 'bytes':
+        return jsonify({"status": "error", "message": "Upload capacity exhausted, retry later"}), 503, {'Retry-After': '1'}
+    g.admitted_bytes = nbytes
+
+@app.teardown_request
+def release_admission(exc):
+    nbytes = g.pop('admitted_bytes', None)
+    if nbytes is not None:
+        admission.release(nbytes)
+
+@app.before_request
+def parse_upload():
+    """Parse multipart bodies up front so parsing is its own trace stage"""
+    if request.method == 'POST' and request.mimetype == 'multipart/form-data':
+        with tracer.span("parse_multipart", {"message.bytes": request.content_length or 0}):
+            request.files
+
+@app.before_request
+def check_priority():
+    """Reject unknown priority lanes before the send is attempted"""
+    if request.method == 'POST' and request.path.startswith('/api/send-'):
+        if get_request_priority() not in LANES:
+            return jsonify({
+                "status": "error",
+                "message": f"Invalid priority. Allowed: {list(LANES)}"
+            }), 400
+
 @app.route('/', methods=['GET'])
 def index():
     return jsonify({
         "service": "WhatsApp API - Complete Media Support",
-        "status": "running",
+        "status": "draining" if bot_instance.draining else "running",
         "bot_connected": bot_instance.is_connected,
         "version": "2.0.0",
         "features": {
@@ -113,7 +363,27 @@ def index():
             "POST /api/send-audio - Send audio file",
             "POST /api/send-video - Send video with caption", 
             "POST /api/send-sticker - Send WebP sticker",
-            "GET /api/status - Bot status"
+            "POST /api/send-batch - Send a chain of messages in order",
+            "GET /api/sends/<batch_id> - Send batch progress",
+            "POST /api/messages/<action> - Revoke or edit all messages with a tag",
+            "GET /api/bulk-actions/<id> - Bulk revoke/edit progress (stream=1 for NDJSON)",
+            "POST /api/bulk-actions/<id>/cancel - Cancel a bulk revoke/edit",
+            "GET /api/status - Bot status",
+            "GET /api/groups - List joined groups",
+            "GET /api/search?q=&chat=&from=&to= - Search message history",
+            "GET /api/groups/<group_jid> - Group info and participants",
+            "GET /api/media/<sha256> - Stored media with Range and ETag support",
+            "GET /api/media/<sha256>/thumbnail?size= - Cached image thumbnail",
+            "POST /api/campaigns - Start CSV/NDJSON campaign",
+            "GET /api/campaigns/<id> - Campaign progress",
+            "POST /api/campaigns/<id>/pause - Pause campaign",
+            "POST /api/campaigns/<id>/resume - Resume campaign",
+            "GET /api/admin/session - Session store sizes",
+            "POST /api/admin/session/prune - Prune stale session keys",
+            "GET /api/dead-letters - Failed sends by error class",
+            "POST /api/dead-letters/<id>/requeue - Resend a failed send",
+            "POST /api/dead-letters/requeue - Resend failed sends by ids or class",
+            "GET /api/metrics - Send counters, concurrency limits, circuit breaker"
         ]
     })
 
@@ -132,14 +402,17 @@ def send_message():
         if not phone or not message:
             return jsonify({"status": "error", "message": "Phone and message required"}), 400
             
-        formatted_phone = validate_phone(phone)
+        formatted_phone = validate_recipient(phone)
         if not formatted_phone:
-            return jsonify({"status": "error", "message": "Invalid phone number"}), 400
+            return jsonify({"status": "error", "message": "Invalid phone number or group JID"}), 400
             
         if not bot_instance.is_connected:
             return jsonify({"status": "error", "message": "Bot not connected"}), 503
             
-        result = bot_instance.send_message(formatted_phone, message)
+        mention_all = bool(data.get('mention_all', False))
+        link_preview = data.get('link_preview', True) is not False
+        
+        result = bot_instance.send_message(formatted_phone, message, mention_all, link_preview, **send_options())
         
         if result["status"] == "success":
             return jsonify({
@@ -147,13 +420,14 @@ def send_message():
                 "message": "Text message sent successfully",
                 "data": {
                     "phone": formatted_phone,
+                    "message_id": result["data"].get("message_id"),
                     "message": message,
                     "type": "text",
                     "timestamp": str(datetime.now())
                 }
             }), 200
         else:
-            return jsonify(result), 500
+            return jsonify(result), error_status(result)
             
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
@@ -169,9 +443,9 @@ def send_image():
         if not phone:
             return jsonify({"status": "error", "message": "Phone number required"}), 400
             
-        formatted_phone = validate_phone(phone)
+        formatted_phone = validate_recipient(phone)
         if not formatted_phone:
-            return jsonify({"status": "error", "message": "Invalid phone number"}), 400
+            return jsonify({"status": "error", "message": "Invalid phone number or group JID"}), 400
         
         caption = request.form.get('caption', '')
         
@@ -204,7 +478,7 @@ def send_image():
             return jsonify({"status": "error", "message": "Failed to save file"}), 500
         
         try:
-            result = bot_instance.send_image(formatted_phone, filepath, caption)
+            result = bot_instance.send_image(formatted_phone, filepath, caption, **send_options())
             
             try:
                 os.remove(filepath)
@@ -217,6 +491,7 @@ def send_image():
                     "message": "Image sent successfully",
                     "data": {
                         "phone": formatted_phone,
+                        "message_id": result["data"].get("message_id"),
                         "filename": file.filename,
                         "caption": caption,
                         "type": "image",
@@ -225,7 +500,7 @@ def send_image():
                     }
                 }), 200
             else:
-                return jsonify(result), 500
+                return jsonify(result), error_status(result)
                 
         except Exception as e:
             try:
@@ -248,9 +523,9 @@ def send_document():
         if not phone:
             return jsonify({"status": "error", "message": "Phone number required"}), 400
             
-        formatted_phone = validate_phone(phone)
+        formatted_phone = validate_recipient(phone)
         if not formatted_phone:
-            return jsonify({"status": "error", "message": "Invalid phone number"}), 400
+            return jsonify({"status": "error", "message": "Invalid phone number or group JID"}), 400
         
         caption = request.form.get('caption', '')
         
@@ -283,7 +558,7 @@ def send_document():
             return jsonify({"status": "error", "message": "Failed to save file"}), 500
         
         try:
-            result = bot_instance.send_document(formatted_phone, filepath, caption, file.filename)
+            result = bot_instance.send_document(formatted_phone, filepath, caption, file.filename, **send_options())
             
             try:
                 os.remove(filepath)
@@ -296,6 +571,7 @@ def send_document():
                     "message": "Document sent successfully",
                     "data": {
                         "phone": formatted_phone,
+                        "message_id": result["data"].get("message_id"),
                         "filename": file.filename,
                         "caption": caption,
                         "type": "document",
@@ -304,7 +580,7 @@ def send_document():
                     }
                 }), 200
             else:
-                return jsonify(result), 500
+                return jsonify(result), error_status(result)
                 
         except Exception as e:
             try:
@@ -327,9 +603,9 @@ def send_audio():
         if not phone:
             return jsonify({"status": "error", "message": "Phone number required"}), 400
             
-        formatted_phone = validate_phone(phone)
+        formatted_phone = validate_recipient(phone)
         if not formatted_phone:
-            return jsonify({"status": "error", "message": "Invalid phone number"}), 400
+            return jsonify({"status": "error", "message": "Invalid phone number or group JID"}), 400
         
         if 'file' not in request.files:
             return jsonify({"status": "error", "message": "No file uploaded"}), 400
@@ -360,7 +636,7 @@ def send_audio():
             return jsonify({"status": "error", "message": "Failed to save file"}), 500
         
         try:
-            result = bot_instance.send_audio(formatted_phone, filepath)
+            result = bot_instance.send_audio(formatted_phone, filepath, **send_options())
             
             try:
                 os.remove(filepath)
@@ -373,6 +649,7 @@ def send_audio():
                     "message": "Audio sent successfully",
                     "data": {
                         "phone": formatted_phone,
+                        "message_id": result["data"].get("message_id"),
                         "filename": file.filename,
                         "type": "audio",
                         "file_size_kb": round(file_size / 1024, 2),
@@ -380,7 +657,7 @@ def send_audio():
                     }
                 }), 200
             else:
-                return jsonify(result), 500
+                return jsonify(result), error_status(result)
                 
         except Exception as e:
             try:
@@ -403,9 +680,9 @@ def send_video():
         if not phone:
             return jsonify({"status": "error", "message": "Phone number required"}), 400
             
-        formatted_phone = validate_phone(phone)
+        formatted_phone = validate_recipient(phone)
         if not formatted_phone:
-            return jsonify({"status": "error", "message": "Invalid phone number"}), 400
+            return jsonify({"status": "error", "message": "Invalid phone number or group JID"}), 400
         
         caption = request.form.get('caption', '')
         
@@ -438,7 +715,7 @@ def send_video():
             return jsonify({"status": "error", "message": "Failed to save file"}), 500
         
         try:
-            result = bot_instance.send_video(formatted_phone, filepath, caption)
+            result = bot_instance.send_video(formatted_phone, filepath, caption, **send_options())
             
             try:
                 os.remove(filepath)
@@ -451,6 +728,7 @@ def send_video():
                     "message": "Video sent successfully",
                     "data": {
                         "phone": formatted_phone,
+                        "message_id": result["data"].get("message_id"),
                         "filename": file.filename,
                         "caption": caption,
                         "type": "video",
@@ -459,7 +737,7 @@ def send_video():
                     }
                 }), 200
             else:
-                return jsonify(result), 500
+                return jsonify(result), error_status(result)
                 
         except Exception as e:
             try:
@@ -482,9 +760,9 @@ def send_sticker():
         if not phone:
             return jsonify({"status": "error", "message": "Phone number required"}), 400
             
-        formatted_phone = validate_phone(phone)
+        formatted_phone = validate_recipient(phone)
         if not formatted_phone:
-            return jsonify({"status": "error", "message": "Invalid phone number"}), 400
+            return jsonify({"status": "error", "message": "Invalid phone number or group JID"}), 400
         
         if 'file' not in request.files:
             return jsonify({"status": "error", "message": "No file uploaded"}), 400
@@ -515,7 +793,7 @@ def send_sticker():
             return jsonify({"status": "error", "message": "Failed to save file"}), 500
         
         try:
-            result = bot_instance.send_sticker(formatted_phone, filepath)
+            result = bot_instance.send_sticker(formatted_phone, filepath, **send_options())
             
             try:
                 os.remove(filepath)
@@ -528,6 +806,7 @@ def send_sticker():
                     "message": "Sticker sent successfully",
                     "data": {
                         "phone": formatted_phone,
+                        "message_id": result["data"].get("message_id"),
                         "filename": file.filename,
                         "type": "sticker",
                         "file_size_kb": round(file_size / 1024, 2),
@@ -535,7 +814,7 @@ def send_sticker():
                     }
                 }), 200
             else:
-                return jsonify(result), 500
+                return jsonify(result), error_status(result)
                 
         except Exception as e:
             try:
@@ -547,6 +826,207 @@ def send_sticker():
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def parse_flag(value, default):
+    """Boolean from a JSON value or a form string"""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes')
+    return bool(value)
+
+def build_batch_steps(specs, default_phone):
+    """(type, send arguments) per batch step plus the files saved for them, or an error message"""
+    steps, files = [], []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict):
+            return steps, files, f"Step {index}: must be an object"
+        kind = spec.get('type', 'text')
+        if kind not in BATCH_STEP_TYPES:
+            return steps, files, f"Step {index}: type must be one of {list(BATCH_STEP_TYPES)}"
+        phone = validate_recipient(str(spec.get('phone') or default_phone or ''))
+        if not phone:
+            return steps, files, f"Step {index}: invalid phone number or group JID"
+        
+        if kind == 'text':
+            if not spec.get('message'):
+                return steps, files, f"Step {index}: message required"
+            steps.append((kind, {
+                "phone": phone,
+                "message": str(spec['message']),
+                "mention_all": bool(spec.get('mention_all', False)),
+                "link_preview": spec.get('link_preview', True) is not False
+            }))
+            continue
+        
+        file = request.files.get(spec.get('file') or '')
+        if not file or not file.filename:
+            return steps, files, f"Step {index}: `file` must name an uploaded file field"
+        if not allowed_file(file.filename, kind):
+            return steps, files, f"Step {index}: invalid file type for {kind}"
+        file.seek(0, os.SEEK_END)
+        file_size = file.tell()
+        file.seek(0)
+        if not validate_file_size(file_size, kind):
+            return steps, files, f"Step {index}: file too large for {kind} ({FILE_SIZE_LIMITS[kind] // (1024*1024)}MB max)"
+        filepath = save_uploaded_file(file, unique=True)
+        if not filepath:
+            return steps, files, f"Step {index}: failed to save file"
+        files.append(filepath)
+        
+        arguments = {"phone": phone, "filepath": filepath}
+        if kind in ('image', 'video', 'document'):
+            arguments["caption"] = str(spec.get('caption') or '')
+        if kind == 'document':
+            arguments["filename"] = spec.get('filename') or file.filename
+        steps.append((kind, arguments))
+    return steps, files, None
+
+def batch_response(batch):
+    """HTTP response for a batch: 202 while running or handed over, the failed step's status on failure"""
+    if batch["status"] == "completed":
+        code = 200
+    elif batch["status"] in ("running", "handed_over"):
+        code = 202
+    else:
+        failed = next(step for step in batch["steps"] if step["status"] in ("failed", "pending", "running"))
+        code = error_status(failed["result"] or {})
+    headers = {'Location': f"/api/sends/{batch['id']}"}
+    return jsonify({"status": "success" if code < 400 else "error", "data": batch}), code, headers
+
+@app.route('/api/send-batch', methods=['POST'])
+def send_batch():
+    """Send a chain of messages strictly one after another.
+    
+    JSON, or multipart with the chain as a JSON `sends` field and each media
+    step's `file` naming a file field. With wait=false (or once the wait is
+    over) the response is 202 and progress is at /api/sends/<id>.
+    """
+    files = []
+    try:
+        if request.is_json:
+            data = request.get_json(silent=True) or {}
+            specs = data.get('sends')
+        else:
+            data = request.form
+            try:
+                specs = json.loads(data.get('sends') or 'null')
+            except ValueError:
+                return jsonify({"status": "error", "message": "sends must be a JSON list"}), 400
+        
+        if not isinstance(specs, list) or not specs:
+            return jsonify({"status": "error", "message": "sends must be a non-empty list"}), 400
+        if len(specs) > SEND_BATCH_MAX_STEPS:
+            return jsonify({"status": "error", "message": f"At most {SEND_BATCH_MAX_STEPS} sends per batch"}), 400
+        if not bot_instance.is_connected:
+            return jsonify({"status": "error", "message": "Bot not connected"}), 503
+        
+        steps, files, error = build_batch_steps(specs, data.get('phone'))
+        if error:
+            return jsonify({"status": "error", "message": error}), 400
+        
+        batch_id = bot_instance.submit_batch(
+            steps,
+            stop_on_error=parse_flag(data.get('stop_on_error'), True),
+            priority=get_request_priority(),
+            files=files
+        )
+        if batch_id is None:
+            return jsonify({"status": "error", "message": "Bot not connected"}), 503
+        files = []  # owned by the batch now
+        
+        wait = 0
+        if parse_flag(data.get('wait'), True):
+            deadline = get_request_deadline()
+            wait = SEND_BATCH_MAX_WAIT if deadline is None else min(max(0, deadline - time.time()), SEND_BATCH_MAX_WAIT)
+        return batch_response(bot_instance.batches.get(batch_id, wait=wait))
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+    finally:
+        for filepath in files:
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+
+@app.route('/api/sends/<batch_id>', methods=['GET'])
+def send_batch_status(batch_id):
+    """Progress of a send batch; ?wait=<seconds> blocks until it finishes"""
+    try:
+        wait = min(max(float(request.args.get('wait', 0)), 0), SEND_BATCH_MAX_WAIT)
+    except ValueError:
+        return jsonify({"status": "error", "message": "wait must be a number"}), 400
+    batch = bot_instance.batches.get(batch_id, wait=wait)
+    if not batch:
+        return jsonify({"status": "error", "message": "Batch not found"}), 404
+    return jsonify({"status": "success", "data": batch})
+
+def bulk_progress(job_id):
+    """NDJSON stream of a bulk job's progress, one line per BULK_PROGRESS_INTERVAL until it ends"""
+    def lines():
+        for job in bot_instance.bulk.watch(job_id, BULK_PROGRESS_INTERVAL):
+            yield json.dumps(job) + "\n"
+    return Response(lines(), mimetype='application/x-ndjson', headers={'Cache-Control': 'no-cache'})
+
+def bulk_response(job_id, stream):
+    if stream:
+        return bulk_progress(job_id)
+    headers = {'Location': f"/api/bulk-actions/{job_id}"}
+    return jsonify({"status": "success", "data": bot_instance.bulk.get(job_id)}), 202, headers
+
+@app.route('/api/messages/<action>', methods=['POST'])
+def bulk_action(action):
+    """Revoke or edit every message sent with a tag (or by a campaign).
+    
+    JSON: `tag` or `campaign_id`; for edit, `message` (new text) or `find`
+    and `replace`. Returns 202 with the job, or with stream=true an NDJSON
+    progress stream until the job ends.
+    """
+    if action not in BULK_ACTIONS:
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    try:
+        data = request.get_json(silent=True) or {}
+        tag = data.get('tag') or (campaign_tag(data['campaign_id']) if data.get('campaign_id') else None)
+        if not tag:
+            return jsonify({"status": "error", "message": "tag or campaign_id required"}), 400
+        
+        text = find = replace = None
+        if action == 'edit':
+            text = data.get('message')
+            find, replace = data.get('find'), data.get('replace')
+            if text:
+                text = str(text)
+            elif find and replace is not None:
+                find, replace = str(find), str(replace)
+            else:
+                return jsonify({"status": "error", "message": "message, or find and replace, required"}), 400
+        
+        if not bot_instance.messages.count_tagged(tag):
+            return jsonify({"status": "error", "message": f"No sent messages tagged {tag}"}), 404
+        job_id = bot_instance.bulk.submit(action, tag, text=text, find=find, replace=replace)
+        if job_id is None:
+            return jsonify({"status": "error", "message": "Bot not connected"}), 503
+        return bulk_response(job_id, parse_flag(data.get('stream'), False))
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/bulk-actions/<job_id>', methods=['GET'])
+def bulk_action_status(job_id):
+    """Progress of a bulk revoke/edit; ?stream=1 streams it as NDJSON until the job ends"""
+    job = bot_instance.bulk.get(job_id)
+    if not job:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    if parse_flag(request.args.get('stream'), False):
+        return bulk_progress(job_id)
+    return jsonify({"status": "success", "data": job})
+
+@app.route('/api/bulk-actions/<job_id>/cancel', methods=['POST'])
+def cancel_bulk_action(job_id):
+    if not bot_instance.bulk.cancel(job_id):
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify({"status": "success", "data": bot_instance.bulk.get(job_id)})
+
 @app.route('/api/status', methods=['GET'])
 def bot_status():
     return jsonify({
@@ -570,6 +1050,343 @@ def bot_status():
         "message": "Bot status retrieved"
     })
 
+@app.route('/api/groups', methods=['GET'])
+def list_groups():
+    """List joined groups (cached, ?refresh=1 to refetch)"""
+    if not bot_instance.is_connected:
+        return jsonify({"status": "error", "message": "Bot not connected"}), 503
+    
+    refresh = request.args.get('refresh', '').lower() in ('1', 'true', 'yes')
+    result = bot_instance.get_groups(refresh, deadline=get_request_deadline())
+    if result["status"] == "success":
+        return jsonify(result), 200
+    return jsonify(result), error_status(result)
+
+@app.route('/api/groups/<group_jid>', methods=['GET'])
+def group_info(group_jid):
+    """Group metadata and participant list (cached)"""
+    if not bot_instance.is_connected:
+        return jsonify({"status": "error", "message": "Bot not connected"}), 503
+    
+    formatted_jid = normalize_group_jid(group_jid, bare_legacy=True)
+    if not formatted_jid:
+        return jsonify({"status": "error", "message": "Invalid group JID"}), 400
+    
+    result = bot_instance.get_group_info(formatted_jid, deadline=get_request_deadline())
+    if result["status"] == "success":
+        return jsonify(result), 200
+    return jsonify(result), error_status(result)
+
+def media_path(sha256):
+    """Path of a file in the media store, or None"""
+    if not SHA256_RE.match(sha256):
+        return None
+    # Absolute, since send_file resolves relative paths against the app root, not the working directory
+    path = os.path.abspath(bot_instance.media.path_for(sha256))
+    return path if os.path.isfile(path) else None
+
+def immutable(response):
+    """Cache headers for content-addressed responses; conversations stay out of shared caches"""
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/media/<sha256>', methods=['GET'])
+def get_media(sha256):
+    """Stream a stored attachment by content hash.
+    
+    send_file streams from disk through the server's wsgi.file_wrapper
+    (sendfile under gunicorn/uWSGI) and answers Range, If-Range and
+    If-None-Match against a strong ETag, the content hash. With X-Sendfile
+    the body comes from the proxy, so ranges are left to it and only
+    If-None-Match is answered here.
+    """
+    sha256 = sha256.lower()
+    path = media_path(sha256)
+    if not path:
+        return jsonify({"status": "error", "message": "Media not found"}), 404
+    mimetype = bot_instance.messages.media_mimetype(sha256) or 'application/octet-stream'
+    base_type = mimetype.split(';')[0].strip().lower()
+    extension = mimetypes.guess_extension(base_type) or ''
+    # HTML or SVG from a customer must never render (and run script) on the API origin
+    inline = base_type.startswith(INLINE_MEDIA_TYPES) and base_type not in SCRIPTABLE_MEDIA_TYPES
+    x_sendfile = app.config['USE_X_SENDFILE']
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        as_attachment=not inline or parse_flag(request.args.get('download'), False),
+        download_name=sha256 + extension,
+        conditional=not x_sendfile,
+        etag=sha256,
+        max_age=MEDIA_MAX_AGE
+    )
+    if x_sendfile:
+        # A 206 here would carry no body; the proxy serves ranges of the file it sends
+        response = response.make_conditional(request.environ)
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return immutable(response)
+
+@app.route('/api/media/<sha256>/thumbnail', methods=['GET'])
+def get_media_thumbnail(sha256):
+    """JPEG thumbnail of a stored image; ?size= one of THUMBNAIL_SIZES"""
+    sha256 = sha256.lower()
+    path = media_path(sha256)
+    if not path:
+        return jsonify({"status": "error", "message": "Media not found"}), 404
+    if not thumbnails.available:
+        return jsonify({"status": "error", "message": "Thumbnails need Pillow installed"}), 501
+    try:
+        size = int(request.args.get('size', THUMBNAIL_DEFAULT_SIZE))
+    except ValueError:
+        size = None
+    if size not in THUMBNAIL_SIZES:
+        return jsonify({"status": "error", "message": f"size must be one of {list(THUMBNAIL_SIZES)}"}), 400
+    
+    etag = f"{sha256}-{size}"
+    if request.if_none_match.contains(etag):
+        # Revalidation needs neither the cache nor a render
+        response = Response(status=304)
+        response.set_etag(etag)
+        response.cache_control.max_age = MEDIA_MAX_AGE
+        return immutable(response)
+    try:
+        data = thumbnails.get(sha256, path, size)
+    except Exception:
+        return jsonify({"status": "error", "message": "Thumbnails are only available for images"}), 415
+    response = send_file(io.BytesIO(data), mimetype='image/jpeg', conditional=True, etag=etag, max_age=MEDIA_MAX_AGE)
+    return immutable(response)
+
+@app.route('/api/search', methods=['GET'])
+def search_messages():
+    """Full-text search over inbound and outbound message text and captions"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"status": "error", "message": "Query parameter q required"}), 400
+    
+    chat = request.args.get('chat')
+    if chat and '@' not in chat:
+        chat = validate_recipient(chat)
+        if chat and '@' not in chat:
+            chat = f"{chat}@s.whatsapp.net"
+        if not chat:
+            return jsonify({"status": "error", "message": "Invalid chat"}), 400
+    
+    try:
+        since = parse_time_param(request.args.get('from'))
+        until = parse_time_param(request.args.get('to'))
+        limit = min(max(int(request.args.get('limit', 20)), 1), SEARCH_MAX_LIMIT)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid from/to/limit/offset"}), 400
+    
+    try:
+        results, has_more, window_full = bot_instance.messages.search(
+            query, chat=chat, since=since, until=until, limit=limit, offset=offset
+        )
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({
+        "status": "success",
+        "data": results,
+        "pagination": {
+            "limit": limit,
+            "offset": offset,
+            "next_offset": offset + limit if has_more else None,
+            "ranked_window": SEARCH_WINDOW,
+            "window_full": window_full
+        }
+    })
+
+@app.route('/api/campaigns', methods=['POST'])
+def create_campaign():
+    """Start a campaign from an uploaded CSV/NDJSON file and a message template"""
+    try:
+        template = request.form.get('template')
+        if not template:
+            return jsonify({"status": "error", "message": "Template required"}), 400
+        
+        if 'file' not in request.files or request.files['file'].filename == '':
+            return jsonify({"status": "error", "message": "No file uploaded"}), 400
+        file = request.files['file']
+        
+        extension = file.filename.rsplit('.', 1)[-1].lower()
+        fmt = request.form.get('format') or CAMPAIGN_FORMATS.get(extension)
+        if fmt not in ('csv', 'ndjson'):
+            return jsonify({"status": "error", "message": "File must be CSV or NDJSON"}), 400
+        
+        try:
+            rate = float(request.form.get('rate', CAMPAIGN_DEFAULT_RATE))
+            concurrency = int(request.form.get('concurrency', 4))
+        except ValueError:
+            return jsonify({"status": "error", "message": "rate and concurrency must be numbers"}), 400
+        if not 0 < rate <= CAMPAIGN_MAX_RATE or not 1 <= concurrency <= 32:
+            return jsonify({
+                "status": "error",
+                "message": f"rate must be in (0, {CAMPAIGN_MAX_RATE}] and concurrency in [1, 32]"
+            }), 400
+        
+        try:
+            campaign = bot_instance.campaigns.create(
+                file.stream, fmt, template,
+                name=request.form.get('name'),
+                phone_column=request.form.get('phone_column', 'phone'),
+                rate=rate,
+                concurrency=concurrency
+            )
+        except ValueError as e:
+            return jsonify({"status": "error", "message": str(e)}), 400
+        
+        return jsonify({"status": "success", "message": "Campaign started", "data": campaign}), 201
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@app.route('/api/campaigns', methods=['GET'])
+def list_campaigns():
+    return jsonify({"status": "success", "data": bot_instance.campaigns.list()})
+
+@app.route('/api/campaigns/<campaign_id>', methods=['GET'])
+def campaign_status(campaign_id):
+    campaign = bot_instance.campaigns.status(campaign_id)
+    if not campaign:
+        return jsonify({"status": "error", "message": "Campaign not found"}), 404
+    return jsonify({"status": "success", "data": campaign})
+
+@app.route('/api/campaigns/<campaign_id>/pause', methods=['POST'])
+def pause_campaign(campaign_id):
+    campaign = bot_instance.campaigns.pause(campaign_id)
+    if not campaign:
+        return jsonify({"status": "error", "message": "Campaign not found"}), 404
+    return jsonify({"status": "success", "data": campaign})
+
+@app.route('/api/campaigns/<campaign_id>/resume', methods=['POST'])
+def resume_campaign(campaign_id):
+    campaign = bot_instance.campaigns.resume(campaign_id)
+    if not campaign:
+        return jsonify({"status": "error", "message": "Campaign not found"}), 404
+    return jsonify({"status": "success", "data": campaign})
+
+@app.route('/api/admin/session', methods=['GET'])
+def session_report():
+    """Session database table sizes and fragmentation"""
+    maintenance = SessionMaintenance()
+    if not maintenance.supported():
+        return jsonify({"status": "error", "message": "Only available for the SQLite session store"}), 400
+    return jsonify({"status": "success", "data": maintenance.report()})
+
+@app.route('/api/admin/session/prune', methods=['POST'])
+def session_prune():
+    """Prune stale pre-keys and sender keys of left groups (dry run unless dry_run=false)"""
+    try:
+        maintenance = SessionMaintenance()
+        if not maintenance.supported():
+            return jsonify({"status": "error", "message": "Only available for the SQLite session store"}), 400
+        
+        data = request.get_json(silent=True) or {}
+        dry_run = data.get('dry_run', True) is not False
+        keep_prekeys = int(data.get('keep_prekeys', 1000))
+        
+        active_groups = None
+        if data.get('prune_sender_keys', False):
+            # Needs the live group list; never guess which groups we left
+            if not bot_instance.is_connected:
+                return jsonify({"status": "error", "message": "Bot not connected"}), 503
+            groups = bot_instance.get_groups(refresh=True)
+            if groups["status"] != "success":
+                return jsonify(groups), error_status(groups)
+            active_groups = [g["jid"] for g in groups["data"]]
+        
+        result = maintenance.prune(active_groups, keep_prekeys=keep_prekeys, dry_run=dry_run)
+        return jsonify({"status": "success", "data": result})
+        
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+def requeue_response(**kwargs):
+    """Claim dead letters and resend them in the background"""
+    if not bot_instance.is_connected:
+        return jsonify({"status": "error", "message": "Bot not connected"}), 503
+    entries = bot_instance.requeue_dead_letters(**kwargs)
+    if not entries:
+        return jsonify({"status": "error", "message": "No dead letters to requeue"}), 404
+    return jsonify({
+        "status": "success",
+        "message": f"{len(entries)} sends requeued",
+        "data": [entry["id"] for entry in entries]
+    }), 202
+
+@app.route('/api/dead-letters', methods=['GET'])
+def list_dead_letters():
+    """Failed sends kept for inspection (?class=&status=dead|requeued|sent&limit=&offset=)"""
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), DEAD_LETTER_MAX_LIMIT)
+        offset = max(int(request.args.get('offset', 0)), 0)
+    except ValueError:
+        return jsonify({"status": "error", "message": "Invalid limit/offset"}), 400
+    entries = bot_instance.dead_letters.list(
+        status=request.args.get('status', 'dead'),
+        error_class=request.args.get('class'),
+        limit=limit,
+        offset=offset
+    )
+    return jsonify({"status": "success", "data": entries})
+
+@app.route('/api/dead-letters/<int:entry_id>', methods=['GET'])
+def dead_letter(entry_id):
+    entry = bot_instance.dead_letters.get(entry_id)
+    if not entry:
+        return jsonify({"status": "error", "message": "Dead letter not found"}), 404
+    return jsonify({"status": "success", "data": entry})
+
+@app.route('/api/dead-letters/<int:entry_id>', methods=['DELETE'])
+def discard_dead_letter(entry_id):
+    if not bot_instance.dead_letters.discard(entry_id):
+        return jsonify({"status": "error", "message": "Dead letter not found"}), 404
+    return jsonify({"status": "success", "message": "Dead letter discarded"})
+
+@app.route('/api/dead-letters/<int:entry_id>/requeue', methods=['POST'])
+def requeue_dead_letter(entry_id):
+    return requeue_response(entry_ids=[entry_id])
+
+@app.route('/api/dead-letters/requeue', methods=['POST'])
+def requeue_dead_letters():
+    """Requeue by `ids` and/or error `class`, e.g. every session failure after re-pairing"""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if ids is None and not data.get('class'):
+        return jsonify({"status": "error", "message": "ids or class required"}), 400
+    try:
+        ids = [int(i) for i in ids] if ids is not None else None
+        limit = int(data.get('limit', 1000))
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "ids and limit must be integers"}), 400
+    return requeue_response(entry_ids=ids, error_class=data.get('class'), limit=limit)
+
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    data = bot_instance.get_metrics()
+    data["admission"] = admission.snapshot()
+    data["thumbnails"] = thumbnails.snapshot()
+    if recorder.enabled:
+        data["traffic_recorder"] = recorder.snapshot()
+    if http_server:
+        data["http_workers"] = http_server.snapshot()
+    return jsonify(data)
+
+def graceful_shutdown():
+    """Drain the bot, then stop the HTTP server so serve_forever() returns"""
+    bot_instance.shutdown()
+    if http_server:
+        http_server.shutdown()
+
+def handle_sigterm(signum, frame):
+    if bot_instance.draining:
+        # Second signal: stop waiting for the drain
+        raise SystemExit(1)
+    # serve_forever() runs on this thread, so the drain must happen elsewhere
+    threading.Thread(target=graceful_shutdown, name="shutdown", daemon=True).start()
+
 if __name__ == '__main__':
     print("🚀 Starting WhatsApp API Server...")
     print("📷 Image support: ✅ WORKING")
@@ -592,4 +1409,17 @@ if __name__ == '__main__':
     print("⏳ Waiting for WhatsApp connection...")
     print("📱 Scan QR code with WhatsApp")
     
-    app.run(host='0.0.0.0', port=5000, debug=False, threaded=True)
+    # Fixed worker pool instead of threaded=True's thread-per-request
+    http_server = BoundedWSGIServer(
+        '0.0.0.0', 5000, app,
+        workers=REQUEST_WORKERS,
+        queue_size=REQUEST_QUEUE_SIZE
+    )
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    signal.signal(signal.SIGINT, handle_sigterm)
+    print(f"🌐 Serving on port 5000 with {REQUEST_WORKERS} workers")
+    http_server.serve_forever()
+    # Let handed-over and refused requests get their responses out
+    http_server.wait_idle(timeout=5)
+    print("👋 Shutdown complete")
+    sys.stdout.flush()
@@ -0,0 +1,93 @@
+import copy
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+BATCH_STATUSES = ("running", "completed", "failed", "handed_over")
+
+
+def step_status(result):
+    if result.get("status") == "success":
+        return "sent"
+    if result.get("code") == "handed_over":
+        return "handed_over"
+    return "failed"
+
+
+class SendBatches:
+    """Progress of send chains submitted through /api/send-batch.
+
+    Steps are updated on the bot loop and read from request threads, so
+    every access goes through one condition variable, which also wakes
+    callers waiting for a batch to finish. Only the newest `max_batches`
+    are kept, in memory.
+    """
+
+    def __init__(self, max_batches=10000):
+        self.max_batches = max_batches
+        self._batches = OrderedDict()
+        self._cond = threading.Condition()
+
+    def create(self, steps, stop_on_error):
+        """Register a batch of {"type", "phone"} steps; returns its id"""
+        batch_id = uuid.uuid4().hex[:16]
+        batch = {
+            "id": batch_id,
+            "status": "running",
+            "stop_on_error": stop_on_error,
+            "created_at": time.time(),
+            "finished_at": None,
+            "steps": [dict(step, index=i, status="pending", result=None) for i, step in enumerate(steps)]
+        }
+        with self._cond:
+            self._batches[batch_id] = batch
+            while len(self._batches) > self.max_batches:
+                self._batches.popitem(last=False)
+        return batch_id
+
+    def start_step(self, batch_id, index):
+        with self._cond:
+            self._batches[batch_id]["steps"][index]["status"] = "running"
+
+    def finish_step(self, batch_id, index, result):
+        with self._cond:
+            step = self._batches[batch_id]["steps"][index]
+            step["status"] = step_status(result)
+            step["result"] = {k: result[k] for k in ("status", "code", "message", "attempts") if k in result}
+
+    def skip_rest(self, batch_id, index):
+        """Mark every step after `index` skipped (the chain stopped at a failure)"""
+        with self._cond:
+            for step in self._batches[batch_id]["steps"][index + 1:]:
+                step["status"] = "skipped"
+
+    def finish(self, batch_id):
+        with self._cond:
+            batch = self._batches[batch_id]
+            statuses = {step["status"] for step in batch["steps"]}
+            if statuses & {"failed", "pending", "running"}:
+                batch["status"] = "failed"
+            elif "handed_over" in statuses:
+                batch["status"] = "handed_over"
+            else:
+                batch["status"] = "completed"
+            batch["finished_at"] = time.time()
+            self._cond.notify_all()
+
+    def get(self, batch_id, wait=0):
+        """Copy of a batch, after waiting up to `wait` seconds for it to finish; None if unknown"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: batch_id not in self._batches or self._batches[batch_id]["status"] != "running",
+                timeout=wait
+            )
+            batch = self._batches.get(batch_id)
+            return copy.deepcopy(batch) if batch else None
+
+    def snapshot(self):
+        with self._cond:
+            counts = dict.fromkeys(BATCH_STATUSES, 0)
+            for batch in self._batches.values():
+                counts[batch["status"]] += 1
+        return counts
@@ -0,0 +1,222 @@
+"""In-process stand-in for neonize, so the bot can be benchmarked without WhatsApp.
+
+install() registers fake `neonize` modules before bot.py is imported. The
+fake client connects immediately and models the costs that matter for the
+bot loop:
+
+- send_message: network round trip of SEND_DELAY seconds
+- build_*_message: when given a path, the file is read on the calling loop
+  (as neonize does); hashing and encryption of the payload run on a thread
+  (whatsmeow does them in Go), then the upload takes size / UPLOAD_BANDWIDTH
+  seconds of network time
+
+    import fake_client
+    fake_client.install(send_delay=0.05)
+    from bot import bot_instance
+
+Run as a script it serves the full API (app.py) backed by the fake client,
+from a scratch directory, as a target for benchmarks/replay.py:
+
+    python benchmarks/fake_client.py --port 5055 --send-delay 0.05
+"""
+import argparse
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import types
+
+SEND_DELAY = 0.05
+UPLOAD_BANDWIDTH = 50 * 1024 * 1024  # bytes per second
+
+
+class Proto:
+    """Just enough of the protobuf message API for bot.py"""
+
+    def __init__(self, **fields):
+        self.__dict__["_fields"] = {k: v for k, v in fields.items() if v is not None}
+
+    def __getattr__(self, name):
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return self._fields.get(name, "")
+
+    def __setattr__(self, name, value):
+        self._fields[name] = value
+
+    def HasField(self, name):
+        return name in self._fields
+
+    def CopyFrom(self, other):
+        self._fields.clear()
+        self._fields.update(other._fields)
+
+    def SerializeToString(self):
+        return json.dumps({k: v for k, v in self._fields.items() if isinstance(v, str)}).encode()
+
+    @classmethod
+    def FromString(cls, data):
+        return cls(**json.loads(data))
+
+
+class JID:
+    User = ""
+    Server = ""
+
+
+class SendResponse:
+    def __init__(self):
+        self.ID = f"FAKE{time.time_ns():X}"
+        self.Timestamp = int(time.time())
+
+
+class FakeClient:
+    """NewAClient replacement; see the module docstring for the cost model"""
+
+    def __init__(self, name, *args, **kwargs):
+        self.name = name
+        self.handlers = {}
+        self.sent = 0
+        self.uploaded_bytes = 0
+        self.log = None  # set to a list to record (jid, message) of every send, for tests
+        self._stopped = None
+
+    def event(self, event_type):
+        def register(handler):
+            self.handlers[event_type] = handler
+            return handler
+        return register
+
+    async def connect(self):
+        self._stopped = asyncio.Event()
+        connected = self.handlers.get(events.ConnectedEv)
+        if connected:
+            await connected(self, events.ConnectedEv())
+        await self._stopped.wait()
+
+    async def disconnect(self):
+        if self._stopped:
+            self._stopped.set()
+
+    async def send_message(self, jid, message):
+        await asyncio.sleep(SEND_DELAY)
+        self.sent += 1
+        if self.log is not None:
+            self.log.append((f"{jid.User}@{jid.Server}", message))
+        return SendResponse()
+
+    async def revoke_message(self, chat, sender, message_id):
+        return await self.send_message(chat, pb2.Message(conversation=""))
+
+    async def edit_message(self, chat, message_id, new_message):
+        return await self.send_message(chat, new_message)
+
+    async def build_reply_message(self, message, quoted=None):
+        return pb2.Message(conversation=str(message))
+
+    async def upload(self, data, media_type=None):
+        def hash_and_encrypt():
+            key = os.urandom(32)
+            hashlib.sha256(data).digest()
+            return hmac.new(key, data, hashlib.sha256).digest()
+
+        await asyncio.to_thread(hash_and_encrypt)
+        await asyncio.sleep(len(data) / UPLOAD_BANDWIDTH)
+        self.uploaded_bytes += len(data)
+        return Proto(url="https://mmg.example/fake", FileLength=len(data))
+
+    async def _build(self, field, file, **fields):
+        if isinstance(file, str):
+            with open(file, "rb") as f:  # blocking read on the loop, like neonize
+                file = f.read()
+        upload = await self.upload(file)
+        message_type = getattr(pb2, field[0].upper() + field[1:])
+        return pb2.Message(**{field: message_type(URL=upload.url, fileLength=upload.FileLength, **fields)})
+
+    async def build_image_message(self, file, caption=None, quoted=None, viewonce=False):
+        return await self._build("imageMessage", file, caption=caption)
+
+    async def build_video_message(self, file, caption=None, quoted=None, viewonce=False, gifplayback=False):
+        return await self._build("videoMessage", file, caption=caption)
+
+    async def build_audio_message(self, file, ptt=False, quoted=None):
+        return await self._build("audioMessage", file)
+
+    async def build_document_message(self, file, caption=None, title=None, filename=None, mimetype=None, quoted=None):
+        return await self._build("documentMessage", file, caption=caption, fileName=filename, mimetype=mimetype)
+
+    async def build_sticker_message(self, file, quoted=None, name="", packname="", crop=False, enforce_not_broken=False):
+        return await self._build("stickerMessage", file)
+
+    async def download_any(self, message):
+        await asyncio.sleep(SEND_DELAY)
+        return b""
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    return module
+
+
+pb2 = _module("neonize.proto.waE2E.WAWebProtobufsE2E_pb2", **{
+    name: type(name, (Proto,), {}) for name in (
+        "Message", "ContextInfo", "ExtendedTextMessage", "ImageMessage", "VideoMessage",
+        "AudioMessage", "DocumentMessage", "StickerMessage"
+    )
+})
+events = _module("neonize.events", **{
+    name: type(name, (), {}) for name in ("ConnectedEv", "GroupInfoEv", "JoinedGroupEv", "MessageEv", "PairStatusEv")
+})
+
+
+def install(send_delay=SEND_DELAY, upload_bandwidth=UPLOAD_BANDWIDTH):
+    """Register the fake neonize modules; call before importing bot or app"""
+    global SEND_DELAY, UPLOAD_BANDWIDTH
+    SEND_DELAY = send_delay
+    UPLOAD_BANDWIDTH = upload_bandwidth
+    modules = [
+        _module("neonize"), _module("neonize.aioze"), _module("neonize.proto"), _module("neonize.proto.waE2E"),
+        _module("neonize.utils"), _module("neonize.aioze.client", NewAClient=FakeClient),
+        _module("neonize.utils.jid", JID=JID), events, pb2
+    ]
+    sys.modules.update({module.__name__: module for module in modules})
+
+
+def serve(port, send_delay=SEND_DELAY, upload_bandwidth=UPLOAD_BANDWIDTH):
+    """Run app.py's server on `port` against the fake client until SIGTERM/SIGINT"""
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    workdir = tempfile.mkdtemp(prefix="fake-wa-")
+    os.chdir(workdir)  # app and bot keep uploads/ and data/ relative to the working directory
+    install(send_delay, upload_bandwidth)
+    import app
+    from admission import BoundedWSGIServer
+
+    try:
+        app.bot_instance.start()
+        app.http_server = BoundedWSGIServer(
+            "127.0.0.1", port, app.app, workers=app.REQUEST_WORKERS, queue_size=app.REQUEST_QUEUE_SIZE
+        )
+        signal.signal(signal.SIGTERM, app.handle_sigterm)
+        signal.signal(signal.SIGINT, app.handle_sigterm)
+        print(f"🧪 Fake WhatsApp API on port {port} (data in {workdir})")
+        sys.stdout.flush()
+        app.http_server.serve_forever()
+        app.http_server.wait_idle(timeout=5)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the API backed by the fake WhatsApp client")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--send-delay", type=float, default=SEND_DELAY, help="fake network round trip per send")
+    parser.add_argument("--upload-mbps", type=float, default=UPLOAD_BANDWIDTH / (1024 * 1024), help="fake upload bandwidth, MB/s")
+    args = parser.parse_args()
+    serve(args.port, args.send_delay, args.upload_mbps * 1024 * 1024)
@@ -0,0 +1,118 @@
+"""Text-send latency while large videos upload, with media prep on the loop vs the pool.
+
+Runs the real bot against the fake neonize client (fake_client.py) in a
+scratch directory. A few threads upload large videos back to back while
+another sends short texts and records their latency; this is done once
+with files read on the bot loop (neonize's own behaviour) and once with
+the media-prep pool.
+
+    python benchmarks/media_send_latency.py --video-mb 64 --uploaders 3 --seconds 20
+"""
+import argparse
+import contextlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import fake_client  # noqa: E402
+
+
+class LoopPreparer:
+    """The old path: builders get the file path and read it on the loop"""
+
+    async def prepare(self, filepath):
+        return {"data": filepath, "size": os.path.getsize(filepath)}
+
+    def snapshot(self):
+        return {}
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def run(bot, video, uploaders, seconds, text_interval):
+    stop = threading.Event()
+    uploads = []
+    latencies = []
+
+    def upload():
+        while not stop.is_set():
+            result = bot.send_video("6281234567890", video, priority="bulk")
+            uploads.append(result["status"])
+
+    threads = [threading.Thread(target=upload, daemon=True) for _ in range(uploaders)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.5)  # let the first uploads start
+    ends = time.monotonic() + seconds
+    while time.monotonic() < ends:
+        started = time.perf_counter()
+        result = bot.send_message("6281234567891", "ping", link_preview=False, priority="transactional")
+        if result["status"] == "success":
+            latencies.append((time.perf_counter() - started) * 1000)
+        time.sleep(text_interval)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "text_sends": len(latencies),
+        "text_p50_ms": statistics.median(latencies) if latencies else 0,
+        "text_p95_ms": percentile(latencies, 95) if latencies else 0,
+        "text_p99_ms": percentile(latencies, 99) if latencies else 0,
+        "text_max_ms": max(latencies, default=0),
+        "videos_sent": uploads.count("success")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--video-mb", type=int, default=64)
+    parser.add_argument("--uploaders", type=int, default=3)
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--text-interval", type=float, default=0.05)
+    parser.add_argument("--send-delay", type=float, default=0.05, help="fake network round trip per send")
+    parser.add_argument("--upload-mbps", type=float, default=400, help="fake upload bandwidth, MB/s")
+    args = parser.parse_args()
+
+    # The bot keeps its stores under ./data, so run it in a scratch directory
+    workdir = tempfile.mkdtemp(prefix="media-bench-")
+    video = os.path.join(workdir, "video.mp4")
+    with open(video, "wb") as f:
+        for _ in range(args.video_mb):
+            f.write(os.urandom(1024 * 1024))
+    os.chdir(workdir)
+    fake_client.install(send_delay=args.send_delay, upload_bandwidth=args.upload_mbps * 1024 * 1024)
+    from bot import bot_instance
+
+    print(f"🔧 {args.uploaders} uploaders of {args.video_mb} MB videos for {args.seconds:.0f}s per run...")
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # the bot logs every send
+            bot_instance.start()
+            while not bot_instance.is_connected:
+                time.sleep(0.05)
+            pool = bot_instance.media_prep
+            bot_instance.media_prep = LoopPreparer()
+            before = run(bot_instance, video, args.uploaders, args.seconds, args.text_interval)
+            bot_instance.media_prep = pool
+            after = run(bot_instance, video, args.uploaders, args.seconds, args.text_interval)
+            bot_instance.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"{'metric':<14}{'on loop':>12}{'prep pool':>12}")
+    for key in before:
+        print(f"{key:<14}{before[key]:>12.1f}{after[key]:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Replay a recorded traffic shape against the API and report latency and throughput.
+
+Plays a WA_TRAFFIC_RECORD file (see recorder.py) at its recorded pace, a
+multiple of it, or as fast as possible. Recipients, texts and files are
+synthetic and size-matched. By default the target is a server backed by the
+fake WhatsApp client (fake_client.py) started from this tree, so two builds
+can be compared by replaying the same recording on each:
+
+    python benchmarks/replay.py data/traffic.ndjson --speed 10 --out before.json
+    git checkout my-branch
+    python benchmarks/replay.py data/traffic.ndjson --speed 10 --out after.json
+    python benchmarks/replay.py --compare before.json after.json
+
+Use --url to replay against an already running server instead. Only sends
+and parameterless GET endpoints are replayed; campaigns, admin actions and
+endpoints with path parameters are skipped and counted.
+"""
+import argparse
+import concurrent.futures
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from urllib.parse import urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPLAYED_POSTS = {
+    "/api/send-message", "/api/send-image", "/api/send-document",
+    "/api/send-audio", "/api/send-video", "/api/send-sticker"
+}
+RANDOM_BLOCK = os.urandom(1024 * 1024)
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor".split()
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def load_recording(path):
+    records = []
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+def replayable(record):
+    endpoint = record.get("endpoint")
+    if not endpoint or "<" in endpoint:
+        return False
+    if record["method"] == "GET":
+        return True
+    return record["method"] == "POST" and endpoint in REPLAYED_POSTS
+
+
+def synthetic_text(length):
+    words = []
+    while sum(len(w) + 1 for w in words) < length:
+        words.append(WORDS[len(words) % len(WORDS)])
+    return " ".join(words)[:length] or "x"
+
+
+def synthetic_bytes(size):
+    return (RANDOM_BLOCK * (size // len(RANDOM_BLOCK) + 1))[:size]
+
+
+class Recipients:
+    """Maps recording pseudonyms to synthetic phone numbers and group JIDs"""
+
+    def __init__(self):
+        self._map = {}
+        self._lock = threading.Lock()
+
+    def get(self, record):
+        key = (record.get("recipient_type"), record.get("recipient"))
+        with self._lock:
+            if key not in self._map:
+                n = len(self._map)
+                self._map[key] = f"120363{n:012d}@g.us" if key[0] == "group" else f"62812{n:08d}"
+            return self._map[key]
+
+
+def build_request(record, recipients):
+    """(method, path, body, headers) for a recorded request"""
+    headers = {}
+    if record.get("priority"):
+        headers["X-Priority"] = record["priority"]
+    if record.get("timeout"):
+        headers["X-Request-Timeout"] = str(max(record["timeout"], 0.1))
+    if record["method"] == "GET":
+        return "GET", record["endpoint"], None, headers
+
+    fields = {"phone": recipients.get(record)}
+    text = synthetic_text(record.get("text_length", 20))
+    if record["endpoint"] == "/api/send-message":
+        fields.update(message=text, mention_all=bool(record.get("mention_all")), link_preview=False)
+        headers["Content-Type"] = "application/json"
+        return "POST", record["endpoint"], json.dumps(fields).encode(), headers
+
+    if record.get("text_length"):
+        fields["caption"] = text
+    upload = record.get("file") or {}
+    boundary = uuid.uuid4().hex
+    parts = [
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in fields.items()
+    ]
+    parts.append(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="replay.{upload.get("ext") or "bin"}"\r\n'
+        f'Content-Type: {upload.get("mimetype") or "application/octet-stream"}\r\n\r\n'.encode()
+    )
+    parts.append(synthetic_bytes(upload.get("bytes", 1024)))
+    parts.append(f"\r\n--{boundary}--\r\n".encode())
+    headers["Content-Type"] = f"multipart/form-data; boundary={boundary}"
+    return "POST", record["endpoint"], b"".join(parts), headers
+
+
+class Client:
+    """One keep-alive connection per worker thread"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body, headers):
+        for attempt in range(2):
+            conn = getattr(self._local, "conn", None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=300)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    conn.close()
+                    self._local.conn = None
+                return response.status
+            except (http.client.HTTPException, ConnectionError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+
+def replay(records, url, speed, concurrency):
+    client = Client(url)
+    recipients = Recipients()
+    results = []
+    lock = threading.Lock()
+
+    def run(record, scheduled):
+        method, path, body, headers = build_request(record, recipients)
+        started = time.perf_counter()
+        try:
+            status = client.request(method, path, body, headers)
+        except Exception:
+            status = "error"
+        ended = time.perf_counter()
+        with lock:
+            results.append({
+                "endpoint": f"{method} {path}",
+                "status": status,
+                "latency_ms": (ended - started) * 1000,
+                "lag_ms": (started - scheduled) * 1000
+            })
+
+    first = records[0]["ts"]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        started = time.perf_counter()
+        for record in records:
+            scheduled = started
+            if speed:
+                scheduled = started + (record["ts"] - first) / speed
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            pool.submit(run, record, scheduled)
+    elapsed = time.perf_counter() - started
+    return summarize(results, elapsed, speed)
+
+
+def summarize(results, elapsed, speed):
+    def latency(samples):
+        return {
+            "count": len(samples),
+            "p50_ms": round(statistics.median(samples), 1),
+            "p95_ms": round(percentile(samples, 95), 1),
+            "p99_ms": round(percentile(samples, 99), 1),
+            "max_ms": round(max(samples), 1)
+        }
+
+    statuses = {}
+    by_endpoint = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+        by_endpoint.setdefault(result["endpoint"], []).append(result["latency_ms"])
+    ok = sum(n for status, n in statuses.items() if status.startswith("2"))
+    return {
+        "speed": speed or "max",
+        "requests": len(results),
+        "elapsed_s": round(elapsed, 2),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0,
+        "ok_rps": round(ok / elapsed, 2) if elapsed else 0,
+        "statuses": statuses,
+        "dispatch_lag_p99_ms": round(percentile([r["lag_ms"] for r in results], 99), 1) if results else 0,
+        "latency": latency([r["latency_ms"] for r in results]) if results else {},
+        "endpoints": {endpoint: latency(samples) for endpoint, samples in sorted(by_endpoint.items())}
+    }
+
+
+def print_summary(summary, recorded=None):
+    print(f"⏱️ {summary['requests']} requests in {summary['elapsed_s']}s at speed {summary['speed']}: "
+          f"{summary['throughput_rps']} req/s ({summary['ok_rps']} 2xx/s), statuses {summary['statuses']}")
+    if summary["dispatch_lag_p99_ms"] > 100 and summary["speed"] != "max":
+        print(f"⚠️ p99 dispatch lag {summary['dispatch_lag_p99_ms']}ms - raise --concurrency, the replay fell behind")
+    print(f"{'endpoint':<28}{'count':>7}{'p50_ms':>10}{'p95_ms':>10}{'p99_ms':>10}{'max_ms':>10}"
+          + (f"{'rec_p50':>10}" if recorded else ""))
+    for endpoint, stats in summary["endpoints"].items():
+        line = f"{endpoint:<28}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}"
+        if recorded:
+            line += f"{recorded.get(endpoint, ''):>10}"
+        print(line)
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    def delta(a, b):
+        return f"{(b - a) / a * 100:+.1f}%" if a else "n/a"
+
+    print(f"{'metric':<44}{'before':>10}{'after':>10}{'change':>10}")
+    rows = [("throughput_rps", before["throughput_rps"], after["throughput_rps"])]
+    for key in ("p50_ms", "p95_ms", "p99_ms"):
+        rows.append((f"all {key}", before["latency"].get(key, 0), after["latency"].get(key, 0)))
+    for endpoint in sorted(set(before["endpoints"]) & set(after["endpoints"])):
+        for key in ("p50_ms", "p99_ms"):
+            rows.append((f"{endpoint} {key}", before["endpoints"][endpoint][key], after["endpoints"][endpoint][key]))
+    for name, a, b in rows:
+        print(f"{name:<44}{a:>10}{b:>10}{delta(a, b):>10}")
+
+
+def start_fake_server(port, send_delay, upload_mbps):
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(BENCH_DIR, "fake_client.py"), "--port", str(port),
+         "--send-delay", str(send_delay), "--upload-mbps", str(upload_mbps)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    client = Client(f"http://127.0.0.1:{port}")
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(client.host, client.port, timeout=2)
+            conn.request("GET", "/api/status")
+            if json.loads(conn.getresponse().read()).get("bot_connected"):
+                conn.close()
+                return process
+        except (OSError, ValueError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"Fake server did not come up; try running benchmarks/fake_client.py --port {port} directly")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("recording", nargs="?", help="NDJSON file written with WA_TRAFFIC_RECORD")
+    parser.add_argument("--speed", default="1", help="1, 10, ... times the recorded pace, or max")
+    parser.add_argument("--concurrency", type=int, default=64, help="client threads (open loop unless saturated)")
+    parser.add_argument("--url", help="replay against this server instead of a fake-client one")
+    parser.add_argument("--port", type=int, default=5055, help="port for the fake-client server")
+    parser.add_argument("--send-delay", type=float, default=0.05, help="fake network round trip per send")
+    parser.add_argument("--upload-mbps", type=float, default=50, help="fake upload bandwidth, MB/s")
+    parser.add_argument("--limit", type=int, help="replay only the first N requests")
+    parser.add_argument("--out", help="write the summary as JSON, for --compare")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two --out summaries")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    if not args.recording:
+        parser.error("a recording is required unless --compare is given")
+
+    records = load_recording(args.recording)
+    replayed = [r for r in records if replayable(r)][:args.limit]
+    if not replayed:
+        print("❌ Nothing replayable in the recording")
+        return
+    recorded = {}
+    for record in replayed:
+        recorded.setdefault(f"{record['method']} {record['endpoint']}", []).append(record["duration_ms"])
+    recorded = {endpoint: round(statistics.median(samples), 1) for endpoint, samples in recorded.items()}
+    speed = None if args.speed == "max" else float(args.speed)
+    span = replayed[-1]["ts"] - replayed[0]["ts"]
+    print(f"🎬 Replaying {len(replayed)} of {len(records)} requests "
+          f"({len(records) - len(replayed)} skipped), recorded over {span:.0f}s")
+
+    process = None
+    url = args.url
+    if not url:
+        process = start_fake_server(args.port, args.send_delay, args.upload_mbps)
+        url = f"http://127.0.0.1:{args.port}"
+    try:
+        summary = replay(replayed, url, speed, args.concurrency)
+    finally:
+        if process:
+            process.terminate()
+            process.wait(timeout=60)
+
+    summary["recorded_p50_ms"] = recorded
+    print_summary(summary, recorded)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"💾 Summary written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
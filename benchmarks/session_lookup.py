@@ -0,0 +1,130 @@
+"""Session-store latency before/after the performance mode.
+
+Builds a whatsmeow-shaped SQLite store (or copies an existing one with --db),
+churns it to fragment the file, then measures cold start, session lookups and
+session updates with the default settings and again after prepare_session_db()
+applies the performance mode, exactly as the bot does on startup. Both runs use
+plain connections, like neonize's own.
+
+    python benchmarks/session_lookup.py --sessions 50000 --lookups 20000
+    python benchmarks/session_lookup.py --db data/db.sqlite3
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from session_store import prepare_session_db  # noqa: E402
+
+OUR_JID = "6281234567890.0:1@s.whatsapp.net"
+
+
+def build_store(path, sessions):
+    conn = sqlite3.connect(path)
+    conn.execute("""CREATE TABLE whatsmeow_sessions (
+        our_jid TEXT, their_id TEXT, session BLOB, PRIMARY KEY (our_jid, their_id))""")
+    conn.execute("""CREATE TABLE whatsmeow_pre_keys (
+        jid TEXT, key_id INTEGER, key BLOB, uploaded BOOLEAN, PRIMARY KEY (jid, key_id))""")
+    rows = ((OUR_JID, f"62{8100000000 + i}.0", os.urandom(random.randint(600, 1400))) for i in range(sessions))
+    conn.executemany("INSERT INTO whatsmeow_sessions VALUES (?, ?, ?)", rows)
+    # Pre-key upload/consume churn is what fragments real stores
+    for batch in range(20):
+        conn.executemany(
+            "INSERT INTO whatsmeow_pre_keys VALUES (?, ?, ?, true)",
+            ((OUR_JID, batch * 1000 + i, os.urandom(32)) for i in range(1000))
+        )
+        conn.execute("DELETE FROM whatsmeow_pre_keys WHERE key_id % 3 = 0")
+    conn.commit()
+    conn.close()
+
+
+def their_ids(path, limit):
+    conn = sqlite3.connect(path)
+    ids = [row[0] for row in conn.execute("SELECT their_id FROM whatsmeow_sessions LIMIT ?", (limit,))]
+    conn.close()
+    return ids
+
+
+def percentile(samples, pct):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def measure(path, ids, lookups, updates):
+    started = time.perf_counter()
+    conn = sqlite3.connect(path)
+    # Cold start: load the first 1000 sessions the way a reconnect does
+    for their_id in ids[:1000]:
+        conn.execute("SELECT session FROM whatsmeow_sessions WHERE our_jid = ? AND their_id = ?",
+                     (OUR_JID, their_id)).fetchone()
+    startup = time.perf_counter() - started
+
+    lookup_times = []
+    for _ in range(lookups):
+        their_id = random.choice(ids)
+        t = time.perf_counter()
+        conn.execute("SELECT session FROM whatsmeow_sessions WHERE our_jid = ? AND their_id = ?",
+                     (OUR_JID, their_id)).fetchone()
+        lookup_times.append(time.perf_counter() - t)
+
+    update_times = []
+    for _ in range(updates):
+        their_id = random.choice(ids)
+        t = time.perf_counter()
+        with conn:
+            conn.execute("UPDATE whatsmeow_sessions SET session = ? WHERE our_jid = ? AND their_id = ?",
+                         (os.urandom(900), OUR_JID, their_id))
+        update_times.append(time.perf_counter() - t)
+    conn.close()
+
+    to_us = 1e6
+    return {
+        "startup_ms": startup * 1000,
+        "lookup_p50_us": statistics.median(lookup_times) * to_us,
+        "lookup_p99_us": percentile(lookup_times, 99) * to_us,
+        "update_p50_us": statistics.median(update_times) * to_us,
+        "update_p99_us": percentile(update_times, 99) * to_us,
+        "file_mb": os.path.getsize(path) / (1024 * 1024)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", help="existing session store to copy (default: synthetic)")
+    parser.add_argument("--sessions", type=int, default=50000)
+    parser.add_argument("--lookups", type=int, default=20000)
+    parser.add_argument("--updates", type=int, default=500)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="session-bench-")
+    try:
+        path = os.path.join(workdir, "db.sqlite3")
+        if args.db:
+            shutil.copyfile(args.db, path)
+        else:
+            print(f"🔧 Building synthetic store with {args.sessions} sessions...")
+            build_store(path, args.sessions)
+        ids = their_ids(path, args.sessions)
+        if not ids:
+            print("❌ No sessions in store")
+            return
+
+        before = measure(path, ids, args.lookups, args.updates)
+        prepare_session_db(path, "performance")
+        after = measure(path, ids, args.lookups, args.updates)
+
+        print(f"{'metric':<16}{'before':>12}{'after':>12}")
+        for key in before:
+            print(f"{key:<16}{before[key]:>12.1f}{after[key]:>12.1f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
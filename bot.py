@@ -1,24 +1,302 @@
 import asyncio
+import base64
+import concurrent.futures
+import contextvars
+import functools
 import threading
 import logging
 import os
 import mimetypes
+from contextlib import asynccontextmanager
 from neonize.aioze.client import NewAClient
-from neonize.events import ConnectedEv, MessageEv, PairStatusEv
+from neonize.events import ConnectedEv, GroupInfoEv, JoinedGroupEv, MessageEv, PairStatusEv
 import time
+from limiter import AIMDLimiter, CircuitBreaker
+from scheduler import DEFAULT_LANE, ChatLanes, PriorityScheduler, ShuttingDown
+from groups import GROUP_SERVER, GroupCache, jid_to_str, normalize_group_jid
+from campaigns import CampaignManager
+from session_store import SESSION_DB, SESSION_DB_MODE, is_postgres, prepare_session_db
+from media_store import MediaStore
+from message_store import MessageStore
+from media_downloader import MediaDownloader, media_field
+from media_prep import MediaPreparer
+from handlers import inbound_handlers
+from linkpreview import PREVIEW_WAIT, LinkPreviewer
+from handover import HandoverStore
+from dead_letters import DeadLetterStore
+from batches import SendBatches
+from errors import (
+    FAILURE_CLASSES, PERMANENT_MEDIA, PERMANENT_RECIPIENT, SESSION, DeliveryUnknown, backoff_delay, classify,
+    delivery_unknown, send_error
+)
+from tracing import tracer
+from estimators import SendClock, SendDeadlines
+from rules import RulesEngine
+from bulk_actions import BulkActions
+
+# send_*_async method per step type of a send batch
+BATCH_METHODS = {
+    "text": "send_message_async",
+    "image": "send_image_async",
+    "document": "send_document_async",
+    "audio": "send_audio_async",
+    "video": "send_video_async",
+    "sticker": "send_sticker_async"
+}
+# Comma-separated modules that register inbound handlers with @inbound_handlers.handler()
+HANDLER_PLUGINS = os.environ.get("WA_HANDLER_PLUGINS", "").split(",")
+DEADLINE_GRACE = 0.5  # Extra wait for the loop-side cancellation to report back
+CANCEL_GRACE = 1.0    # How long a timed-out caller waits for the task to unwind
+# Total drain budget on SIGTERM; keep below the orchestrator's kill grace period (30s default)
+SHUTDOWN_TIMEOUT = float(os.environ.get("WA_SHUTDOWN_TIMEOUT", "25"))
+SEND_ATTEMPTS = 4        # first try plus retries, for transient and rate-limited failures only
+RETRY_BASE_DELAY = 0.5   # seconds; doubles per retry, full jitter
+RETRY_MAX_DELAY = 8.0
+# Threads reading outbound media files; files are read only once their upload slot is free
+MEDIA_PREP_WORKERS = int(os.environ.get("WA_MEDIA_PREP_WORKERS", "2"))
+
+# Tag recorded with each outbound message of the current send (e.g. "campaign:<id>"), for bulk revoke/edit
+SEND_TAG = contextvars.ContextVar("send_tag", default=None)
+# SendClock of the send running in this task, paused while the send queues
+SEND_CLOCK = contextvars.ContextVar("send_clock", default=None)
+# Priority lane of the send running in this task, so limiter waits keep transactional sends first
+SEND_LANE = contextvars.ContextVar("send_lane", default=DEFAULT_LANE)
+
+def timeout_result(label):
+    return {"status": "error", "code": "timeout", "message": f"{label} sending timeout"}
+
+def shutting_down_result():
+    return {"status": "error", "code": "shutting_down", "message": "Server shutting down, retry later"}
+
+def deadline_aware(label):
+    """Bound a send_*_async coroutine by the client deadline and its adaptive SendClock.
+    
+    `deadline` is the caller's absolute deadline (time.time() based) and is
+    never extended. `clock` is our own timeout for the send type; it is
+    paused while the send queues, and a send that runs into it feeds its
+    service time back to the estimates. On expiry the coroutine is
+    cancelled at its current await, so uploads stop instead of running on
+    after the caller has given up.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, deadline=None, clock=None, **kwargs):
+            if deadline is None and clock is None:
+                return await func(self, *args, **kwargs)
+            token = SEND_CLOCK.set(clock)
+            try:
+                task = asyncio.ensure_future(func(self, *args, **kwargs))
+            finally:
+                SEND_CLOCK.reset(token)
+            try:
+                while True:
+                    remaining = send_remaining(deadline, clock)
+                    if remaining <= 0:
+                        break
+                    done, _ = await asyncio.wait({task}, timeout=remaining)
+                    if done:
+                        return task.result()
+            except asyncio.CancelledError:
+                task.cancel()
+                raise
+            task.cancel()
+            try:
+                return await task  # finished just as it expired
+            except asyncio.CancelledError:
+                pass
+            self._count("timed_out")
+            self._count("cancelled")
+            print(f"⏱️ {label} cancelled at deadline")
+            # Only our own clock says something about how long this type of send takes
+            if clock is not None and (deadline is None or time.time() < deadline):
+                self.deadlines.record_timeout(clock.kind, clock.service_time(), clock.nbytes)
+            return timeout_result(label)
+        return wrapper
+    return decorator
+
+def send_remaining(deadline, clock):
+    """Seconds until the client deadline or the send's clock, whichever is first"""
+    remaining = []
+    if deadline is not None:
+        remaining.append(deadline - time.time())
+    if clock is not None:
+        remaining.append(clock.expires - time.monotonic())
+    return min(remaining)
+
+@asynccontextmanager
+async def off_the_clock(slot):
+    """Enter a queue's slot (an async context manager) with the running send's clock paused while waiting"""
+    clock = SEND_CLOCK.get()
+    if clock is not None:
+        clock.pause()
+    try:
+        async with slot:
+            if clock is not None:
+                clock.resume()
+            yield
+    finally:
+        if clock is not None:
+            clock.resume()
+
+def circuit_open_result():
+    return {"status": "error", "code": "circuit_open", "message": "WhatsApp temporarily unavailable, retry later"}
+
+def tagged(func):
+    """Record the `tag` kwarg of a send_*_async call with the messages it sends"""
+    @functools.wraps(func)
+    async def wrapper(self, *args, tag=None, **kwargs):
+        token = SEND_TAG.set(tag)
+        try:
+            return await func(self, *args, **kwargs)
+        finally:
+            SEND_TAG.reset(token)
+    return wrapper
+
+def circuit_guarded(func):
+    """Fast-fail a send_*_async call while the circuit breaker is open"""
+    @functools.wraps(func)
+    async def wrapper(self, *args, **kwargs):
+        if not self.breaker.allow():
+            return circuit_open_result()
+        return await func(self, *args, **kwargs)
+    return wrapper
+
+def preview_prefetched(func):
+    """Fetch a text send's link preview once it holds its chat turn, before it queues for a priority slot.
+    
+    Sits inside `chat_ordered`, so waiting for a preview never lets a later
+    message to the chat overtake this one. Waits at most PREVIEW_WAIT
+    seconds; the send itself only uses a preview that is already cached, so
+    a slow page goes out without one instead of holding up the chat.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, phone, message, mention_all=False, link_preview=True, **kwargs):
+        if link_preview:
+            await self.previews.prefetch(str(message), PREVIEW_WAIT)
+        return await func(self, phone, message, mention_all=mention_all, link_preview=link_preview, **kwargs)
+    return wrapper
+
+def chat_ordered(func):
+    """Run send_*_async calls to the same chat one at a time, in arrival order.
+    
+    Sits outside `retrying`, so a message backing off between attempts still
+    holds its chat and cannot be overtaken by the next one.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, phone, *args, **kwargs):
+        async with off_the_clock(self.chat_lanes.turn(self.chat_key(phone))):
+            return await func(self, phone, *args, **kwargs)
+    return wrapper
+
+def retrying(func):
+    """Retry a send_*_async call on transient and rate-limited failures with capped jittered backoff.
+    
+    Failures that remain (permanent classes, or retries used up) go to the
+    dead-letter store unless the call passes dead_letter=False. The slot in
+    the priority lane is given up while backing off.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, dead_letter=True, **kwargs):
+        for attempt in range(1, SEND_ATTEMPTS + 1):
+            result = await func(self, *args, **kwargs)
+            if result["status"] != "error" or not result.get("retryable") or attempt == SEND_ATTEMPTS:
+                break
+            self._count("retried")
+            await asyncio.sleep(backoff_delay(attempt - 1, result["code"], RETRY_BASE_DELAY, RETRY_MAX_DELAY))
+            if not self.breaker.allow():
+                return circuit_open_result()
+        result["attempts"] = attempt
+        if dead_letter and result["status"] == "error" and result.get("code") in FAILURE_CLASSES:
+            send_kwargs = {k: v for k, v in kwargs.items() if k not in ("priority", "handover")}
+            result["dead_letter_id"] = await asyncio.to_thread(
+                self.dead_letters.add, func, args, send_kwargs, kwargs.get("priority", DEFAULT_LANE), result, attempt,
+                SEND_TAG.get()
+            )
+            self._count("dead_lettered")
+        return result
+    return wrapper
+
+def prioritized(func):
+    """Queue a send_*_async call in its priority lane (`priority` kwarg) before it runs.
+    
+    If shutdown closes the scheduler first, a call made with handover=True is
+    persisted for the next process; any other caller gets `shutting_down`.
+    """
+    @functools.wraps(func)
+    async def wrapper(self, *args, priority=DEFAULT_LANE, handover=False, **kwargs):
+        queue_span = tracer.start_span("priority_queue", {"priority": priority})
+        try:
+            async with off_the_clock(self.scheduler.slot(priority)):
+                queue_span.end()
+                lane = SEND_LANE.set(priority)
+                try:
+                    return await func(self, *args, **kwargs)
+                finally:
+                    SEND_LANE.reset(lane)
+        except ShuttingDown:
+            if queue_span.end_ns is None:
+                queue_span.set_error("shutting down")
+            if handover:
+                # Copies the upload aside; off the loop, which is still serving the drain
+                return await asyncio.to_thread(self.handover.add_send, func, args, kwargs, priority, SEND_TAG.get())
+            return shutting_down_result()
+        except asyncio.CancelledError:
+            if queue_span.end_ns is None:
+                queue_span.set_error("cancelled")
+            raise
+        finally:
+            queue_span.end()
+    return wrapper
+
+def payload_size(filepath):
+    """Size of a send's file in bytes (0 for text or a missing file)"""
+    try:
+        return os.path.getsize(filepath) if filepath else 0
+    except OSError:
+        return 0
 
 class WhatsAppBot:
     def __init__(self):
         os.makedirs("data", exist_ok=True)
-        self.client = NewAClient("data/db.sqlite3")
+        self.client = NewAClient(prepare_session_db(SESSION_DB, SESSION_DB_MODE))
         self.is_connected = False
+        self.draining = False
         self.loop = None
         self.thread = None
         self.logger = logging.getLogger(__name__)
-        print("📁 Database: data/db.sqlite3")
+        self.stats = {
+            "timed_out": 0, "cancelled": 0, "abandoned": 0, "abandoned_running": 0,
+            "retried": 0, "dead_lettered": 0
+        }
+        self._stats_lock = threading.Lock()
+        self.send_limiter = AIMDLimiter("send", initial=8, max_limit=64)
+        self.upload_limiter = AIMDLimiter("upload", initial=4, max_limit=16, tolerance=3.0)
+        self.breaker = CircuitBreaker(failure_threshold=5, reset_timeout=30.0)
+        self.scheduler = PriorityScheduler(max_concurrency=16, reserved=4)
+        self.chat_lanes = ChatLanes()
+        self.deadlines = SendDeadlines()
+        self.batches = SendBatches()
+        self.rules = RulesEngine(self)
+        self.bulk = BulkActions(self)
+        self.groups = GroupCache(self.client, ttl=300)
+        self.campaigns = CampaignManager(self)
+        self.media = MediaStore()
+        self.messages = MessageStore()
+        self.downloader = MediaDownloader(self.client, self.media, self.messages, workers=4, queue_size=1000)
+        self.previews = LinkPreviewer(ttl=3600, max_entries=1000)
+        self.media_prep = MediaPreparer(workers=MEDIA_PREP_WORKERS)
+        self.handover = HandoverStore()
+        self.dead_letters = DeadLetterStore()
+        self.restart = {"previous_shutdown": None, "resumed_sends": 0, "resumed_downloads": 0}
+        if not is_postgres(SESSION_DB):
+            print(f"📁 Database: {SESSION_DB}")
         
     def start(self):
         """Start bot in background thread"""
+        inbound_handlers.load_plugins(HANDLER_PLUGINS)
+        if self.rules.enabled:
+            inbound_handlers.register(self.rules.handle, name="rules")
+        inbound_handlers.start()
         self.thread = threading.Thread(target=self._run_bot)
         self.thread.daemon = True
         self.thread.start()
@@ -34,11 +312,21 @@ class WhatsAppBot:
             self.is_connected = True
             print("✅ WhatsApp Bot Connected Successfully!")
             print("🤖 Bot siap menerima dan mengirim pesan!")
+            self._resume_handover()
+            self.campaigns.resume_all()
             
         @self.client.event(PairStatusEv)
         async def on_pair_status(client, event):
             print(f"📱 Login sebagai: {event.ID.User}")
             
+        @self.client.event(GroupInfoEv)
+        async def on_group_info(client, event):
+            self.groups.apply_event(event)
+            
+        @self.client.event(JoinedGroupEv)
+        async def on_joined_group(client, event):
+            self.groups.joined(event.GroupInfo)
+            
         @self.client.event(MessageEv)
         async def on_message(client, message):
             try:
@@ -53,8 +341,30 @@ class WhatsAppBot:
                     if hasattr(message.Message.extendedTextMessage, 'text'):
                         text = message.Message.extendedTextMessage.text
                 
+                field, media_type = media_field(message.Message)
+                if field:
+                    media = getattr(message.Message, field)
+                    text = text or getattr(media, 'caption', '')
+                
                 if text:
                     print(f"📨 Pesan masuk dari {chat}: {text}")
+                
+                if text or field:
+                    record = {
+                        "chat": jid_to_str(chat),
+                        "id": message.Info.ID,
+                        "sender": jid_to_str(message.Info.MessageSource.Sender),
+                        "from_me": 0,
+                        "type": media_type or "text",
+                        "text": text,
+                        "timestamp": message.Info.Timestamp or time.time()
+                    }
+                    self.messages.record(record)
+                    # Handlers run on their own per-chat ordered threads, never on this loop
+                    inbound_handlers.dispatch(dict(record, raw=message))
+                    if field:
+                        print(f"📎 {media_type} masuk dari {chat}, queued for download")
+                        self.downloader.submit(record["chat"], record["id"], message.Message, media.mimetype)
                     
             except Exception as e:
                 print(f"❌ Error handling message: {e}")
@@ -74,14 +384,18 @@ class WhatsAppBot:
         try:
             from neonize.utils.jid import JID
             
-            # Format phone number
+            # Format phone number; bare group IDs go to the group server
             if "@" not in phone_number:
-                clean_phone = ''.join(filter(str.isdigit, phone_number))
-                if clean_phone.startswith('0'):
-                    clean_phone = '62' + clean_phone[1:]
-                elif not clean_phone.startswith('62'):
-                    clean_phone = '62' + clean_phone
-                phone_number = f"{clean_phone}@s.whatsapp.net"
+                group_jid = normalize_group_jid(phone_number)
+                if group_jid:
+                    phone_number = group_jid
+                else:
+                    clean_phone = ''.join(filter(str.isdigit, phone_number))
+                    if clean_phone.startswith('0'):
+                        clean_phone = '62' + clean_phone[1:]
+                    elif not clean_phone.startswith('62'):
+                        clean_phone = '62' + clean_phone
+                    phone_number = f"{clean_phone}@s.whatsapp.net"
             
             # Parse JID string
             parts = phone_number.split('@')
@@ -106,18 +420,129 @@ class WhatsAppBot:
             print(f"❌ Error creating JID: {e}")
             return None
             
-    async def send_message_async(self, phone, message):
+    def chat_key(self, phone):
+        """Normalized chat JID string used to order sends per chat"""
+        jid = self.create_jid(phone)
+        return jid_to_str(jid) if jid else phone
+    
+    async def _limited(self, limiter, func, *args, latency_scale=None, **kwargs):
+        """Call a neonize coroutine under a concurrency limiter, feeding the circuit breaker.
+        
+        Transactional sends wait for the limiter ahead of normal and bulk ones.
+        """
+        async with off_the_clock(limiter.slot(latency_scale, 0 if SEND_LANE.get() == "transactional" else 1)):
+            try:
+                result = await func(*args, **kwargs)
+            except asyncio.CancelledError:
+                # Cancelled by the caller's deadline: neither a success nor a failure for the breaker
+                raise
+            except Exception as e:
+                # A rejected recipient or file is still a healthy WhatsApp answer
+                if classify(e) in (PERMANENT_RECIPIENT, PERMANENT_MEDIA):
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+                raise
+        self.breaker.record_success()
+        return result
+    
+    async def _send(self, jid, message):
+        kind = media_field(message)[1] or "text"
+        with tracer.span("send_message", {"message.type": kind}):
+            started = time.monotonic()
+            try:
+                response = await self._limited(self.send_limiter, self.client.send_message, jid, message)
+            except Exception as e:
+                # A timeout or dropped connection here may come after WhatsApp accepted the message
+                if delivery_unknown(e):
+                    raise DeliveryUnknown(e) from e
+                raise
+        self.deadlines.record_send(kind, time.monotonic() - started)
+        self._record_outbound(jid, message, response)
+        return response
+    
+    def _record_outbound(self, jid, message, response):
+        """Add a sent message (text or caption) to the searchable history"""
+        field, media_type = media_field(message)
+        if field:
+            text = getattr(getattr(message, field), 'caption', '')
+        elif message.HasField('extendedTextMessage'):
+            text = message.extendedTextMessage.text
+        else:
+            text = message.conversation
+        self.messages.record({
+            "chat": jid_to_str(jid),
+            "id": getattr(response, 'ID', None) or f"local-{time.time_ns()}",
+            "sender": None,
+            "from_me": 1,
+            "type": media_type or "text",
+            "text": text,
+            "timestamp": time.time(),
+            "tag": SEND_TAG.get()
+        })
+    
+    async def _build(self, builder, **kwargs):
+        """Run a build_*_message call, which uploads the media.
+        
+        Once an upload slot is free, the file is read on the media-prep pool
+        and handed to the builder as bytes, so the loop never blocks on disk
+        and only uploads in progress hold their file in memory.
+        """
+        kind = builder.__name__[len("build_"):-len("_message")]
+        with tracer.span("build_upload", {"message.type": kind}) as span:
+            timing = {"nbytes": 0}
+            
+            async def upload(**kwargs):
+                if isinstance(kwargs.get("file"), str):
+                    with tracer.span("media_prep"):
+                        prepared = await self.media_prep.prepare(kwargs["file"])
+                    kwargs["file"] = prepared["data"]
+                    span.set_attribute("message.bytes", prepared["size"])
+                if isinstance(kwargs.get("file"), bytes):
+                    timing["nbytes"] = len(kwargs["file"])
+                # Timed apart from the file read, and from queueing for the slot
+                started = time.monotonic()
+                try:
+                    return await builder(**kwargs)
+                finally:
+                    timing["seconds"] = time.monotonic() - started
+            
+            def upload_latency(seconds):
+                # Compare uploads of any size on one latency baseline
+                return self.deadlines.upload_latency(kind, timing["nbytes"], timing.get("seconds", seconds))
+            
+            built = await self._limited(self.upload_limiter, upload, latency_scale=upload_latency, **kwargs)
+        if timing["nbytes"]:
+            self.deadlines.record_upload(kind, timing["nbytes"], timing["seconds"])
+        return built
+    
+    @tagged
+    @circuit_guarded
+    @deadline_aware("Message")
+    @chat_ordered
+    @preview_prefetched
+    @retrying
+    @prioritized
+    async def send_message_async(self, phone, message, mention_all=False, link_preview=True):
         """Send text message using the working method"""
         try:
             if not self.is_connected:
-                return {"status": "error", "message": "Bot not connected to WhatsApp"}
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
             print(f"📤 Sending text to: {phone}")
             print(f"💬 Message: {message}")
             
             jid = self.create_jid(phone)
             if not jid:
-                return {"status": "error", "message": "Failed to create JID object"}
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
+            
+            if mention_all and jid.Server == GROUP_SERVER:
+                return await self._send_mention_all(jid, message)
+            
+            if link_preview:
+                preview = self.previews.cached(str(message))
+                if preview:
+                    return await self._send_with_preview(jid, message, preview)
             
             try:
                 print("🔄 Trying build_reply_message...")
@@ -126,65 +551,134 @@ class WhatsAppBot:
                     message=str(message),
                     quoted=None
                 )
-                
-                if built_message and hasattr(built_message, 'SerializeToString'):
-                    print(f"📦 Built message: {type(built_message)}")
-                    
-                    result = await self.client.send_message(jid, built_message)
-                    print(f"✅ Text message sent successfully!")
-                    
-                    return {
-                        "status": "success", 
-                        "message": "Message sent successfully",
-                        "data": {
-                            "jid": f"{jid.User}@{jid.Server}", 
-                            "text": message,
-                            "method": "build_reply_message",
-                            "timestamp": time.time()
-                        }
-                    }
-                else:
-                    print("⚠️ build_reply_message returned None")
+                if not (built_message and hasattr(built_message, 'SerializeToString')):
                     raise Exception("build_reply_message returned None")
-                    
+                print(f"📦 Built message: {type(built_message)}")
+                method = "build_reply_message"
             except Exception as e1:
+                # Only building falls back; a failed send is not sent a second time
                 print(f"⚠️ build_reply_message failed: {e1}")
+                print("🔄 Trying direct message creation...")
                 
-                try:
-                    print("🔄 Trying direct message creation...")
-                    
-                    from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import Message
-                    
-                    msg = Message()
-                    msg.conversation = str(message)
-                    
-                    result = await self.client.send_message(jid, msg)
-                    print(f"✅ Message sent using direct creation!")
-                    
-                    return {
-                        "status": "success",
-                        "message": "Message sent successfully", 
-                        "data": {
-                            "jid": f"{jid.User}@{jid.Server}",
-                            "text": message,
-                            "method": "direct_message",
-                            "timestamp": time.time()
-                        }
-                    }
-                    
-                except Exception as e2:
-                    print(f"❌ All text methods failed: {e1} | {e2}")
-                    return {"status": "error", "message": f"Failed to send text: {e2}"}
+                from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import Message
+                
+                built_message = Message()
+                built_message.conversation = str(message)
+                method = "direct_message"
+            
+            result = await self._send(jid, built_message)
+            print(f"✅ Text message sent successfully!")
+            
+            return {
+                "status": "success", 
+                "message": "Message sent successfully",
+                "data": {
+                    "jid": f"{jid.User}@{jid.Server}", 
+                    "message_id": getattr(result, "ID", None),
+                    "text": message,
+                    "method": method,
+                    "timestamp": time.time()
+                }
+            }
             
         except Exception as e:
             print(f"❌ General error sending text: {e}")
+            return send_error(e)
+    
+    async def _send_mention_all(self, jid, message):
+        """Send text to a group mentioning every participant (from the group cache)"""
+        from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import ContextInfo, ExtendedTextMessage, Message
+        
+        participants = await self.groups.participants(jid)
+        msg = Message(
+            extendedTextMessage=ExtendedTextMessage(
+                text=str(message),
+                contextInfo=ContextInfo(mentionedJID=participants)
+            )
+        )
+        result = await self._send(jid, msg)
+        print(f"✅ Group message sent mentioning {len(participants)} participants!")
+        
+        return {
+            "status": "success",
+            "message": "Message sent successfully",
+            "data": {
+                "jid": f"{jid.User}@{jid.Server}",
+                "message_id": getattr(result, "ID", None),
+                "text": message,
+                "method": "mention_all",
+                "mentions": len(participants),
+                "timestamp": time.time()
+            }
+        }
+    
+    async def _send_with_preview(self, jid, message, preview):
+        """Send text as an extendedTextMessage carrying a link preview"""
+        from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import ExtendedTextMessage, Message
+        
+        extended = ExtendedTextMessage(
+            text=str(message),
+            matchedText=preview["url"],
+            title=preview["title"],
+            description=preview["description"]
+        )
+        if preview["thumbnail"]:
+            extended.jpegThumbnail = preview["thumbnail"]
+        result = await self._send(jid, Message(extendedTextMessage=extended))
+        print(f"✅ Text message sent with preview of {preview['url']}")
+        
+        return {
+            "status": "success",
+            "message": "Message sent successfully",
+            "data": {
+                "jid": f"{jid.User}@{jid.Server}",
+                "message_id": getattr(result, "ID", None),
+                "text": message,
+                "method": "link_preview",
+                "preview": {"url": preview["url"], "title": preview["title"]},
+                "timestamp": time.time()
+            }
+        }
+    
+    @deadline_aware("Group list")
+    async def get_groups_async(self, refresh=False):
+        """List joined groups (cached)"""
+        try:
+            groups = await self.groups.list_groups(refresh=refresh)
+            return {
+                "status": "success",
+                "data": [
+                    {"jid": g["jid"], "name": g["name"], "participants": len(g["participants"])}
+                    for g in groups
+                ]
+            }
+        except Exception as e:
+            print(f"❌ Error listing groups: {e}")
+            return {"status": "error", "message": str(e)}
+    
+    @deadline_aware("Group info")
+    async def get_group_info_async(self, group):
+        """Group metadata and participants (cached)"""
+        try:
+            jid = self.create_jid(group)
+            if not jid or jid.Server != GROUP_SERVER:
+                return {"status": "error", "message": "Invalid group JID"}
+            return {"status": "success", "data": await self.groups.get_info(jid)}
+        except Exception as e:
+            print(f"❌ Error getting group info: {e}")
             return {"status": "error", "message": str(e)}
     
+    @tagged
+    @circuit_guarded
+    @deadline_aware("Image")
+    @chat_ordered
+    @retrying
+    @prioritized
     async def send_image_async(self, phone, filepath, caption=""):
         """Send image with optional caption"""
         try:
             if not self.is_connected:
-                return {"status": "error", "message": "Bot not connected to WhatsApp"}
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
             print(f"📤 Sending image to: {phone}")
             print(f"🖼️ File: {filepath}")
@@ -192,20 +686,21 @@ class WhatsAppBot:
             
             jid = self.create_jid(phone)
             if not jid:
-                return {"status": "error", "message": "Failed to create JID object"}
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
             
             if not os.path.exists(filepath):
-                return {"status": "error", "message": "File not found"}
+                return send_error("File not found", PERMANENT_MEDIA)
             
             try:
-                built_message = await self.client.build_image_message(
+                built_message = await self._build(
+                    self.client.build_image_message,
                     file=filepath,
                     caption=caption if caption else None,
                     quoted=None
                 )
                 
                 if built_message:
-                    result = await self.client.send_message(jid, built_message)
+                    result = await self._send(jid, built_message)
                     print(f"✅ Image sent successfully!")
                     
                     return {
@@ -213,27 +708,34 @@ class WhatsAppBot:
                         "message": "Image sent successfully",
                         "data": {
                             "jid": f"{jid.User}@{jid.Server}",
+                            "message_id": getattr(result, "ID", None),
                             "filepath": filepath,
                             "caption": caption,
                             "timestamp": time.time()
                         }
                     }
                 else:
-                    return {"status": "error", "message": "Failed to build image message"}
+                    return send_error("Failed to build image message", PERMANENT_MEDIA)
                     
             except Exception as e:
                 print(f"❌ Error sending image: {e}")
-                return {"status": "error", "message": str(e)}
+                return send_error(e)
             
         except Exception as e:
             print(f"❌ General error sending image: {e}")
-            return {"status": "error", "message": str(e)}
+            return send_error(e)
     
+    @tagged
+    @circuit_guarded
+    @deadline_aware("Document")
+    @chat_ordered
+    @retrying
+    @prioritized
     async def send_document_async(self, phone, filepath, caption="", filename=None):
         """Send document with optional caption"""
         try:
             if not self.is_connected:
-                return {"status": "error", "message": "Bot not connected to WhatsApp"}
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
             print(f"📤 Sending document to: {phone}")
             print(f"📄 File: {filepath}")
@@ -242,10 +744,10 @@ class WhatsAppBot:
             
             jid = self.create_jid(phone)
             if not jid:
-                return {"status": "error", "message": "Failed to create JID object"}
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
             
             if not os.path.exists(filepath):
-                return {"status": "error", "message": "File not found"}
+                return send_error("File not found", PERMANENT_MEDIA)
             
             try:
                 # Get mimetype
@@ -259,7 +761,8 @@ class WhatsAppBot:
                 
                 print(f"📋 Mimetype: {mimetype}")
                 
-                built_message = await self.client.build_document_message(
+                built_message = await self._build(
+                    self.client.build_document_message,
                     file=filepath,
                     caption=caption if caption else None,
                     title=filename,
@@ -269,7 +772,7 @@ class WhatsAppBot:
                 )
                 
                 if built_message:
-                    result = await self.client.send_message(jid, built_message)
+                    result = await self._send(jid, built_message)
                     print(f"✅ Document sent successfully!")
                     
                     return {
@@ -277,6 +780,7 @@ class WhatsAppBot:
                         "message": "Document sent successfully",
                         "data": {
                             "jid": f"{jid.User}@{jid.Server}",
+                            "message_id": getattr(result, "ID", None),
                             "filepath": filepath,
                             "filename": filename,
                             "caption": caption,
@@ -285,40 +789,47 @@ class WhatsAppBot:
                         }
                     }
                 else:
-                    return {"status": "error", "message": "Failed to build document message"}
+                    return send_error("Failed to build document message", PERMANENT_MEDIA)
                     
             except Exception as e:
                 print(f"❌ Error sending document: {e}")
-                return {"status": "error", "message": str(e)}
+                return send_error(e)
             
         except Exception as e:
             print(f"❌ General error sending document: {e}")
-            return {"status": "error", "message": str(e)}
+            return send_error(e)
     
+    @tagged
+    @circuit_guarded
+    @deadline_aware("Audio")
+    @chat_ordered
+    @retrying
+    @prioritized
     async def send_audio_async(self, phone, filepath):
         """Send audio file"""
         try:
             if not self.is_connected:
-                return {"status": "error", "message": "Bot not connected to WhatsApp"}
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
             print(f"📤 Sending audio to: {phone}")
             print(f"🎵 File: {filepath}")
             
             jid = self.create_jid(phone)
             if not jid:
-                return {"status": "error", "message": "Failed to create JID object"}
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
             
             if not os.path.exists(filepath):
-                return {"status": "error", "message": "File not found"}
+                return send_error("File not found", PERMANENT_MEDIA)
             
             try:
-                built_message = await self.client.build_audio_message(
+                built_message = await self._build(
+                    self.client.build_audio_message,
                     file=filepath,
                     quoted=None
                 )
                 
                 if built_message:
-                    result = await self.client.send_message(jid, built_message)
+                    result = await self._send(jid, built_message)
                     print(f"✅ Audio sent successfully!")
                     
                     return {
@@ -326,26 +837,33 @@ class WhatsAppBot:
                         "message": "Audio sent successfully",
                         "data": {
                             "jid": f"{jid.User}@{jid.Server}",
+                            "message_id": getattr(result, "ID", None),
                             "filepath": filepath,
                             "timestamp": time.time()
                         }
                     }
                 else:
-                    return {"status": "error", "message": "Failed to build audio message"}
+                    return send_error("Failed to build audio message", PERMANENT_MEDIA)
                     
             except Exception as e:
                 print(f"❌ Error sending audio: {e}")
-                return {"status": "error", "message": str(e)}
+                return send_error(e)
             
         except Exception as e:
             print(f"❌ General error sending audio: {e}")
-            return {"status": "error", "message": str(e)}
+            return send_error(e)
     
+    @tagged
+    @circuit_guarded
+    @deadline_aware("Video")
+    @chat_ordered
+    @retrying
+    @prioritized
     async def send_video_async(self, phone, filepath, caption=""):
         """Send video with optional caption"""
         try:
             if not self.is_connected:
-                return {"status": "error", "message": "Bot not connected to WhatsApp"}
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
             print(f"📤 Sending video to: {phone}")
             print(f"🎬 File: {filepath}")
@@ -353,20 +871,21 @@ class WhatsAppBot:
             
             jid = self.create_jid(phone)
             if not jid:
-                return {"status": "error", "message": "Failed to create JID object"}
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
             
             if not os.path.exists(filepath):
-                return {"status": "error", "message": "File not found"}
+                return send_error("File not found", PERMANENT_MEDIA)
             
             try:
-                built_message = await self.client.build_video_message(
+                built_message = await self._build(
+                    self.client.build_video_message,
                     file=filepath,
                     caption=caption if caption else None,
                     quoted=None
                 )
                 
                 if built_message:
-                    result = await self.client.send_message(jid, built_message)
+                    result = await self._send(jid, built_message)
                     print(f"✅ Video sent successfully!")
                     
                     return {
@@ -374,46 +893,54 @@ class WhatsAppBot:
                         "message": "Video sent successfully",
                         "data": {
                             "jid": f"{jid.User}@{jid.Server}",
+                            "message_id": getattr(result, "ID", None),
                             "filepath": filepath,
                             "caption": caption,
                             "timestamp": time.time()
                         }
                     }
                 else:
-                    return {"status": "error", "message": "Failed to build video message"}
+                    return send_error("Failed to build video message", PERMANENT_MEDIA)
                     
             except Exception as e:
                 print(f"❌ Error sending video: {e}")
-                return {"status": "error", "message": str(e)}
+                return send_error(e)
             
         except Exception as e:
             print(f"❌ General error sending video: {e}")
-            return {"status": "error", "message": str(e)}
+            return send_error(e)
     
+    @tagged
+    @circuit_guarded
+    @deadline_aware("Sticker")
+    @chat_ordered
+    @retrying
+    @prioritized
     async def send_sticker_async(self, phone, filepath):
         """Send sticker (WebP format)"""
         try:
             if not self.is_connected:
-                return {"status": "error", "message": "Bot not connected to WhatsApp"}
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
             print(f"📤 Sending sticker to: {phone}")
             print(f"🎨 File: {filepath}")
             
             jid = self.create_jid(phone)
             if not jid:
-                return {"status": "error", "message": "Failed to create JID object"}
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
             
             if not os.path.exists(filepath):
-                return {"status": "error", "message": "File not found"}
+                return send_error("File not found", PERMANENT_MEDIA)
             
             try:
-                built_message = await self.client.build_sticker_message(
+                built_message = await self._build(
+                    self.client.build_sticker_message,
                     file=filepath,
                     quoted=None
                 )
                 
                 if built_message:
-                    result = await self.client.send_message(jid, built_message)
+                    result = await self._send(jid, built_message)
                     print(f"✅ Sticker sent successfully!")
                     
                     return {
@@ -421,135 +948,398 @@ class WhatsAppBot:
                         "message": "Sticker sent successfully",
                         "data": {
                             "jid": f"{jid.User}@{jid.Server}",
+                            "message_id": getattr(result, "ID", None),
                             "filepath": filepath,
                             "timestamp": time.time()
                         }
                     }
                 else:
-                    return {"status": "error", "message": "Failed to build sticker message"}
+                    return send_error("Failed to build sticker message", PERMANENT_MEDIA)
                     
             except Exception as e:
                 print(f"❌ Error sending sticker: {e}")
-                return {"status": "error", "message": str(e)}
+                return send_error(e)
             
         except Exception as e:
             print(f"❌ General error sending sticker: {e}")
-            return {"status": "error", "message": str(e)}
+            return send_error(e)
     
-    # Thread-safe wrapper methods
-    def send_message(self, phone, message):
-        """Thread-safe text message sending"""
-        if not self.loop:
-            return {"status": "error", "message": "Bot not started"}
+    @circuit_guarded
+    @chat_ordered
+    @retrying
+    @prioritized
+    async def revoke_message_async(self, phone, message_id):
+        """Delete a message the bot sent, for everyone in the chat"""
+        try:
+            if not self.is_connected:
+                return send_error("Bot not connected to WhatsApp", SESSION)
             
-        if not self.is_connected:
-            return {"status": "error", "message": "Bot not connected. Please scan QR code first."}
-        
+            jid = self.create_jid(phone)
+            if not jid:
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
+            
+            from neonize.utils.jid import JID
+            
+            # An empty sender marks the message as our own
+            own = JID()
+            own.User = ""
+            own.Server = ""
+            own.RawAgent = 0
+            own.Device = 0
+            own.Integrator = 0
+            own.IsEmpty = True
+            
+            await self._limited(self.send_limiter, self.client.revoke_message, jid, own, message_id)
+            self.messages.set_state(jid_to_str(jid), message_id, "revoked")
+            return {
+                "status": "success",
+                "message": "Message revoked",
+                "data": {"jid": f"{jid.User}@{jid.Server}", "message_id": message_id, "timestamp": time.time()}
+            }
+        except Exception as e:
+            print(f"❌ Error revoking message {message_id}: {e}")
+            return send_error(e)
+    
+    @circuit_guarded
+    @chat_ordered
+    @retrying
+    @prioritized
+    async def edit_message_async(self, phone, message_id, text):
+        """Replace the text of a message the bot sent"""
         try:
-            future = asyncio.run_coroutine_threadsafe(
-                self.send_message_async(phone, message), 
-                self.loop
+            if not self.is_connected:
+                return send_error("Bot not connected to WhatsApp", SESSION)
+            
+            jid = self.create_jid(phone)
+            if not jid:
+                return send_error("Failed to create JID object", PERMANENT_RECIPIENT)
+            
+            from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import Message
+            
+            await self._limited(
+                self.send_limiter, self.client.edit_message, jid, message_id, Message(conversation=str(text))
             )
-            return future.result(timeout=30)
-        except asyncio.TimeoutError:
-            return {"status": "error", "message": "Message sending timeout"}
+            self.messages.set_state(jid_to_str(jid), message_id, "edited", str(text))
+            return {
+                "status": "success",
+                "message": "Message edited",
+                "data": {"jid": f"{jid.User}@{jid.Server}", "message_id": message_id, "timestamp": time.time()}
+            }
         except Exception as e:
-            return {"status": "error", "message": f"Wrapper error: {str(e)}"}
+            print(f"❌ Error editing message {message_id}: {e}")
+            return send_error(e)
     
-    def send_image(self, phone, filepath, caption=""):
-        """Thread-safe image sending"""
+    # Thread-safe wrapper methods
+    def _run_threadsafe(self, coro_fn, label, kind, deadline=None, nbytes=0):
+        """Run a send coroutine on the bot loop, bounded by its adaptive timeout and the client deadline"""
         if not self.loop:
             return {"status": "error", "message": "Bot not started"}
             
         if not self.is_connected:
-            return {"status": "error", "message": "Bot not connected. Please scan QR code first."}
+            return send_error("Bot not connected. Please scan QR code first.", SESSION)
+        
+        # The client deadline can only shorten our own timeout, never extend it
+        clock = SendClock(kind, nbytes, self.deadlines.timeout(kind, nbytes))
+        if deadline is not None and deadline <= time.time():
+            self._count("timed_out")
+            return timeout_result(label)
         
         try:
             future = asyncio.run_coroutine_threadsafe(
-                self.send_image_async(phone, filepath, caption), 
+                self._in_trace(coro_fn(deadline=deadline, clock=clock), kind, tracer.current_span(), time.time_ns()),
                 self.loop
             )
-            return future.result(timeout=60)
-        except asyncio.TimeoutError:
-            return {"status": "error", "message": "Image sending timeout"}
+            while True:
+                # The clock stops while the send is queued, so wait in rounds
+                remaining = max(0, send_remaining(deadline, clock))
+                try:
+                    return future.result(timeout=remaining + DEADLINE_GRACE)
+                except concurrent.futures.TimeoutError:
+                    if send_remaining(deadline, clock) + DEADLINE_GRACE <= 0:
+                        return self._abandon(future, label)
         except Exception as e:
             return {"status": "error", "message": f"Wrapper error: {str(e)}"}
     
-    def send_document(self, phone, filepath, caption="", filename=None):
-        """Thread-safe document sending"""
-        if not self.loop:
-            return {"status": "error", "message": "Bot not started"}
-            
-        if not self.is_connected:
-            return {"status": "error", "message": "Bot not connected. Please scan QR code first."}
+    async def _in_trace(self, coro, kind, parent, submitted_ns):
+        """Continue the calling thread's trace inside the loop task.
+        
+        Tasks copy the loop thread's context, not the caller's, so the parent
+        span is handed over explicitly; the handoff span covers the time spent
+        waiting for the loop to pick the coroutine up.
+        """
+        with tracer.activate(parent):
+            tracer.start_span("loop_handoff", start_ns=submitted_ns).end()
+            with tracer.span(f"bot.{kind}", {"message.type": kind}) as span:
+                result = await coro
+                if result.get("status") != "success":
+                    span.set_error(result.get("code") or result.get("message"))
+                return result
+    
+    def _abandon(self, future, label):
+        """Cancel a send the caller gave up on and wait briefly for it to release its resources"""
+        self._count("timed_out")
+        future.cancel()
+        done, _ = concurrent.futures.wait([future], timeout=CANCEL_GRACE)
+        if done:
+            self._count("cancelled")
+        else:
+            # Loop is too busy to deliver the cancellation; keep track until it finishes
+            self._count("abandoned")
+            self._count("abandoned_running")
+            future.add_done_callback(lambda f: self._count("abandoned_running", -1))
+            print(f"⚠️ {label} task still running after cancellation")
+        return timeout_result(label)
+    
+    def _resume_handover(self):
+        """Re-queue sends and downloads handed over by the previous process"""
+        state = self.handover.take()
+        if not state:
+            return
+        from neonize.proto.waE2E.WAWebProtobufsE2E_pb2 import Message
         
+        self.restart["previous_shutdown"] = state.get("report")
+        for send in state.get("sends", []):
+            asyncio.ensure_future(self._replay_send(send))
+        for job in state.get("downloads", []):
+            message = Message.FromString(base64.b64decode(job["message"]))
+            self.downloader.submit(job["chat"], job["id"], message, job["mimetype"])
+        self.restart["resumed_sends"] = len(state.get("sends", []))
+        self.restart["resumed_downloads"] = len(state.get("downloads", []))
+        print(f"🔁 Resumed {self.restart['resumed_sends']} sends and "
+              f"{self.restart['resumed_downloads']} downloads from previous process")
+    
+    async def _replay_send(self, send):
+        arguments = send["arguments"]
         try:
-            future = asyncio.run_coroutine_threadsafe(
-                self.send_document_async(phone, filepath, caption, filename), 
-                self.loop
+            result = await getattr(self, send["method"])(
+                **arguments, priority=send["priority"], handover=True, tag=send.get("tag")
             )
-            return future.result(timeout=60)
-        except asyncio.TimeoutError:
-            return {"status": "error", "message": "Document sending timeout"}
+            if result["status"] != "success":
+                print(f"❌ Handed-over {send['method']} failed: {result.get('message')}")
         except Exception as e:
-            return {"status": "error", "message": f"Wrapper error: {str(e)}"}
+            print(f"❌ Handed-over {send['method']} failed: {e}")
+        finally:
+            filepath = arguments.get("filepath")
+            if filepath and filepath.startswith(self.handover.folder) and os.path.exists(filepath):
+                os.remove(filepath)
     
-    def send_audio(self, phone, filepath):
-        """Thread-safe audio sending"""
-        if not self.loop:
-            return {"status": "error", "message": "Bot not started"}
-            
-        if not self.is_connected:
-            return {"status": "error", "message": "Bot not connected. Please scan QR code first."}
-        
+    def requeue_dead_letters(self, entry_ids=None, error_class=None, limit=1000):
+        """Resend dead-lettered sends in the background; returns the requeued entries"""
+        if not self.loop or not self.is_connected:
+            return None
+        entries = self.dead_letters.claim(entry_ids, error_class, limit)
+        for entry in entries:
+            asyncio.run_coroutine_threadsafe(self._replay_dead_letter(entry), self.loop)
+        return entries
+    
+    async def _replay_dead_letter(self, entry):
         try:
-            future = asyncio.run_coroutine_threadsafe(
-                self.send_audio_async(phone, filepath), 
-                self.loop
+            result = await getattr(self, entry["method"])(
+                **entry["arguments"], priority=entry["priority"], dead_letter=False, tag=entry["tag"]
             )
-            return future.result(timeout=90)  # Longer timeout for audio
-        except asyncio.TimeoutError:
-            return {"status": "error", "message": "Audio sending timeout"}
         except Exception as e:
-            return {"status": "error", "message": f"Wrapper error: {str(e)}"}
+            result = send_error(e)
+        self.dead_letters.resolve(entry, result, result.get("attempts", 1))
     
-    def send_video(self, phone, filepath, caption=""):
-        """Thread-safe video sending"""
-        if not self.loop:
-            return {"status": "error", "message": "Bot not started"}
-            
-        if not self.is_connected:
-            return {"status": "error", "message": "Bot not connected. Please scan QR code first."}
+    def submit_batch(self, steps, stop_on_error=True, priority=DEFAULT_LANE, files=()):
+        """Queue a chain of sends that run strictly one after another; returns the batch id.
         
+        `steps` are (type, arguments) pairs for the send_*_async methods.
+        Progress is tracked in self.batches; `files` are removed once the
+        batch has finished.
+        """
+        if not self.loop or not self.is_connected:
+            return None
+        batch_id = self.batches.create(
+            [{"type": kind, "phone": arguments["phone"]} for kind, arguments in steps], stop_on_error
+        )
+        asyncio.run_coroutine_threadsafe(
+            self._run_batch(batch_id, steps, stop_on_error, priority, files, tracer.current_span()), self.loop
+        )
+        return batch_id
+    
+    async def _run_batch(self, batch_id, steps, stop_on_error, priority, files, parent):
         try:
-            future = asyncio.run_coroutine_threadsafe(
-                self.send_video_async(phone, filepath, caption), 
-                self.loop
-            )
-            return future.result(timeout=120)  # Longer timeout for video
-        except asyncio.TimeoutError:
-            return {"status": "error", "message": "Video sending timeout"}
-        except Exception as e:
-            return {"status": "error", "message": f"Wrapper error: {str(e)}"}
+            with tracer.activate(parent), tracer.span("send_batch", {"batch.steps": len(steps)}):
+                for index, (kind, arguments) in enumerate(steps):
+                    self.batches.start_step(batch_id, index)
+                    nbytes = payload_size(arguments.get("filepath"))
+                    try:
+                        result = await getattr(self, BATCH_METHODS[kind])(
+                            **arguments, priority=priority, handover=True,
+                            clock=SendClock(kind, nbytes, self.deadlines.timeout(kind, nbytes))
+                        )
+                    except Exception as e:
+                        result = send_error(e)
+                    self.batches.finish_step(batch_id, index, result)
+                    if stop_on_error and result["status"] != "success" and result.get("code") != "handed_over":
+                        self.batches.skip_rest(batch_id, index)
+                        break
+        finally:
+            self.batches.finish(batch_id)
+            for filepath in files:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
     
-    def send_sticker(self, phone, filepath):
+    def shutdown(self, timeout=SHUTDOWN_TIMEOUT):
+        """Graceful stop: drain or hand over sends and downloads, flush stores, disconnect.
+        
+        Returns a report with the drain time and what was handed over to the
+        next process.
+        """
+        started = time.monotonic()
+        deadline = started + timeout
+        self.draining = True
+        print(f"🛑 Shutting down, draining for up to {timeout:.0f}s...")
+        report = {"sends_handed_over": 0, "downloads_handed_over": 0}
+        
+        if self.loop and self.loop.is_running():
+            future = asyncio.run_coroutine_threadsafe(self._drain(deadline), self.loop)
+            try:
+                report.update(future.result(timeout=max(0, deadline - time.monotonic()) + CANCEL_GRACE))
+            except Exception as e:
+                print(f"⚠️ Drain did not complete: {e!r}")
+                future.cancel()
+        
+        report["handler_backlog"] = inbound_handlers.drain(max(0, deadline - time.monotonic()))
+        report["sends_handed_over"] = len(self.handover.sends)
+        report["downloads_handed_over"] = len(self.handover.downloads)
+        report["message_store_flushed"] = self.messages.flush(timeout=5)
+        report["drain_seconds"] = round(time.monotonic() - started, 2)
+        self.handover.save(report)
+        self._disconnect()
+        self.stop()
+        print(f"✅ Drained in {report['drain_seconds']}s; handed over {report['sends_handed_over']} sends, "
+              f"{report.get('campaign_rows_deferred', 0)} campaign rows and {report['downloads_handed_over']} downloads")
+        return report
+    
+    async def _drain(self, deadline):
+        """Loop side of shutdown; `deadline` is time.monotonic() based"""
+        async def wait_until(done, until):
+            while not done() and time.monotonic() < until:
+                await asyncio.sleep(0.05)
+        
+        def sends_idle():
+            # Sends waiting for a preview, a chat turn or a retry hold no slot but can still be handed over
+            return self.scheduler.idle() and self.chat_lanes.idle() and not self.previews.prefetching
+        
+        self.campaigns.stop()
+        # First half of the budget: let queued and running sends finish normally
+        await wait_until(sends_idle, time.monotonic() + (deadline - time.monotonic()) / 2)
+        # Then hand over whatever is still waiting for a slot, and let the rest finish or be handed over
+        refused = self.scheduler.close()
+        await wait_until(lambda: sends_idle() and not self.campaigns.running_tasks(), deadline)
+        
+        for chat, message_id, message, mimetype in self.downloader.take_queued():
+            self.handover.add_download(chat, message_id, message, mimetype)
+        await wait_until(lambda: self.downloader.stats["in_progress"] == 0, deadline)
+        
+        return {
+            "sends_refused_at_close": refused,
+            "campaign_rows_deferred": self.campaigns.deferred,
+            "sends_unfinished": self.scheduler.running,
+            "downloads_unfinished": self.downloader.stats["in_progress"]
+        }
+    
+    def _disconnect(self, timeout=5):
+        """Close the WhatsApp connection cleanly so the session stays warm for the next process"""
+        if not (self.loop and self.loop.is_running()):
+            return
+        future = asyncio.run_coroutine_threadsafe(self.client.disconnect(), self.loop)
+        # connect() returns once disconnected, which ends the bot thread before the future may report back
+        deadline = time.monotonic() + timeout
+        while not future.done() and self.thread.is_alive() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        if future.done() and not future.cancelled() and future.exception():
+            print(f"⚠️ Client disconnect failed: {future.exception()!r}")
+        self.is_connected = False
+    
+    def _count(self, key, delta=1):
+        with self._stats_lock:
+            self.stats[key] += delta
+    
+    def get_metrics(self):
+        """Snapshot of send counters, concurrency limits and circuit breaker state"""
+        with self._stats_lock:
+            sends = dict(self.stats)
+        return {
+            "sends": sends,
+            "concurrency": {
+                "send": self.send_limiter.snapshot(),
+                "upload": self.upload_limiter.snapshot()
+            },
+            "circuit_breaker": self.breaker.snapshot(),
+            "deadlines": self.deadlines.snapshot(),
+            "priority_lanes": self.scheduler.snapshot(),
+            "chat_lanes": self.chat_lanes.snapshot(),
+            "send_batches": self.batches.snapshot(),
+            "rules": self.rules.snapshot(),
+            "bulk_actions": self.bulk.snapshot(),
+            "group_cache": self.groups.snapshot(),
+            "link_previews": self.previews.snapshot(),
+            "media_prep": self.media_prep.snapshot(),
+            "media_downloads": self.downloader.snapshot(),
+            "message_store": self.messages.snapshot(),
+            "inbound_handlers": inbound_handlers.snapshot(),
+            "dead_letters": self.dead_letters.snapshot(),
+            "restart": dict(self.restart, draining=self.draining)
+        }
+    
+    def send_message(self, phone, message, mention_all=False, link_preview=True, priority=DEFAULT_LANE, deadline=None, tag=None, dead_letter=True):
+        """Thread-safe text message sending"""
+        return self._run_threadsafe(
+            functools.partial(self.send_message_async, phone, message, mention_all, link_preview, priority=priority, handover=True, tag=tag, dead_letter=dead_letter),
+            "Message", "text", deadline
+        )
+    
+    def send_image(self, phone, filepath, caption="", priority=DEFAULT_LANE, deadline=None, tag=None, dead_letter=True):
+        """Thread-safe image sending"""
+        return self._run_threadsafe(
+            functools.partial(self.send_image_async, phone, filepath, caption, priority=priority, handover=True, tag=tag, dead_letter=dead_letter),
+            "Image", "image", deadline, payload_size(filepath)
+        )
+    
+    def send_document(self, phone, filepath, caption="", filename=None, priority=DEFAULT_LANE, deadline=None, tag=None, dead_letter=True):
+        """Thread-safe document sending"""
+        return self._run_threadsafe(
+            functools.partial(self.send_document_async, phone, filepath, caption, filename, priority=priority, handover=True, tag=tag, dead_letter=dead_letter),
+            "Document", "document", deadline, payload_size(filepath)
+        )
+    
+    def send_audio(self, phone, filepath, priority=DEFAULT_LANE, deadline=None, tag=None, dead_letter=True):
+        """Thread-safe audio sending"""
+        return self._run_threadsafe(
+            functools.partial(self.send_audio_async, phone, filepath, priority=priority, handover=True, tag=tag, dead_letter=dead_letter),
+            "Audio", "audio", deadline, payload_size(filepath)
+        )
+    
+    def send_video(self, phone, filepath, caption="", priority=DEFAULT_LANE, deadline=None, tag=None, dead_letter=True):
+        """Thread-safe video sending"""
+        return self._run_threadsafe(
+            functools.partial(self.send_video_async, phone, filepath, caption, priority=priority, handover=True, tag=tag, dead_letter=dead_letter),
+            "Video", "video", deadline, payload_size(filepath)
+        )
+    
+    def send_sticker(self, phone, filepath, priority=DEFAULT_LANE, deadline=None, tag=None, dead_letter=True):
         """Thread-safe sticker sending"""
-        if not self.loop:
-            return {"status": "error", "message": "Bot not started"}
+        return self._run_threadsafe(
+            functools.partial(self.send_sticker_async, phone, filepath, priority=priority, handover=True, tag=tag, dead_letter=dead_letter),
+            "Sticker", "sticker", deadline, payload_size(filepath)
+        )
             
-        if not self.is_connected:
-            return {"status": "error", "message": "Bot not connected. Please scan QR code first."}
-        
-        try:
-            future = asyncio.run_coroutine_threadsafe(
-                self.send_sticker_async(phone, filepath), 
-                self.loop
-            )
-            return future.result(timeout=30)
-        except asyncio.TimeoutError:
-            return {"status": "error", "message": "Sticker sending timeout"}
-        except Exception as e:
-            return {"status": "error", "message": f"Wrapper error: {str(e)}"}
+    def get_groups(self, refresh=False, deadline=None):
+        """Thread-safe group listing"""
+        return self._run_threadsafe(
+            functools.partial(self.get_groups_async, refresh),
+            "Group list", "group", deadline
+        )
+    
+    def get_group_info(self, group, deadline=None):
+        """Thread-safe group info lookup"""
+        return self._run_threadsafe(
+            functools.partial(self.get_group_info_async, group),
+            "Group info", "group", deadline
+        )
             
     def is_alive(self):
         """Check if bot thread is alive"""
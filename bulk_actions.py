@@ -0,0 +1,222 @@
+import asyncio
+import copy
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+BULK_ACTIONS = ("revoke", "edit")
+JOB_STATUSES = ("running", "completed", "cancelled", "interrupted", "failed")
+PAGE_SIZE = 500        # tagged messages read from the store at a time
+# Revokes/edits a job keeps in flight; the send limiter and the bulk lane still pace them
+BULK_CONCURRENCY = int(os.environ.get("WA_BULK_CONCURRENCY", "64"))
+MAX_ERRORS = 50        # failures listed per job (all are counted)
+
+
+def campaign_tag(campaign_id):
+    """Tag recorded with every message a campaign sends"""
+    return f"campaign:{campaign_id}"
+
+
+def edited_text(row, text, find, replace):
+    """New text of a message for an edit, or None to leave it alone"""
+    if row["type"] != "text" or row["state"] == "revoked":
+        return None
+    current = row["text"] or ""
+    new = text if text is not None else current.replace(find, replace)
+    return new if new != current else None
+
+
+class BulkActions:
+    """Revoke or edit every sent message with a tag, as jobs on the bot loop.
+
+    Tagged messages are read from the message store a page at a time (off
+    the loop) and passed to revoke_message_async / edit_message_async in the
+    bulk lane, BULK_CONCURRENCY at a time, so they are paced by the send
+    limiter, priority lanes and per-chat order like any other send. Messages
+    already revoked or edited are skipped, so a cancelled or interrupted job
+    can simply be submitted again. Progress is kept in memory.
+    """
+
+    def __init__(self, bot, max_jobs=100, concurrency=BULK_CONCURRENCY):
+        self.bot = bot
+        self.max_jobs = max_jobs
+        self.concurrency = concurrency
+        self._jobs = OrderedDict()
+        self._cond = threading.Condition()
+
+    def submit(self, action, tag, text=None, find=None, replace=None):
+        """Start a job (any thread); returns its id, or None if the bot is not connected.
+
+        An edit sets the whole text to `text`, or replaces `find` with
+        `replace` in each message. While a job for the same action and tag is
+        running, its id is returned instead of starting another.
+        """
+        if not self.bot.loop or not self.bot.is_connected:
+            return None
+        with self._cond:
+            for job in self._jobs.values():
+                if job["status"] == "running" and job["action"] == action and job["tag"] == tag:
+                    return job["id"]
+        counts = self.bot.messages.count_tagged(tag)
+        job_id = uuid.uuid4().hex[:16]
+        job = {
+            "id": job_id,
+            "action": action,
+            "tag": tag,
+            "status": "running",
+            "total": sum(counts.values()),
+            "processed": 0,
+            "succeeded": 0,
+            "skipped": 0,
+            "failed": 0,
+            "errors": [],
+            "created_at": time.time(),
+            "finished_at": None,
+            "cancel": False
+        }
+        with self._cond:
+            self._jobs[job_id] = job
+            finished = [i for i, j in self._jobs.items() if j["status"] != "running"]
+            for old_id in finished[:max(0, len(self._jobs) - self.max_jobs)]:
+                del self._jobs[old_id]
+        asyncio.run_coroutine_threadsafe(self._run(job_id, action, tag, text, find, replace), self.bot.loop)
+        print(f"🧹 Bulk {action} {job_id} started for {job['total']} messages tagged {tag}")
+        return job_id
+
+    def cancel(self, job_id):
+        """Stop a running job after its in-flight operations; False if unknown"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if not job:
+                return False
+            job["cancel"] = True
+            return True
+
+    def _stopping(self, job_id):
+        return self._jobs[job_id]["cancel"] or self.bot.draining
+
+    async def _run(self, job_id, action, tag, text, find, replace):
+        slots = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        after = 0
+        error = None
+        try:
+            while not self._stopping(job_id):
+                rows = await asyncio.to_thread(self.bot.messages.tagged, tag, after, PAGE_SIZE)
+                if not rows:
+                    break
+                after = rows[-1]["rowid"]
+                for row in rows:
+                    if self._stopping(job_id):
+                        break
+                    new_text = None
+                    if action == "revoke":
+                        skip = row["state"] == "revoked"
+                    else:
+                        new_text = edited_text(row, text, find, replace)
+                        skip = new_text is None
+                    if skip:
+                        self._record(job_id, row, None)
+                        continue
+                    await slots.acquire()
+                    task = asyncio.ensure_future(self._apply(job_id, action, row, new_text, slots))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*list(tasks))
+        except Exception as e:
+            error = str(e)
+            print(f"❌ Bulk {action} {job_id} failed: {e}")
+        finally:
+            self._finish(job_id, error)
+
+    async def _apply(self, job_id, action, row, new_text, slots):
+        try:
+            while True:
+                if action == "revoke":
+                    result = await self.bot.revoke_message_async(row["chat"], row["id"], priority="bulk", dead_letter=False)
+                else:
+                    result = await self.bot.edit_message_async(
+                        row["chat"], row["id"], new_text, priority="bulk", dead_letter=False
+                    )
+                if result.get("code") != "circuit_open" or self._stopping(job_id):
+                    break
+                # Nothing was attempted; wait for the breaker to probe again
+                await asyncio.sleep(self.bot.breaker.reset_timeout)
+        except Exception as e:
+            result = {"status": "error", "message": str(e)}
+        finally:
+            slots.release()
+        self._record(job_id, row, result)
+
+    def _record(self, job_id, row, result):
+        """Count one message: skipped (result None), done or failed"""
+        with self._cond:
+            job = self._jobs[job_id]
+            if result is not None and result.get("code") == "shutting_down":
+                return  # not attempted; picked up when the job is submitted again
+            job["processed"] += 1
+            if result is None:
+                job["skipped"] += 1
+            elif result["status"] == "success":
+                job["succeeded"] += 1
+            else:
+                job["failed"] += 1
+                job["errors"].append({
+                    "chat": row["chat"], "message_id": row["id"],
+                    "code": result.get("code"), "message": result.get("message")
+                })
+                del job["errors"][:-MAX_ERRORS]
+
+    def _finish(self, job_id, error=None):
+        with self._cond:
+            job = self._jobs[job_id]
+            if error:
+                job["status"] = "failed"
+                job["error"] = error
+            elif job["cancel"]:
+                job["status"] = "cancelled"
+            elif self.bot.draining:
+                job["status"] = "interrupted"
+            else:
+                job["status"] = "completed"
+            job["finished_at"] = time.time()
+            self._cond.notify_all()
+        print(f"🧹 Bulk {job['action']} {job_id} {job['status']}: {job['succeeded']} done, "
+              f"{job['skipped']} skipped, {job['failed']} failed")
+
+    def _view(self, job):
+        view = copy.deepcopy(job)
+        del view["cancel"]
+        elapsed = (job["finished_at"] or time.time()) - job["created_at"]
+        view["rate_per_s"] = round(job["processed"] / elapsed, 1) if elapsed > 0 else None
+        return view
+
+    def get(self, job_id, wait=0):
+        """Copy of a job, after waiting up to `wait` seconds for it to finish; None if unknown"""
+        with self._cond:
+            self._cond.wait_for(
+                lambda: job_id not in self._jobs or self._jobs[job_id]["status"] != "running",
+                timeout=wait
+            )
+            job = self._jobs.get(job_id)
+            return self._view(job) if job else None
+
+    def watch(self, job_id, interval=1.0):
+        """Yield a job's progress every `interval` seconds, ending with its final state"""
+        job = self.get(job_id)
+        while job:
+            yield job
+            if job["status"] != "running":
+                return
+            job = self.get(job_id, wait=interval)
+
+    def snapshot(self):
+        with self._cond:
+            counts = dict.fromkeys(JOB_STATUSES, 0)
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+            processed = sum(job["processed"] for job in self._jobs.values() if job["status"] == "running")
+        return {"jobs": counts, "running_processed": processed}
@@ -0,0 +1,509 @@
+import asyncio
+import codecs
+import csv
+import json
+import os
+import shutil
+import sqlite3
+import string
+import threading
+import time
+import uuid
+
+from bulk_actions import campaign_tag
+from groups import normalize_group_jid
+
+CAMPAIGN_FOLDER = "data/campaigns"
+CAMPAIGN_DB = "data/campaigns.sqlite3"
+COPY_CHUNK_SIZE = 64 * 1024
+FLUSH_INTERVAL = 1.0  # seconds between outcome batches written to the store
+ROW_BATCH = 256       # rows parsed per trip to the reader thread
+
+
+class CampaignTemplate:
+    """Message template with `{column}` placeholders, parsed once per campaign"""
+
+    def __init__(self, text):
+        self.text = text
+        self.parts = []
+        for literal, field, format_spec, conversion in string.Formatter().parse(text):
+            if format_spec or conversion:
+                raise ValueError(f"Unsupported placeholder format in {{{field}}}")
+            self.parts.append((literal, field))
+        self.fields = [field for _, field in self.parts if field]
+        if any(not field.isidentifier() for field in self.fields):
+            raise ValueError("Placeholders must be column names, e.g. {name}")
+
+    def render(self, row):
+        out = []
+        for literal, field in self.parts:
+            out.append(literal)
+            if field:
+                out.append(str(row.get(field) or ""))
+        return "".join(out)
+
+
+class RowReader:
+    """Rows of a CSV or NDJSON file with the byte offsets they start and end at.
+
+    Opened at a row's offset, reading resumes there without re-parsing the
+    rows before it. Blocking: campaigns call it through asyncio.to_thread so
+    parsing never runs on the bot loop.
+    """
+
+    def __init__(self, path, fmt, row_no=0, offset=None):
+        self.fmt = fmt
+        self.file = open(path, "rb")
+        self.offset = 0
+        self.row_no = 0
+        if self.file.read(len(codecs.BOM_UTF8)) == codecs.BOM_UTF8:
+            self.offset = len(codecs.BOM_UTF8)
+        else:
+            self.file.seek(0)
+        self.header = None
+        if fmt == "csv":
+            # csv.reader pulls one line at a time, so self.offset always ends the last record read
+            self.records = csv.reader(self._lines())
+            self.header = next(self.records, None) or []
+        else:
+            self.records = self._lines()
+        if offset is not None:
+            self.file.seek(offset)
+            self.offset = offset
+            self.row_no = row_no
+        # Campaigns checkpointed without offsets: skip to the row the slow way
+        while self.row_no < row_no and self._next() is not None:
+            pass
+
+    def _lines(self):
+        for line in iter(self.file.readline, b""):
+            self.offset += len(line)
+            yield line.decode("utf-8")
+
+    def _next(self):
+        """The next row as a dict, skipping blank records, or None at the end"""
+        for record in self.records:
+            if self.fmt == "csv":
+                if record:
+                    self.row_no += 1
+                    return dict(zip(self.header, record))
+            elif record.strip():
+                self.row_no += 1
+                return json.loads(record)
+        return None
+
+    def read(self, count=ROW_BATCH):
+        """Up to `count` (row_no, offset, next_offset, row) tuples; empty at the end of the file"""
+        rows = []
+        while len(rows) < count:
+            offset = self.offset
+            row = self._next()
+            if row is None:
+                break
+            rows.append((self.row_no - 1, offset, self.offset, row))
+        return rows
+
+    def close(self):
+        self.file.close()
+
+
+def valid_recipient(recipient):
+    """Same acceptance rule as the API: 10-15 digit phone or a group JID"""
+    if normalize_group_jid(recipient):
+        return True
+    digits = ''.join(filter(str.isdigit, recipient))
+    return 10 <= len(digits) <= 15
+
+
+class CampaignStore:
+    """SQLite record of campaigns and per-row send checkpoints.
+
+    A row is checkpointed as `sending` before it is handed to the bot, so a
+    crash can never cause it to be sent twice; rows still `sending` on restart
+    are marked `unknown` instead of being retried. Rows the bot refused
+    unsent during a graceful shutdown are `deferred` and sent on resume.
+    """
+
+    def __init__(self, path=CAMPAIGN_DB):
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS campaigns (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    template TEXT NOT NULL,
+                    source_path TEXT NOT NULL,
+                    format TEXT NOT NULL,
+                    phone_column TEXT NOT NULL,
+                    rate REAL NOT NULL,
+                    concurrency INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    next_row INTEGER NOT NULL DEFAULT 0,
+                    next_offset INTEGER,
+                    sent INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    unknown INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS campaign_rows (
+                    campaign_id TEXT NOT NULL,
+                    row_no INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    recipient TEXT,
+                    error TEXT,
+                    offset INTEGER,
+                    PRIMARY KEY (campaign_id, row_no)
+                ) WITHOUT ROWID""")
+            # Stores from before rows were resumed by byte offset
+            for table, column in (("campaigns", "next_offset"), ("campaign_rows", "offset")):
+                columns = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} INTEGER")
+
+    def create(self, campaign):
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO campaigns (id, name, template, source_path, format, phone_column, rate, "
+                "concurrency, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (campaign["id"], campaign["name"], campaign["template"], campaign["source_path"],
+                 campaign["format"], campaign["phone_column"], campaign["rate"],
+                 campaign["concurrency"], "running", now, now)
+            )
+
+    def get(self, campaign_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+        return dict(row) if row else None
+
+    def list(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM campaigns ORDER BY created_at DESC").fetchall()
+        return [dict(row) for row in rows]
+
+    def set_status(self, campaign_id, status, error=None):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE campaigns SET status = ?, last_error = COALESCE(?, last_error), updated_at = ? WHERE id = ?",
+                (status, error, time.time(), campaign_id)
+            )
+
+    def checkpoint(self, campaign_id, row_no, recipient, offset=None, next_offset=None):
+        """Durably mark a row as handed to the bot before sending it.
+
+        `offset` and `next_offset` are the byte offsets the row starts and
+        ends at in the source file, so a resume can seek instead of re-parsing.
+        """
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO campaign_rows (campaign_id, row_no, status, recipient, offset) "
+                "VALUES (?, ?, 'sending', ?, ?)",
+                (campaign_id, row_no, recipient, offset)
+            )
+            self.conn.execute(
+                "UPDATE campaigns SET next_row = MAX(next_row, ?), "
+                "next_offset = CASE WHEN ? > next_row THEN ? ELSE next_offset END WHERE id = ?",
+                (row_no + 1, row_no + 1, next_offset, campaign_id)
+            )
+
+    def record_outcomes(self, campaign_id, outcomes):
+        """Write a batch of (row_no, status, error) and refresh the counters"""
+        if not outcomes:
+            return
+        sent = sum(1 for _, status, _ in outcomes if status == "sent")
+        failed = sum(1 for _, status, _ in outcomes if status == "failed")
+        last_error = next((error for _, status, error in reversed(outcomes) if error), None)
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "UPDATE campaign_rows SET status = ?, error = ? WHERE campaign_id = ? AND row_no = ?",
+                [(status, error, campaign_id, row_no) for row_no, status, error in outcomes]
+            )
+            self.conn.execute(
+                "UPDATE campaigns SET sent = sent + ?, failed = failed + ?, "
+                "last_error = COALESCE(?, last_error), updated_at = ? WHERE id = ?",
+                (sent, failed, last_error, time.time(), campaign_id)
+            )
+
+    def deferred_rows(self, campaign_id):
+        """{row_no: byte offset} of rows deferred at shutdown"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT row_no, offset FROM campaign_rows WHERE campaign_id = ? AND status = 'deferred'", (campaign_id,)
+            ).fetchall()
+        return {row["row_no"]: row["offset"] for row in rows}
+
+    def recover(self, campaign_id):
+        """Mark rows interrupted mid-send as unknown; they are never resent"""
+        with self.lock, self.conn:
+            count = self.conn.execute(
+                "UPDATE campaign_rows SET status = 'unknown' WHERE campaign_id = ? AND status = 'sending'",
+                (campaign_id,)
+            ).rowcount
+            if count:
+                self.conn.execute(
+                    "UPDATE campaigns SET unknown = unknown + ? WHERE id = ?", (count, campaign_id)
+                )
+        return count
+
+
+class CampaignManager:
+    """Runs CSV/NDJSON campaigns as throttled pipelines on the bot loop"""
+
+    def __init__(self, bot, db_path=CAMPAIGN_DB, folder=CAMPAIGN_FOLDER):
+        os.makedirs(folder, exist_ok=True)
+        self.bot = bot
+        self.folder = folder
+        self.store = CampaignStore(db_path)
+        self.tasks = {}
+        self.live = {}
+        self.paused = set()  # checked by runners per row instead of reading the store
+        self.stopping = False
+        self.deferred = 0
+
+    def create(self, stream, fmt, template, name=None, phone_column="phone", rate=5.0, concurrency=4):
+        """Spool an upload to disk in chunks and register the campaign (any thread)"""
+        compiled = CampaignTemplate(template)
+        campaign_id = uuid.uuid4().hex[:12]
+        source_path = os.path.join(self.folder, f"{campaign_id}.{fmt}")
+        with open(source_path, "wb") as f:
+            shutil.copyfileobj(stream, f, COPY_CHUNK_SIZE)
+
+        campaign = {
+            "id": campaign_id,
+            "name": name or campaign_id,
+            "template": compiled.text,
+            "source_path": source_path,
+            "format": fmt,
+            "phone_column": phone_column,
+            "rate": rate,
+            "concurrency": concurrency
+        }
+        self.store.create(campaign)
+        self._schedule(campaign_id)
+        return self.status(campaign_id)
+
+    def pause(self, campaign_id):
+        campaign = self.store.get(campaign_id)
+        if not campaign:
+            return None
+        if campaign["status"] == "running":
+            # The runner notices at the next row and stops after in-flight sends finish
+            self.paused.add(campaign_id)
+            self.store.set_status(campaign_id, "paused")
+        return self.status(campaign_id)
+
+    def resume(self, campaign_id):
+        campaign = self.store.get(campaign_id)
+        if not campaign:
+            return None
+        if campaign["status"] in ("paused", "running", "interrupted"):
+            self.paused.discard(campaign_id)
+            self.store.set_status(campaign_id, "running")
+            self._schedule(campaign_id)
+        return self.status(campaign_id)
+
+    def resume_all(self):
+        """Restart campaigns that were running when the process stopped"""
+        for campaign in self.store.list():
+            if campaign["status"] == "running":
+                self._schedule(campaign["id"])
+
+    def stop(self):
+        """Stop dispatching rows for shutdown; campaigns stay `running` and resume next start"""
+        self.stopping = True
+
+    def running_tasks(self):
+        return [task for task in self.tasks.values() if not task.done()]
+
+    def status(self, campaign_id):
+        campaign = self.store.get(campaign_id)
+        if not campaign:
+            return None
+        live = self.live.get(campaign_id, {})
+        return {
+            "id": campaign["id"],
+            "name": campaign["name"],
+            "status": campaign["status"],
+            "rows_dispatched": campaign["next_row"],
+            "sent": campaign["sent"] + live.get("sent", 0),
+            "failed": campaign["failed"] + live.get("failed", 0),
+            "unknown": campaign["unknown"],
+            "in_flight": live.get("in_flight", 0),
+            "rate": campaign["rate"],
+            "last_error": campaign["last_error"],
+            "created_at": campaign["created_at"],
+            "updated_at": campaign["updated_at"]
+        }
+
+    def list(self):
+        return [self.status(campaign["id"]) for campaign in self.store.list()]
+
+    def _schedule(self, campaign_id):
+        if not self.bot.loop:
+            return  # Picked up by resume_all once the bot is connected
+        self.bot.loop.call_soon_threadsafe(self._start, campaign_id)
+
+    def _start(self, campaign_id):
+        if self.stopping:
+            return
+        task = self.tasks.get(campaign_id)
+        if task and not task.done():
+            return  # a runner still draining after a pause restarts itself in _run_done
+        task = self.tasks[campaign_id] = asyncio.ensure_future(self._run(campaign_id))
+        task.add_done_callback(lambda task: self._run_done(campaign_id, task))
+
+    def _run_done(self, campaign_id, task):
+        """Start again if the campaign was resumed while its paused runner drained in-flight sends"""
+        if task.cancelled() or task.exception() or task.result() != "paused":
+            return
+        if campaign_id not in self.paused:
+            self._start(campaign_id)
+
+    def _prepare(self, campaign_id):
+        """Blocking start of a run: recover interrupted rows, open the source at the first row to send"""
+        campaign = self.store.get(campaign_id)
+        recovered = self.store.recover(campaign_id)
+        if recovered:
+            print(f"⚠️ Campaign {campaign_id}: {recovered} rows interrupted mid-send, not resending")
+
+        deferred = self.store.deferred_rows(campaign_id)
+        if deferred:
+            print(f"🔁 Campaign {campaign_id}: resending {len(deferred)} rows deferred at shutdown")
+        start = min(set(deferred) | {campaign["next_row"]})
+        offset = deferred[start] if start in deferred else campaign["next_offset"]
+        reader = RowReader(campaign["source_path"], campaign["format"], start, offset)
+        return campaign, set(deferred), reader
+
+    async def _run(self, campaign_id):
+        try:
+            campaign, deferred, reader = await asyncio.to_thread(self._prepare, campaign_id)
+        except Exception as e:
+            await asyncio.to_thread(self.store.set_status, campaign_id, "interrupted", str(e))
+            print(f"❌ Campaign {campaign_id} interrupted: {e}")
+            return
+        try:
+            return await self._dispatch(campaign_id, campaign, deferred, reader)
+        finally:
+            reader.close()
+
+    async def _dispatch(self, campaign_id, campaign, deferred, reader):
+        template = CampaignTemplate(campaign["template"])
+        interval = 1.0 / campaign["rate"] if campaign["rate"] > 0 else 0
+        slots = asyncio.Semaphore(campaign["concurrency"])
+        live = self.live[campaign_id] = {"sent": 0, "failed": 0, "in_flight": 0}
+        pending = []
+        inflight = set()
+        next_send = time.monotonic()
+        last_flush = time.monotonic()
+        print(f"📣 Campaign {campaign_id} running from row {campaign['next_row']}")
+
+        async def flush():
+            batch = pending[:]
+            pending.clear()
+            await asyncio.to_thread(self.store.record_outcomes, campaign_id, batch)
+            live["sent"] -= sum(1 for _, status, _ in batch if status == "sent")
+            live["failed"] -= sum(1 for _, status, _ in batch if status == "failed")
+
+        async def send_row(row_no, phone, text):
+            try:
+                while True:
+                    result = await self.bot.send_message_async(
+                        phone, text, priority="bulk", tag=campaign_tag(campaign_id), dead_letter=False
+                    )
+                    if result.get("code") != "circuit_open":
+                        break
+                    # Nothing was sent; wait for the breaker to probe again
+                    await asyncio.sleep(self.bot.breaker.reset_timeout)
+                if result["status"] == "success":
+                    live["sent"] += 1
+                    pending.append((row_no, "sent", None))
+                elif result.get("code") == "shutting_down":
+                    # Refused before sending; picked up again on resume
+                    self.deferred += 1
+                    pending.append((row_no, "deferred", None))
+                else:
+                    live["failed"] += 1
+                    pending.append((row_no, "failed", result.get("message")))
+            except Exception as e:
+                live["failed"] += 1
+                pending.append((row_no, "failed", str(e)))
+            finally:
+                live["in_flight"] -= 1
+                slots.release()
+
+        async def rows():
+            while True:
+                batch = await asyncio.to_thread(reader.read)
+                if not batch:
+                    return
+                for item in batch:
+                    yield item
+
+        try:
+            async for row_no, offset, next_offset, row in rows():
+                if self.stopping or campaign_id in self.paused:
+                    break
+                if row_no < campaign["next_row"] and row_no not in deferred:
+                    continue
+
+                phone = str(row.get(campaign["phone_column"]) or "").strip()
+                if not valid_recipient(phone):
+                    await asyncio.to_thread(self.store.checkpoint, campaign_id, row_no, phone, offset, next_offset)
+                    live["failed"] += 1
+                    pending.append((row_no, "failed", "Invalid phone number"))
+                    continue
+
+                while not self.bot.is_connected and not self.stopping:
+                    await asyncio.sleep(1)
+                if self.stopping:
+                    break
+
+                now = time.monotonic()
+                if next_send > now:
+                    await asyncio.sleep(next_send - now)
+                next_send = max(next_send, now) + interval
+
+                await slots.acquire()
+                if self.stopping:
+                    slots.release()
+                    break
+                await asyncio.to_thread(self.store.checkpoint, campaign_id, row_no, phone, offset, next_offset)
+                live["in_flight"] += 1
+                task = asyncio.ensure_future(send_row(row_no, phone, template.render(row)))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+
+                if time.monotonic() - last_flush >= FLUSH_INTERVAL:
+                    await flush()
+                    last_flush = time.monotonic()
+            else:
+                if inflight:
+                    await asyncio.wait(inflight)
+                await flush()
+                await asyncio.to_thread(self.store.set_status, campaign_id, "completed")
+                print(f"✅ Campaign {campaign_id} completed")
+                return
+
+            if inflight:
+                await asyncio.wait(inflight)
+            await flush()
+            print(f"⏸️ Campaign {campaign_id} {'stopped for shutdown' if self.stopping else 'paused'}")
+            return "paused"
+        except asyncio.CancelledError:
+            await asyncio.shield(asyncio.to_thread(self.store.record_outcomes, campaign_id, pending[:]))
+            raise
+        except Exception as e:
+            if inflight:
+                await asyncio.wait(inflight)
+            await flush()
+            await asyncio.to_thread(self.store.set_status, campaign_id, "interrupted", str(e))
+            print(f"❌ Campaign {campaign_id} interrupted: {e}")
+        finally:
+            self.live.pop(campaign_id, None)
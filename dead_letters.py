@@ -0,0 +1,139 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from handover import bind_send_arguments, keep_file
+
+DEAD_LETTER_DB = "data/dead_letters.sqlite3"
+DEAD_LETTER_FOLDER = "data/dead_letters"  # copies of uploads for dead media sends
+
+
+class DeadLetterStore:
+    """SQLite record of sends that failed permanently or ran out of retries.
+
+    Each entry keeps the send_*_async method and its arguments, so it can be
+    inspected and requeued later; media uploads are copied aside and removed
+    once the entry is sent or discarded.
+    """
+
+    def __init__(self, path=DEAD_LETTER_DB, folder=DEAD_LETTER_FOLDER):
+        self.folder = folder
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS dead_letters (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    method TEXT NOT NULL,
+                    arguments TEXT NOT NULL,
+                    priority TEXT NOT NULL,
+                    recipient TEXT,
+                    error_class TEXT NOT NULL,
+                    error TEXT,
+                    attempts INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'dead',
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    tag TEXT
+                )""")
+            columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(dead_letters)")}
+            if "tag" not in columns:
+                # Entries stored before sends were tagged
+                self.conn.execute("ALTER TABLE dead_letters ADD COLUMN tag TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS dead_letters_status ON dead_letters (status, error_class)")
+
+    def add(self, func, args, kwargs, priority, result, attempts, tag=None):
+        arguments = bind_send_arguments(func, args, kwargs)
+        if arguments.get("filepath") and os.path.exists(arguments["filepath"]):
+            arguments["filepath"] = keep_file(arguments["filepath"], self.folder)
+        now = time.time()
+        with self.lock, self.conn:
+            return self.conn.execute(
+                "INSERT INTO dead_letters (method, arguments, priority, recipient, error_class, error, "
+                "attempts, created_at, updated_at, tag) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (func.__name__, json.dumps(arguments), priority, arguments.get("phone"),
+                 result.get("code"), result.get("message"), attempts, now, now, tag)
+            ).lastrowid
+
+    def _entry(self, row):
+        entry = dict(row)
+        entry["arguments"] = json.loads(entry["arguments"])
+        return entry
+
+    def get(self, entry_id):
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM dead_letters WHERE id = ?", (entry_id,)).fetchone()
+        return self._entry(row) if row else None
+
+    def list(self, status="dead", error_class=None, limit=50, offset=0):
+        sql = "SELECT * FROM dead_letters WHERE status = ?"
+        params = [status]
+        if error_class:
+            sql += " AND error_class = ?"
+            params.append(error_class)
+        sql += " ORDER BY id DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def claim(self, entry_ids=None, error_class=None, limit=1000):
+        """Move dead entries (by id, or by class) to `requeued` and return them"""
+        sql = "SELECT * FROM dead_letters WHERE status = 'dead'"
+        params = []
+        if entry_ids is not None:
+            sql += f" AND id IN ({','.join('?' * len(entry_ids))})"
+            params += list(entry_ids)
+        if error_class:
+            sql += " AND error_class = ?"
+            params.append(error_class)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        with self.lock, self.conn:
+            rows = self.conn.execute(sql, params).fetchall()
+            self.conn.executemany(
+                "UPDATE dead_letters SET status = 'requeued', updated_at = ? WHERE id = ?",
+                [(time.time(), row["id"]) for row in rows]
+            )
+        return [self._entry(row) for row in rows]
+
+    def resolve(self, entry, result, attempts):
+        """Outcome of a requeued entry: sent (file removed) or back to dead with the new error"""
+        sent = result["status"] == "success"
+        with self.lock, self.conn:
+            self.conn.execute(
+                "UPDATE dead_letters SET status = ?, error_class = COALESCE(?, error_class), "
+                "error = COALESCE(?, error), attempts = attempts + ?, updated_at = ? WHERE id = ?",
+                ("sent" if sent else "dead", None if sent else result.get("code"),
+                 None if sent else result.get("message"), attempts, time.time(), entry["id"])
+            )
+        if sent:
+            self._remove_file(entry)
+
+    def discard(self, entry_id):
+        entry = self.get(entry_id)
+        if not entry:
+            return False
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM dead_letters WHERE id = ?", (entry_id,))
+        self._remove_file(entry)
+        return True
+
+    def _remove_file(self, entry):
+        filepath = entry["arguments"].get("filepath")
+        if filepath and filepath.startswith(self.folder) and os.path.exists(filepath):
+            os.remove(filepath)
+
+    def snapshot(self):
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT status, error_class, COUNT(*) AS n FROM dead_letters GROUP BY status, error_class"
+            ).fetchall()
+        counts = {}
+        for row in rows:
+            counts.setdefault(row["status"], {})[row["error_class"]] = row["n"]
+        return counts
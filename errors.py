@@ -0,0 +1,75 @@
+import asyncio
+import random
+import re
+
+# Send failure classes
+TRANSIENT = "transient"                          # network blips, upload/server timeouts
+RATE_LIMITED = "rate_limited"                    # WhatsApp throttling this account
+PERMANENT_RECIPIENT = "permanent_recipient"      # bad JID, not on WhatsApp, not allowed in group
+PERMANENT_MEDIA = "permanent_media"              # missing, corrupt or rejected file
+SESSION = "session"                              # logged out / not paired; needs an operator
+UNKNOWN = "unknown"
+
+FAILURE_CLASSES = {TRANSIENT, RATE_LIMITED, PERMANENT_RECIPIENT, PERMANENT_MEDIA, SESSION, UNKNOWN}
+RETRYABLE = {TRANSIENT, RATE_LIMITED}
+
+# Checked in order; the first class whose pattern matches the error text wins
+ERROR_PATTERNS = [
+    (SESSION, re.compile(r"not logged in|logged out|log ?out|\b401\b|unpaired|conflict|session (expired|revoked)|not connected to whatsapp", re.I)),
+    (RATE_LIMITED, re.compile(r"rate.?(over)?limit|too many requests|\b429\b|\b463\b", re.I)),
+    (TRANSIENT, re.compile(r"time.?out|deadline exceeded|websocket not connected|connection (reset|refused|closed|aborted)|broken pipe|\beof\b|temporar|\b50[0234]\b|try again", re.I)),
+    (PERMANENT_RECIPIENT, re.compile(r"jid|not on whatsapp|no such user|item.not.found|\b404\b|not.authorized|forbidden|\b403\b|not a (group )?participant|recipient", re.I)),
+    (PERMANENT_MEDIA, re.compile(r"file not found|no such file|media|mime|unsupported|corrupt|decode|too large|\b413\b|\b415\b|thumbnail|build .* message", re.I)),
+]
+# Transient send failures raised before the request is written, so nothing can have been delivered
+NOT_SENT_PATTERN = re.compile(r"websocket not connected|connection refused", re.I)
+
+
+class DeliveryUnknown(Exception):
+    """client.send_message failed after the message may have gone out; retrying could deliver it twice"""
+
+    def __init__(self, error):
+        super().__init__(str(error))
+        self.error_class = classify(error)
+
+
+def classify(error):
+    """Failure class of an exception or error message"""
+    if isinstance(error, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return TRANSIENT
+    if isinstance(error, (FileNotFoundError, IsADirectoryError)):
+        return PERMANENT_MEDIA
+    text = str(error)
+    for error_class, pattern in ERROR_PATTERNS:
+        if pattern.search(text):
+            return error_class
+    return UNKNOWN
+
+
+def delivery_unknown(error):
+    """Whether a failed client.send_message may still have delivered the message"""
+    if isinstance(error, ConnectionRefusedError) or NOT_SENT_PATTERN.search(str(error)):
+        return False
+    return classify(error) in (TRANSIENT, UNKNOWN)
+
+
+def send_error(error, error_class=None):
+    """Error result for a failed send, tagged with its class"""
+    uncertain = isinstance(error, DeliveryUnknown)
+    error_class = error_class or (error.error_class if uncertain else classify(error))
+    result = {
+        "status": "error",
+        "code": error_class,
+        "retryable": error_class in RETRYABLE and not uncertain,
+        "message": str(error)
+    }
+    if uncertain:
+        result["delivery"] = "unknown"
+    return result
+
+
+def backoff_delay(attempt, error_class, base=0.5, cap=8.0):
+    """Full-jitter exponential backoff; rate limits back off four times harder"""
+    if error_class == RATE_LIMITED:
+        base *= 4
+    return random.uniform(0, min(cap, base * 2 ** attempt))
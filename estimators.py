@@ -0,0 +1,228 @@
+import math
+import os
+import threading
+import time
+
+MB = 1024 * 1024
+# Cold-start timeouts (seconds) per send type, used until a type has enough samples
+DEFAULT_TIMEOUTS = {
+    "text": 30,
+    "image": 60,
+    "document": 60,
+    "audio": 90,
+    "video": 120,
+    "sticker": 30,
+    "group": 30
+}
+# (min, max) seconds an adaptive timeout may take; override with e.g.
+# WA_SEND_TIMEOUT_BOUNDS="text=5:30,video=30:1200"
+DEFAULT_BOUNDS = {
+    "text": (10, 60),
+    "image": (15, 120),
+    "document": (15, 300),
+    "audio": (15, 300),
+    "video": (20, 900),
+    "sticker": (10, 60),
+    "group": (30, 30)
+}
+SMALL_UPLOAD = 256 * 1024   # uploads below this only measure per-upload overhead
+REFERENCE_UPLOAD = MB       # payload size upload latencies are scaled to for the upload limiter
+WARMUP_SAMPLES = 5
+SAFETY_FACTOR = 2.0         # headroom over the pessimistic estimate
+SPREAD = 3.0                # standard deviations above the mean
+
+
+def parse_bounds(spec, defaults=DEFAULT_BOUNDS):
+    """DEFAULT_BOUNDS overridden by a "type=min:max,..." string"""
+    bounds = dict(defaults)
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        try:
+            kind, limits = item.split("=")
+            low, high = (float(v) for v in limits.split(":"))
+        except ValueError:
+            print(f"⚠️ Ignoring malformed timeout bound {item!r}")
+            continue
+        bounds[kind.strip()] = (min(low, high), max(low, high))
+    return bounds
+
+
+class RollingEstimate:
+    """Exponentially weighted mean and variance of a stream of samples"""
+
+    def __init__(self, alpha=0.1):
+        self.alpha = alpha
+        self.mean = None
+        self.variance = 0.0
+        self.count = 0
+
+    def add(self, sample):
+        self.count += 1
+        if self.mean is None:
+            self.mean = sample
+            return
+        diff = sample - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+
+    def upper(self, spread=SPREAD):
+        """Pessimistic value: mean plus `spread` standard deviations"""
+        return self.mean + spread * math.sqrt(self.variance)
+
+    def snapshot(self, scale=1.0):
+        if self.mean is None:
+            return {"count": 0}
+        return {
+            "count": self.count,
+            "mean": round(self.mean * scale, 3),
+            "std": round(math.sqrt(self.variance) * scale, 3)
+        }
+
+
+class SendClock:
+    """Adaptive timeout of one send, counting only the time it is being served.
+
+    The clock is paused while the send queues (chat turn, priority lane,
+    concurrency limiter), so a backlog of bulk sends does not use up the
+    budget of the sends behind it. Read from the caller's thread too.
+    """
+
+    def __init__(self, kind, nbytes, timeout):
+        self.kind = kind
+        self.nbytes = nbytes
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.queued_s = 0.0
+        self.paused_at = None
+
+    def pause(self):
+        if self.paused_at is None:
+            self.paused_at = time.monotonic()
+
+    def resume(self):
+        if self.paused_at is not None:
+            self.queued_s += time.monotonic() - self.paused_at
+            self.paused_at = None
+
+    def _queued(self):
+        paused_at = self.paused_at
+        return self.queued_s + (time.monotonic() - paused_at if paused_at is not None else 0.0)
+
+    @property
+    def expires(self):
+        """time.monotonic() at which the send has used up its timeout"""
+        return self.started + self._queued() + self.timeout
+
+    def service_time(self):
+        return time.monotonic() - self.started - self._queued()
+
+
+class SendDeadlines:
+    """Per-request send timeouts from rolling latency and upload-speed estimates.
+
+    A send's expected duration is the send_message round trip, plus for media
+    the per-upload overhead and payload size times seconds per byte. All of
+    these are tracked per type, and the upload speed is also pooled across
+    types for types with no samples yet. The timeout is SAFETY_FACTOR times
+    the pessimistic estimate, clamped to the type's bounds. A send that times
+    out on its adaptive deadline feeds the elapsed time back as a lower-bound
+    sample, so a link that slows down does not keep timing out. Thread-safe.
+    """
+
+    def __init__(self, defaults=DEFAULT_TIMEOUTS, bounds=None, alpha=0.1):
+        self.defaults = defaults
+        self.bounds = bounds or parse_bounds(os.environ.get("WA_SEND_TIMEOUT_BOUNDS"))
+        self.alpha = alpha
+        self._send = {}
+        self._overhead = {}
+        self._per_byte = {}
+        self.timeouts = {}
+        self._lock = threading.Lock()
+
+    def _estimate(self, table, kind):
+        estimate = table.get(kind)
+        if estimate is None:
+            estimate = table[kind] = RollingEstimate(self.alpha)
+        return estimate
+
+    def record_send(self, kind, seconds):
+        with self._lock:
+            self._estimate(self._send, kind).add(seconds)
+
+    def record_upload(self, kind, nbytes, seconds):
+        with self._lock:
+            overhead = self._estimate(self._overhead, kind)
+            if nbytes < SMALL_UPLOAD:
+                overhead.add(seconds)
+                return
+            transfer = max(seconds - (overhead.mean or 0.0), seconds / 2)
+            self._estimate(self._per_byte, kind).add(transfer / nbytes)
+            self._estimate(self._per_byte, "all").add(transfer / nbytes)
+
+    def upload_latency(self, kind, nbytes, seconds):
+        """An upload's duration rescaled to a REFERENCE_UPLOAD payload at the same transfer rate"""
+        if nbytes < SMALL_UPLOAD:
+            return seconds
+        with self._lock:
+            overhead = self._overhead.get(kind)
+            base = overhead.mean if overhead is not None and overhead.mean is not None else 0.0
+        transfer = max(seconds - base, seconds / 2)
+        return base + transfer * REFERENCE_UPLOAD / nbytes
+
+    def record_timeout(self, kind, elapsed, nbytes=0):
+        """A send ran into its adaptive deadline: it needed at least `elapsed` seconds"""
+        with self._lock:
+            self.timeouts[kind] = self.timeouts.get(kind, 0) + 1
+            if nbytes >= SMALL_UPLOAD:
+                sample = elapsed / nbytes
+                self._estimate(self._per_byte, kind).add(sample)
+                self._estimate(self._per_byte, "all").add(sample)
+            else:
+                self._estimate(self._send, kind).add(elapsed)
+
+    def timeout(self, kind, nbytes=0):
+        """Seconds to allow a `kind` send of `nbytes` payload"""
+        low, high = self.bounds.get(kind, (self.defaults[kind], self.defaults[kind]))
+        with self._lock:
+            expected = self._expected(kind, nbytes)
+        if expected is None:
+            return min(max(self.defaults[kind], low), high)
+        return min(max(SAFETY_FACTOR * expected, low), high)
+
+    def _expected(self, kind, nbytes):
+        send = self._send.get(kind)
+        if send is None or send.count < WARMUP_SAMPLES:
+            return None
+        expected = send.upper()
+        if kind in ("text", "group"):
+            return expected
+        overhead = self._overhead.get(kind)
+        if overhead is not None and overhead.count >= WARMUP_SAMPLES:
+            expected += overhead.upper()
+        if nbytes >= SMALL_UPLOAD:
+            per_byte = self._per_byte.get(kind)
+            if per_byte is None or per_byte.count < WARMUP_SAMPLES:
+                per_byte = self._per_byte.get("all")
+            if per_byte is None or per_byte.count < WARMUP_SAMPLES:
+                return None
+            expected += per_byte.upper() * nbytes
+        return expected
+
+    def snapshot(self):
+        with self._lock:
+            kinds = sorted(set(self.defaults) | set(self._send) | set(self._overhead))
+            estimates = {
+                kind: {
+                    "send_s": self._send[kind].snapshot() if kind in self._send else {"count": 0},
+                    "upload_overhead_s": self._overhead[kind].snapshot() if kind in self._overhead else {"count": 0},
+                    "upload_s_per_mb": self._per_byte[kind].snapshot(MB) if kind in self._per_byte else {"count": 0},
+                    "timeouts": self.timeouts.get(kind, 0),
+                    "bounds_s": list(self.bounds.get(kind, ())),
+                } for kind in kinds
+            }
+            pooled = self._per_byte["all"].snapshot(MB) if "all" in self._per_byte else {"count": 0}
+        for kind, entry in estimates.items():
+            entry["timeout_s"] = round(self.timeout(kind), 1)
+            if kind not in ("text", "group"):
+                entry["timeout_16mb_s"] = round(self.timeout(kind, 16 * MB), 1)
+        return {"upload_s_per_mb": pooled, "types": estimates}
@@ -0,0 +1,181 @@
+import asyncio
+import re
+import time
+
+GROUP_SERVER = "g.us"
+
+# 120363025246125888 (current); longer than any phone number, so unambiguous when bare
+GROUP_ID_RE = re.compile(r'^\d{16,}$')
+# 6281234567890-1612345678 (legacy): creator phone, hyphen, creation timestamp
+LEGACY_GROUP_ID_RE = re.compile(r'^\d{10,15}-\d{9,10}$')
+
+
+def is_group_id(value, bare_legacy=False):
+    """Whether value is a group JID or a bare group ID.
+
+    A bare legacy ID reads like a hyphenated phone number, so it only counts
+    with its @g.us suffix, or with bare_legacy when the caller expects a group.
+    """
+    if value.endswith("@" + GROUP_SERVER):
+        value = value[:-len(GROUP_SERVER) - 1]
+        return bool(GROUP_ID_RE.match(value) or LEGACY_GROUP_ID_RE.match(value))
+    return bool(GROUP_ID_RE.match(value) or (bare_legacy and LEGACY_GROUP_ID_RE.match(value)))
+
+
+def normalize_group_jid(value, bare_legacy=False):
+    """Return `<id>@g.us` for a group JID / bare group ID, or None"""
+    value = value.strip()
+    if not is_group_id(value, bare_legacy):
+        return None
+    if not value.endswith("@" + GROUP_SERVER):
+        value = f"{value}@{GROUP_SERVER}"
+    return value
+
+
+def jid_to_str(jid):
+    return f"{jid.User}@{jid.Server}"
+
+
+def serialize_group(info):
+    """Plain dict of the GroupInfo fields the API exposes"""
+    return {
+        "jid": jid_to_str(info.JID),
+        "name": info.GroupName.Name,
+        "topic": info.GroupTopic.Topic,
+        "owner": jid_to_str(info.OwnerJID) if info.OwnerJID.User else None,
+        "announce_only": info.GroupAnnounce.IsAnnounce,
+        "locked": info.GroupLocked.IsLocked,
+        "created": info.GroupCreated,
+        "participants": [
+            {
+                "jid": jid_to_str(p.JID),
+                "is_admin": p.IsAdmin,
+                "is_super_admin": p.IsSuperAdmin
+            }
+            for p in info.Participants
+        ]
+    }
+
+
+class GroupCache:
+    """TTL cache of group metadata and participant lists.
+
+    Entries are filled from get_group_info / get_joined_groups and kept fresh by
+    group-change events, so repeated sends and mention-all messages to the same
+    group do not refetch participants. Concurrent misses for one group share a
+    single fetch. Must only be used from the bot loop.
+    """
+
+    def __init__(self, client, ttl=300):
+        self.client = client
+        self.ttl = ttl
+        self._entries = {}
+        self._pending = {}
+        self._joined = {}  # group JIDs of the last get_joined_groups, plus groups joined since
+        self._groups_listed_at = None
+        self.hits = 0
+        self.misses = 0
+        self.event_updates = 0
+
+    def _fresh(self, entry):
+        return entry is not None and entry[0] > time.monotonic()
+
+    def store(self, info):
+        group = serialize_group(info)
+        self._entries[group["jid"]] = (time.monotonic() + self.ttl, group)
+        return group
+
+    def joined(self, info):
+        """Cache a group the account has just joined and list it"""
+        group = self.store(info)
+        self._joined[group["jid"]] = True
+        return group
+
+    def invalidate(self, jid):
+        self._entries.pop(jid, None)
+
+    async def get_info(self, jid):
+        """Cached group dict for a neonize JID, fetched on miss or expiry"""
+        key = jid_to_str(jid)
+        entry = self._entries.get(key)
+        if self._fresh(entry):
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self.client.get_group_info(jid))
+            self._pending[key] = pending
+            pending.add_done_callback(lambda _: self._pending.pop(key, None))
+        info = await asyncio.shield(pending)
+        return self.store(info)
+
+    async def participants(self, jid):
+        """Participant JID strings of a group"""
+        group = await self.get_info(jid)
+        return [p["jid"] for p in group["participants"]]
+
+    async def list_groups(self, refresh=False):
+        """All joined groups; one get_joined_groups call refreshes every entry.
+
+        Groups missing from that call (left, or removed from) are evicted, so
+        entries cached only through get_info never show up as joined.
+        """
+        listed_recently = (
+            self._groups_listed_at is not None
+            and time.monotonic() - self._groups_listed_at < self.ttl
+            and all(jid in self._entries for jid in self._joined)  # none invalidated since
+        )
+        if refresh or not listed_recently:
+            self.misses += 1
+            joined = {self.store(info)["jid"]: True for info in await self.client.get_joined_groups()}
+            for jid in set(self._joined) - set(joined):
+                self.invalidate(jid)
+            self._joined = joined
+            self._groups_listed_at = time.monotonic()
+        else:
+            self.hits += 1
+        return [self._entries[jid][1] for jid in self._joined]
+
+    def apply_event(self, event):
+        """Patch a cached group from a GroupInfoEv instead of dropping it"""
+        key = jid_to_str(event.JID)
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        self.event_updates += 1
+        try:
+            group = entry[1]
+            if event.HasField("Name"):
+                group["name"] = event.Name.Name
+            if event.HasField("Topic"):
+                group["topic"] = event.Topic.Topic
+            if event.Join or event.Leave:
+                left = {jid_to_str(j) for j in event.Leave}
+                members = [p for p in group["participants"] if p["jid"] not in left]
+                known = {p["jid"] for p in members}
+                for j in event.Join:
+                    if jid_to_str(j) not in known:
+                        members.append({"jid": jid_to_str(j), "is_admin": False, "is_super_admin": False})
+                group["participants"] = members
+            if event.Promote or event.Demote:
+                promoted = {jid_to_str(j) for j in event.Promote}
+                demoted = {jid_to_str(j) for j in event.Demote}
+                for p in group["participants"]:
+                    if p["jid"] in promoted:
+                        p["is_admin"] = True
+                    elif p["jid"] in demoted:
+                        p["is_admin"] = False
+        except Exception as e:
+            # Unknown event shape: fall back to refetching on next use
+            print(f"⚠️ Group event not applied to cache ({e}), invalidating {key}")
+            self.invalidate(key)
+
+    def snapshot(self):
+        return {
+            "groups_cached": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "event_updates": self.event_updates
+        }
@@ -0,0 +1,147 @@
+import importlib
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+LATENCY_SAMPLES = 500
+
+
+class HandlerStats:
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.samples = deque(maxlen=LATENCY_SAMPLES)
+        self._lock = threading.Lock()
+
+    def record(self, elapsed, ok):
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.errors += 1
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            self.samples.append(elapsed)
+
+    def snapshot(self):
+        with self._lock:
+            ordered = sorted(self.samples)
+            p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] if ordered else None
+            return {
+                "calls": self.calls,
+                "errors": self.errors,
+                "avg_ms": round(self.total_time / self.calls * 1000, 2) if self.calls else None,
+                "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+                "max_ms": round(self.max_time * 1000, 2)
+            }
+
+
+class HandlerRegistry:
+    """Inbound message handlers run off the bot loop, in order per chat.
+
+    Each message is routed to one of `shards` worker threads by a hash of its
+    chat JID, so one conversation is always processed in arrival order while
+    different chats run in parallel. Every shard has a bounded queue; when it
+    is full the message is shed (counted, not processed) instead of letting
+    a slow handler back up into the event loop.
+    """
+
+    def __init__(self, shards=8, queue_size=1000):
+        self.shards = shards
+        self.queue_size = queue_size
+        self.handlers = []
+        self.stats = {}
+        self.dispatched = 0
+        self.shed = 0
+        self._queues = []
+        self._lock = threading.Lock()
+
+    def register(self, func, name=None, types=None):
+        """Add a handler `func(message)`; `types` limits it to e.g. {"text", "image"}"""
+        name = name or f"{func.__module__}.{func.__name__}"
+        self.handlers.append((name, func, set(types) if types else None))
+        self.stats[name] = HandlerStats()
+        return func
+
+    def handler(self, name=None, types=None):
+        """Decorator form of register()"""
+        def decorator(func):
+            return self.register(func, name=name, types=types)
+        return decorator
+
+    def load_plugins(self, module_names):
+        """Import plugin modules; they register themselves with @inbound_handlers.handler()"""
+        for module_name in module_names:
+            module_name = module_name.strip()
+            if not module_name:
+                continue
+            try:
+                importlib.import_module(module_name)
+                print(f"🔌 Handler plugin loaded: {module_name}")
+            except Exception as e:
+                print(f"❌ Error loading handler plugin {module_name}: {e}")
+
+    def start(self):
+        with self._lock:
+            if self._queues:
+                return
+            for i in range(self.shards):
+                q = queue.Queue(maxsize=self.queue_size)
+                self._queues.append(q)
+                threading.Thread(target=self._worker, args=(q,), name=f"inbound-{i}", daemon=True).start()
+
+    def dispatch(self, message):
+        """Queue a message dict for its chat's shard; never blocks. Returns False if shed."""
+        if not self.handlers:
+            return True
+        if not self._queues:
+            self.start()
+        shard = zlib.crc32(message["chat"].encode()) % self.shards
+        try:
+            self._queues[shard].put_nowait(message)
+            self.dispatched += 1
+            return True
+        except queue.Full:
+            self.shed += 1
+            return False
+
+    def _worker(self, q):
+        while True:
+            message = q.get()
+            for name, func, types in self.handlers:
+                if types and message["type"] not in types:
+                    continue
+                started = time.perf_counter()
+                ok = True
+                try:
+                    func(message)
+                except Exception as e:
+                    ok = False
+                    print(f"❌ Handler {name} failed on {message['id']}: {e}")
+                self.stats[name].record(time.perf_counter() - started, ok)
+            q.task_done()
+
+    def drain(self, timeout):
+        """Wait up to `timeout` seconds for queued messages to be handled; returns how many are left"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if not any(q.unfinished_tasks for q in self._queues):
+                return 0
+            time.sleep(0.05)
+        return sum(q.unfinished_tasks for q in self._queues)
+
+    def snapshot(self):
+        return {
+            "shards": self.shards,
+            "queue_depths": [q.qsize() for q in self._queues],
+            "dispatched": self.dispatched,
+            "shed": self.shed,
+            "handlers": {name: stats.snapshot() for name, stats in self.stats.items()}
+        }
+
+
+# Global registry; plugins register on import
+inbound_handlers = HandlerRegistry()
@@ -0,0 +1,88 @@
+import base64
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+HANDOVER_FILE = "data/handover.json"
+HANDOVER_FOLDER = "data/handover"  # copies of uploads for handed-over media sends
+
+
+def bind_send_arguments(func, args, kwargs):
+    """Named arguments of a send_*_async call, so it can be replayed as func(**arguments)"""
+    arguments = inspect.signature(func).bind(None, *args, **kwargs).arguments
+    arguments.pop("self", None)
+    return dict(arguments)
+
+
+def keep_file(filepath, folder):
+    """Copy an upload aside (the request handler deletes the original); returns the copy's path"""
+    os.makedirs(folder, exist_ok=True)
+    kept = os.path.join(folder, f"{uuid.uuid4().hex[:12]}-{os.path.basename(filepath)}")
+    shutil.copyfile(filepath, kept)
+    return kept
+
+
+def handed_over_result():
+    return {
+        "status": "accepted",
+        "code": "handed_over",
+        "message": "Server restarting; the message will be sent after restart"
+    }
+
+
+class HandoverStore:
+    """Sends and downloads a shutting-down process passes to the next one.
+
+    Collected on the bot loop while draining, written once as a JSON file at
+    the end of shutdown and consumed (then deleted) by the next process once
+    it is connected. Uploaded files of media sends are copied aside, since
+    the request handler deletes its upload as soon as it gets a response.
+    """
+
+    def __init__(self, path=HANDOVER_FILE, folder=HANDOVER_FOLDER):
+        self.path = path
+        self.folder = folder
+        self.sends = []
+        self.downloads = []
+
+    def add_send(self, func, args, kwargs, priority, tag=None):
+        """Record a send_*_async call that never got a slot"""
+        arguments = bind_send_arguments(func, args, kwargs)
+        if arguments.get("filepath"):
+            arguments["filepath"] = keep_file(arguments["filepath"], self.folder)
+        self.sends.append({"method": func.__name__, "arguments": arguments, "priority": priority, "tag": tag})
+        return handed_over_result()
+
+    def add_download(self, chat, message_id, message, mimetype):
+        self.downloads.append({
+            "chat": chat,
+            "id": message_id,
+            "message": base64.b64encode(message.SerializeToString()).decode(),
+            "mimetype": mimetype
+        })
+
+    def save(self, report):
+        """Atomically write everything collected plus the shutdown report"""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        state = {"written_at": time.time(), "report": report, "sends": self.sends, "downloads": self.downloads}
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path) or ".", prefix=".handover-")
+        with os.fdopen(fd, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.path)
+
+    def take(self):
+        """State left by the previous process, or None; the file is removed once read"""
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except FileNotFoundError:
+            return None
+        except ValueError as e:
+            print(f"⚠️ Ignoring unreadable handover file: {e}")
+            state = None
+        os.remove(self.path)
+        return state
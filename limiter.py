@@ -0,0 +1,197 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit for calls made on the bot loop.
+
+    The limit grows by one slot per window of healthy calls (additive increase)
+    and is cut by `backoff` whenever a call fails or its latency drifts well
+    above the best latency seen recently (multiplicative decrease). Waiters
+    are woken by `priority` (lower first), FIFO within a priority. Must only
+    be used from a single event loop.
+    """
+
+    def __init__(self, name, initial=8, min_limit=1, max_limit=64,
+                 backoff=0.75, tolerance=2.0, baseline_decay=0.01):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.baseline_decay = baseline_decay
+        self.inflight = 0
+        self.baseline = None
+        self.last_latency = None
+        self.successes = 0
+        self.failures = 0
+        self.cancelled = 0
+        self._waiters = {}  # priority -> deque of futures
+
+    @asynccontextmanager
+    async def slot(self, scale=None, priority=0):
+        """Hold one concurrency slot; latency and failures feed the limit.
+
+        `scale` maps the measured latency before it is compared with the
+        baseline, e.g. onto a reference payload size so calls of very
+        different sizes share one baseline.
+        """
+        await self.acquire(priority)
+        started = time.monotonic()
+        ok = False
+        try:
+            yield
+            ok = True
+        except asyncio.CancelledError:
+            # The caller gave up (client deadline, shutdown); says nothing about WhatsApp
+            ok = None
+            raise
+        finally:
+            latency = time.monotonic() - started
+            self.release(scale(latency) if scale else latency, ok)
+
+    def waiting(self):
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    async def acquire(self, priority=0):
+        if self.inflight < int(self.limit) and not self.waiting():
+            self.inflight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        waiters = self._waiters.setdefault(priority, deque())
+        waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in waiters:
+                waiters.remove(waiter)
+            elif not waiter.cancelled() and waiter.exception() is None:
+                # Slot was handed over just as we were cancelled; pass it on
+                self.inflight -= 1
+                self._wake()
+            raise
+
+    def release(self, latency, ok):
+        """Free a slot; ok=None (cancelled) leaves the limit and latency stats untouched"""
+        self.inflight -= 1
+        if ok is None:
+            self.cancelled += 1
+            self._wake()
+            return
+        self.last_latency = latency
+        if ok:
+            self.successes += 1
+            self._on_success(latency)
+        else:
+            self.failures += 1
+            self._decrease()
+        self._wake()
+
+    def _wake(self):
+        while self.inflight < int(self.limit):
+            waiters = next((self._waiters[p] for p in sorted(self._waiters) if self._waiters[p]), None)
+            if waiters is None:
+                return
+            waiter = waiters.popleft()
+            if not waiter.done():
+                self.inflight += 1
+                waiter.set_result(None)
+
+    def _on_success(self, latency):
+        if self.baseline is None or latency < self.baseline:
+            self.baseline = latency
+        else:
+            # Let the baseline creep up so a permanently slower uplink is re-learned
+            self.baseline += (latency - self.baseline) * self.baseline_decay
+
+        if latency > self.baseline * self.tolerance:
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def _decrease(self):
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+
+    def snapshot(self):
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "waiting": self.waiting(),
+            "baseline_latency_ms": round(self.baseline * 1000, 1) if self.baseline is not None else None,
+            "last_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            "successes": self.successes,
+            "failures": self.failures,
+            "cancelled": self.cancelled
+        }
+
+
+class CircuitBreaker:
+    """Fast-fail sends after repeated WhatsApp errors, probing periodically for recovery.
+
+    closed -> open after `failure_threshold` consecutive failures; open ->
+    half_open once `reset_timeout` has passed, letting one probe through every
+    `reset_timeout` until a call succeeds and the circuit closes again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = None
+        self.last_probe = None
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a new send may proceed right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self.last_probe = None
+            if self.state == self.HALF_OPEN:
+                if self.last_probe is None or now - self.last_probe >= self.reset_timeout:
+                    self.last_probe = now
+                    return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                print("✅ Circuit closed, WhatsApp calls recovered")
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.consecutive_failures += 1
+            if self.state == self.HALF_OPEN or (
+                self.state == self.CLOSED and self.consecutive_failures >= self.failure_threshold
+            ):
+                if self.state == self.CLOSED:
+                    self.times_opened += 1
+                    print(f"🚫 Circuit opened after {self.consecutive_failures} failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.consecutive_failures,
+                "times_opened": self.times_opened,
+                "rejected": self.rejected
+            }
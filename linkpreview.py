@@ -0,0 +1,319 @@
+import asyncio
+import concurrent.futures
+import http.client
+import io
+import ipaddress
+import os
+import re
+import socket
+import ssl
+import threading
+import time
+from collections import OrderedDict
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlsplit
+
+try:
+    from PIL import Image
+except ImportError:  # Thumbnails are then only used when already small JPEGs
+    Image = None
+
+URL_RE = re.compile(r'https?://[^\s<>"\']+', re.IGNORECASE)
+FETCH_TIMEOUT = 3.0           # seconds per connect/read
+PREVIEW_WAIT = 1.5            # seconds a text send waits for its preview before going out without one
+MAX_HTML_BYTES = 256 * 1024   # Open Graph tags live in <head>
+MAX_IMAGE_BYTES = 2 * 1024 * 1024
+MAX_THUMBNAIL_BYTES = 64 * 1024
+THUMBNAIL_SIZE = 300
+MAX_REDIRECTS = 3
+USER_AGENT = "WhatsApp/2.23 (link preview)"
+# Only set for local testing; by default private and loopback hosts are never fetched
+ALLOW_PRIVATE_HOSTS = os.environ.get("WA_LINK_PREVIEW_ALLOW_PRIVATE", "").lower() in ("1", "true", "yes")
+
+
+def find_url(text):
+    """First http(s) URL in text, without trailing punctuation"""
+    match = URL_RE.search(text or "")
+    return match.group(0).rstrip(".,;:!?)]}") if match else None
+
+
+class OpenGraphParser(HTMLParser):
+    """Collects og:* / description meta tags and <title>"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+        self.title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key and attrs.get("content") and key not in self.meta:
+                self.meta[key] = attrs["content"].strip()
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+class PinnedHTTPSConnection(http.client.HTTPSConnection):
+    """HTTPS connection to an address resolved beforehand, with SNI and certificate check for hostname"""
+
+    def __init__(self, address, hostname, port, timeout, context):
+        super().__init__(address, port, timeout=timeout, context=context)
+        self.hostname = hostname
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.hostname)
+
+
+def host_header(host, port, scheme):
+    """Host header value; connections are made to an address, so it is always sent explicitly"""
+    name = f"[{host}]" if ":" in host else host
+    return name if port == (443 if scheme == "https" else 80) else f"{name}:{port}"
+
+
+class HTTPPool:
+    """Keep-alive http.client connections reused per (scheme, host, port). Thread-safe.
+
+    Each host is resolved once per connection and the connection is made to
+    the address that passed the private-address check, so a name that
+    re-resolves elsewhere (DNS rebinding) cannot slip past it.
+    """
+
+    def __init__(self, timeout=FETCH_TIMEOUT, max_idle_per_host=4):
+        self.timeout = timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._ssl = ssl.create_default_context()
+        self.connections_opened = 0
+
+    def _connect(self, key):
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+        scheme, host, port = key
+        addresses = [info[4][0] for info in socket.getaddrinfo(host, port, proto=socket.IPPROTO_TCP)]
+        if not ALLOW_PRIVATE_HOSTS:
+            for address in map(ipaddress.ip_address, addresses):
+                if address.is_private or address.is_loopback or address.is_link_local:
+                    raise ValueError(f"Refusing to fetch private address {address}")
+        self.connections_opened += 1
+        if scheme == "https":
+            return PinnedHTTPSConnection(addresses[0], host, port, self.timeout, self._ssl), False
+        return http.client.HTTPConnection(addresses[0], port, timeout=self.timeout), False
+
+    def _release(self, key, conn):
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_host:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def get(self, url, max_bytes):
+        """GET url following redirects; returns (status, content_type, body[:max_bytes])"""
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in ("http", "https") or not parts.hostname:
+                raise ValueError(f"Unsupported URL {url}")
+            key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+            path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+            status, headers, body = self._request(key, path, max_bytes)
+            if status in (301, 302, 303, 307, 308) and headers.get("location"):
+                url = urljoin(url, headers["location"])
+                continue
+            return status, headers.get("content-type", ""), body
+        raise ValueError("Too many redirects")
+
+    def _request(self, key, path, max_bytes, retry=True):
+        conn, reused = self._connect(key)
+        try:
+            scheme, host, port = key
+            headers = {"Host": host_header(host, port, scheme), "User-Agent": USER_AGENT, "Accept": "*/*"}
+            conn.request("GET", path, headers=headers)
+            response = conn.getresponse()
+        except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+            conn.close()
+            if not (reused and retry):
+                raise
+            # Server dropped an idle keep-alive connection; retry once on a fresh one
+            with self._lock:
+                for idle in self._idle.pop(key, []):
+                    idle.close()
+            return self._request(key, path, max_bytes, retry=False)
+        except Exception:
+            conn.close()
+            raise
+        return self._finish(key, conn, response, max_bytes)
+
+    def _finish(self, key, conn, response, max_bytes):
+        headers = {k.lower(): v for k, v in response.getheaders()}
+        body = response.read(max_bytes + 1)
+        if len(body) > max_bytes or response.will_close or not response.isclosed():
+            # Unread remainder or server-side close: the connection can't be reused
+            conn.close()
+        else:
+            self._release(key, conn)
+        return response.status, headers, body[:max_bytes]
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for conn in idle:
+                    conn.close()
+            self._idle.clear()
+
+
+def make_thumbnail(data, content_type):
+    """JPEG thumbnail bytes for an image, or None"""
+    if Image is not None:
+        try:
+            image = Image.open(io.BytesIO(data))
+            image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE))
+            out = io.BytesIO()
+            image.convert("RGB").save(out, "JPEG", quality=70)
+            return out.getvalue()
+        except Exception:
+            return None
+    if "jpeg" in content_type and len(data) <= MAX_THUMBNAIL_BYTES:
+        return data
+    return None
+
+
+class LinkPreviewer:
+    """Open Graph metadata and thumbnails per URL, cached with TTL and LRU eviction.
+
+    Fetching runs on a small thread pool with a keep-alive connection pool,
+    so the bot loop never blocks on a slow page. Concurrent misses for one
+    URL share a single fetch, and failures are cached briefly too, so a
+    campaign linking to the same landing page fetches it once. Must only be
+    used from the bot loop.
+    """
+
+    def __init__(self, ttl=3600, failure_ttl=300, max_entries=1000, workers=4):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+        self.pool = HTTPPool()
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="link-preview")
+        self._entries = OrderedDict()
+        self._pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self.prefetching = 0  # sends waiting for their preview
+
+    async def prefetch(self, text, timeout=PREVIEW_WAIT):
+        """Fetch the preview for the first URL in text, waiting at most `timeout` seconds (never raises).
+
+        A fetch still running at the timeout carries on and fills the cache
+        for later sends.
+        """
+        url = find_url(text)
+        if not url:
+            return
+        self.prefetching += 1
+        try:
+            await asyncio.wait_for(self.get(url), timeout)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Link preview for {url} not ready after {timeout}s, sending without")
+        except Exception as e:
+            print(f"⚠️ Link preview failed for {url}: {e}")
+        finally:
+            self.prefetching -= 1
+
+    def cached(self, text):
+        """Cached preview for the first URL in text, or None; never fetches"""
+        url = find_url(text)
+        entry = self._entries.get(url) if url else None
+        if entry is None or entry[0] <= time.monotonic():
+            return None
+        self._entries.move_to_end(url)
+        return entry[1]
+
+    async def get(self, url):
+        entry = self._entries.get(url)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(url)
+            self.hits += 1
+            return entry[1]
+
+        pending = self._pending.get(url)
+        if pending is None:
+            self.misses += 1
+            pending = asyncio.get_running_loop().run_in_executor(self._executor, self._fetch, url)
+            self._pending[url] = pending
+            pending.add_done_callback(lambda future: self._store(url, future))
+        else:
+            self.hits += 1  # shares the fetch already in flight
+        return await asyncio.shield(pending)
+
+    def _store(self, url, future):
+        self._pending.pop(url, None)
+        if future.cancelled():
+            return
+        preview = None if future.exception() else future.result()
+        if preview is None:
+            self.failures += 1
+        ttl = self.ttl if preview else self.failure_ttl
+        self._entries[url] = (time.monotonic() + ttl, preview)
+        self._entries.move_to_end(url)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _fetch(self, url):
+        """Blocking: page metadata plus thumbnail, or None if the page has no title"""
+        status, content_type, body = self.pool.get(url, MAX_HTML_BYTES)
+        if status != 200 or "html" not in content_type:
+            return None
+        charset = "utf-8"
+        if "charset=" in content_type:
+            charset = content_type.split("charset=", 1)[1].split(";")[0].strip() or charset
+        try:
+            html = body.decode(charset, errors="replace")
+        except LookupError:
+            html = body.decode("utf-8", errors="replace")
+        head_end = html.lower().find("</head>")
+        parser = OpenGraphParser()
+        parser.feed(html[:head_end] if head_end != -1 else html)
+
+        meta = parser.meta
+        title = meta.get("og:title") or meta.get("twitter:title") or parser.title.strip()
+        if not title:
+            return None
+        preview = {
+            "url": url,
+            "title": title[:256],
+            "description": (meta.get("og:description") or meta.get("description") or "")[:512],
+            "thumbnail": None
+        }
+        image_url = meta.get("og:image") or meta.get("twitter:image")
+        if image_url:
+            try:
+                status, image_type, data = self.pool.get(urljoin(url, image_url), MAX_IMAGE_BYTES)
+                if status == 200 and len(data) < MAX_IMAGE_BYTES:
+                    preview["thumbnail"] = make_thumbnail(data, image_type)
+            except Exception as e:
+                print(f"⚠️ Preview image failed for {url}: {e}")
+        return preview
+
+    def snapshot(self):
+        return {
+            "cached": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "failures": self.failures,
+            "connections_opened": self.pool.connections_opened
+        }
@@ -0,0 +1,100 @@
+import asyncio
+import concurrent.futures
+
+# Message fields that carry downloadable media, with the API type name
+MEDIA_FIELDS = {
+    "imageMessage": "image",
+    "documentMessage": "document",
+    "audioMessage": "audio",
+    "videoMessage": "video",
+    "stickerMessage": "sticker"
+}
+
+
+def media_field(message):
+    """(field name, media type) of the media in a Message proto, or (None, None)"""
+    for field, media_type in MEDIA_FIELDS.items():
+        if message.HasField(field):
+            return field, media_type
+    return None, None
+
+
+class MediaDownloader:
+    """Bounded background download-and-decrypt of inbound media.
+
+    Jobs go into a fixed-size queue on the bot loop and are drained by a small
+    number of worker tasks; hashing and disk writes run in a thread pool so a
+    burst of media never blocks event handling. When the queue is full new
+    jobs are dropped and counted rather than buffered without limit.
+    """
+
+    def __init__(self, client, media_store, message_store, workers=4, queue_size=1000):
+        self.client = client
+        self.media_store = media_store
+        self.message_store = message_store
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue = None
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media-io")
+        self._tasks = []
+        self.stats = {
+            "in_progress": 0,
+            "downloaded": 0,
+            "deduplicated": 0,
+            "failed": 0,
+            "dropped": 0,
+            "bytes_downloaded": 0,
+            "bytes_stored": 0
+        }
+
+    def _ensure_workers(self):
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.queue_size)
+            self._tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, chat, message_id, message, mimetype):
+        """Queue a download; must be called on the bot loop. Returns False if shed."""
+        self._ensure_workers()
+        try:
+            self.queue.put_nowait((chat, message_id, message, mimetype))
+            return True
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            print(f"⚠️ Media queue full, dropped download for {message_id}")
+            return False
+
+    async def _worker(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            chat, message_id, message, mimetype = await self.queue.get()
+            self.stats["in_progress"] += 1
+            try:
+                data = await self.client.download_any(message)
+                self.stats["bytes_downloaded"] += len(data)
+                sha256, size, is_new = await loop.run_in_executor(
+                    self.executor, self.media_store.put_bytes, data
+                )
+                self.message_store.set_media(chat, message_id, sha256, mimetype, size)
+                self.stats["downloaded"] += 1
+                if is_new:
+                    self.stats["bytes_stored"] += size
+                else:
+                    self.stats["deduplicated"] += 1
+                print(f"📥 Media {message_id} stored as {sha256[:12]}{'' if is_new else ' (duplicate)'}")
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"❌ Error downloading media {message_id}: {e}")
+            finally:
+                self.stats["in_progress"] -= 1
+                self.queue.task_done()
+
+    def take_queued(self):
+        """Remove and return every job not yet started (for handover at shutdown)"""
+        jobs = []
+        while self.queue is not None and not self.queue.empty():
+            jobs.append(self.queue.get_nowait())
+            self.queue.task_done()
+        return jobs
+
+    def snapshot(self):
+        return dict(self.stats, queue_depth=self.queue.qsize() if self.queue else 0)
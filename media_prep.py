@@ -0,0 +1,59 @@
+import asyncio
+import concurrent.futures
+import mimetypes
+import os
+import time
+
+
+def read_file(filepath):
+    """Blocking: the file's bytes, read into a single buffer"""
+    with open(filepath, "rb") as f:
+        return f.read()
+
+
+class MediaPreparer:
+    """Disk and CPU side of outbound media, run on a small thread pool.
+
+    neonize's build_*_message calls read the file themselves when given a
+    path, which for a large video stalls the bot loop for every other send
+    and inbound event. Files are read here instead and the builders get
+    bytes, so on the loop only the upload itself remains. The pool size
+    bounds how many files are being read at once; the bot only prepares a
+    file once its upload slot is free, so the upload limit bounds how many
+    are held in memory.
+    """
+
+    def __init__(self, workers=2):
+        self.workers = workers
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="media-prep")
+        self.stats = {
+            "in_progress": 0,
+            "prepared": 0,
+            "failed": 0,
+            "bytes_prepared": 0,
+            "prep_seconds": 0.0
+        }
+
+    async def prepare(self, filepath):
+        """Read filepath off the loop; returns a dict with data, size, mimetype and filename"""
+        self.stats["in_progress"] += 1
+        started = time.perf_counter()
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(self.executor, read_file, filepath)
+        except Exception:
+            self.stats["failed"] += 1
+            raise
+        finally:
+            self.stats["in_progress"] -= 1
+        self.stats["prepared"] += 1
+        self.stats["bytes_prepared"] += len(data)
+        self.stats["prep_seconds"] += time.perf_counter() - started
+        return {
+            "data": data,
+            "size": len(data),
+            "mimetype": mimetypes.guess_type(filepath)[0] or "application/octet-stream",
+            "filename": os.path.basename(filepath)
+        }
+
+    def snapshot(self):
+        return dict(self.stats, workers=self.workers, prep_seconds=round(self.stats["prep_seconds"], 3))
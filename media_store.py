@@ -0,0 +1,41 @@
+import hashlib
+import os
+import tempfile
+
+MEDIA_FOLDER = "data/media"
+
+
+class MediaStore:
+    """Content-addressed file store: every blob lives once at <root>/<sha[:2]>/<sha>"""
+
+    def __init__(self, root=MEDIA_FOLDER):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path_for(self, sha256):
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def exists(self, sha256):
+        return os.path.exists(self.path_for(sha256))
+
+    def put_bytes(self, data):
+        """Store data if new; returns (sha256, size, is_new). Blocking - call from an executor."""
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            return sha256, len(data), False
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        return sha256, len(data), True
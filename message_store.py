@@ -0,0 +1,261 @@
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+MESSAGE_DB = "data/messages.sqlite3"
+BATCH_SIZE = 500
+BATCH_INTERVAL = 0.5  # seconds a write may wait for its batch
+SEARCH_WINDOW = 5000  # most recent matches ranked by an unscoped search
+# SQLite errors caused by the query text (FTS5 syntax), as opposed to the database
+FTS_QUERY_ERROR = re.compile(r"fts5|syntax error|unterminated string|no such column", re.I)
+
+
+def fts_query(text, chat=None):
+    """Turn free text into an FTS5 query: every word must match, `word*` is a prefix"""
+    terms = []
+    for word in text.split():
+        prefix = word.endswith("*")
+        word = word.rstrip("*").replace('"', "")
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    if not terms:
+        return ""
+    query = "text : (" + " ".join(terms) + ")"
+    if chat:
+        # Chat is an indexed column, so the filter is a doclist intersection, not a row scan
+        query += ' AND chat : "' + chat.replace('"', "") + '"'
+    return query
+
+
+class MessageStore:
+    """SQLite history of inbound and outbound messages with a full-text index.
+
+    Writes are queued and applied by a single writer thread in batched
+    transactions, so callers on the bot loop never wait on disk. The FTS5
+    index is external-content and kept in step by triggers.
+    """
+
+    def __init__(self, path=MESSAGE_DB):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self.batches = 0
+        self.rows_written = 0
+        with self.lock, self.conn:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    chat TEXT NOT NULL,
+                    id TEXT NOT NULL,
+                    sender TEXT,
+                    from_me INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    text TEXT,
+                    media_sha256 TEXT,
+                    media_mimetype TEXT,
+                    media_size INTEGER,
+                    timestamp REAL NOT NULL,
+                    tag TEXT,
+                    state TEXT,
+                    PRIMARY KEY (chat, id)
+                )""")
+            columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(messages)")}
+            for column in ("tag", "state"):
+                if column not in columns:
+                    # History recorded before sends were tagged
+                    self.conn.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS messages_tag ON messages (tag) WHERE tag IS NOT NULL")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS messages_media ON messages (media_sha256) WHERE media_sha256 IS NOT NULL"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS messages_chat_time ON messages (chat, timestamp)")
+            self.conn.execute("CREATE INDEX IF NOT EXISTS messages_time ON messages (timestamp)")
+            fts_exists = self.conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'"
+            ).fetchone()
+            self.conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                    text, chat, content='messages', content_rowid='rowid',
+                    tokenize='unicode61 remove_diacritics 2'
+                )""")
+            self.conn.executescript("""
+                CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages
+                WHEN new.text IS NOT NULL AND new.text != '' BEGIN
+                    INSERT INTO messages_fts (rowid, text, chat) VALUES (new.rowid, new.text, new.chat);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages
+                WHEN old.text IS NOT NULL AND old.text != '' BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, text, chat) VALUES ('delete', old.rowid, old.text, old.chat);
+                END;
+                CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF text ON messages BEGIN
+                    INSERT INTO messages_fts (messages_fts, rowid, text, chat)
+                        SELECT 'delete', old.rowid, old.text, old.chat WHERE old.text IS NOT NULL AND old.text != '';
+                    INSERT INTO messages_fts (rowid, text, chat)
+                        SELECT new.rowid, new.text, new.chat WHERE new.text IS NOT NULL AND new.text != '';
+                END;
+            """)
+            if not fts_exists:
+                # Rank on message text only; chat is indexed purely for filtering
+                self.conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('rank', 'bm25(1.0, 0.0)')")
+                # History recorded before the index existed
+                self.conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+        self._writer = threading.Thread(target=self._write_loop, name="message-store-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, message):
+        """Queue a message dict (chat, id, sender, from_me, type, text, timestamp and optional tag)"""
+        self._writes.put((
+            "INSERT OR IGNORE INTO messages (chat, id, sender, from_me, type, text, timestamp, tag) "
+            "VALUES (:chat, :id, :sender, :from_me, :type, :text, :timestamp, :tag)",
+            dict(message, tag=message.get("tag"))
+        ))
+
+    def set_state(self, chat, message_id, state, text=None):
+        """Queue marking a sent message revoked or edited (with its new text)"""
+        self._writes.put((
+            "UPDATE messages SET state = ?, text = COALESCE(?, text) WHERE chat = ? AND id = ?",
+            (state, text, chat, message_id)
+        ))
+
+    def set_media(self, chat, message_id, sha256, mimetype, size):
+        """Queue pointing a stored message at its file in the media store"""
+        self._writes.put((
+            "UPDATE messages SET media_sha256 = ?, media_mimetype = ?, media_size = ? WHERE chat = ? AND id = ?",
+            (sha256, mimetype, size, chat, message_id)
+        ))
+
+    def flush(self, timeout=None):
+        """Block until every write queued so far is committed"""
+        done = threading.Event()
+        self._writes.put((None, done))
+        return done.wait(timeout)
+
+    def _write_loop(self):
+        while True:
+            batch = [self._writes.get()]
+            deadline = time.monotonic() + BATCH_INTERVAL
+            while len(batch) < BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._writes.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            markers = [params for sql, params in batch if sql is None]
+            writes = [(sql, params) for sql, params in batch if sql is not None]
+            if writes:
+                try:
+                    with self.lock, self.conn:
+                        for sql, params in writes:
+                            self.conn.execute(sql, params)
+                    self.batches += 1
+                    self.rows_written += len(writes)
+                except Exception as e:
+                    print(f"❌ Error writing message batch ({len(writes)} rows): {e}")
+            for done in markers:
+                done.set()
+
+    def _reader(self):
+        # WAL lets each request thread read through its own connection while the writer commits
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA query_only=1")
+            self._local.conn = conn
+        return conn
+
+    def get(self, chat, message_id):
+        row = self._reader().execute(
+            "SELECT * FROM messages WHERE chat = ? AND id = ?", (chat, message_id)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def media_mimetype(self, sha256):
+        """Mimetype recorded for a file in the media store, or None"""
+        row = self._reader().execute(
+            "SELECT media_mimetype FROM messages WHERE media_sha256 = ? LIMIT 1", (sha256,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def tagged(self, tag, after=0, limit=500):
+        """Page of messages sent with `tag`, in send order after rowid `after`"""
+        rows = self._reader().execute(
+            "SELECT rowid, chat, id, type, text, state, timestamp FROM messages "
+            "WHERE tag = ? AND from_me = 1 AND rowid > ? ORDER BY rowid LIMIT ?",
+            (tag, after, limit)
+        )
+        return [dict(row) for row in rows]
+
+    def count_tagged(self, tag):
+        """Messages sent with `tag`, by state (None for untouched)"""
+        rows = self._reader().execute(
+            "SELECT state, COUNT(*) FROM messages WHERE tag = ? AND from_me = 1 GROUP BY state", (tag,)
+        )
+        return {state: count for state, count in rows}
+
+    def search(self, text, chat=None, since=None, until=None, limit=20, offset=0):
+        """Ranked full-text search; returns (results, has_more, window_full).
+
+        Only the SEARCH_WINDOW most recent matches are ranked, which keeps
+        common words cheap at any history size; window_full says older
+        matches were left out. Raises ValueError for a query FTS5 rejects.
+        """
+        query = fts_query(text, chat)
+        if not query:
+            return [], False
+
+        filters = ""
+        filter_params = []
+        if since is not None:
+            filters += " AND m.timestamp >= ?"
+            filter_params.append(since)
+        if until is not None:
+            filters += " AND m.timestamp < ?"
+            filter_params.append(until)
+
+        # FTS5 turns the rowid lower bound into an index range, so ranking stays O(window)
+        sql = f"""
+            SELECT m.chat, m.id, m.sender, m.from_me, m.type, m.text, m.media_sha256, m.timestamp,
+                   snippet(messages_fts, 0, '[', ']', '…', 12) AS snippet
+            FROM messages_fts JOIN messages AS m ON m.rowid = messages_fts.rowid
+            WHERE messages_fts MATCH ?{filters}
+              AND messages_fts.rowid >= (
+                SELECT MIN(rowid) FROM (
+                    SELECT messages_fts.rowid FROM messages_fts JOIN messages AS m ON m.rowid = messages_fts.rowid
+                    WHERE messages_fts MATCH ?{filters}
+                    ORDER BY messages_fts.rowid DESC LIMIT ?
+                )
+              )
+            ORDER BY messages_fts.rank LIMIT ? OFFSET ?"""
+        # Fetch one extra row to know whether another page exists without a COUNT(*)
+        params = [query] + filter_params + [query] + filter_params + [SEARCH_WINDOW, limit + 1, offset]
+        window_sql = f"""
+            SELECT COUNT(*) FROM (
+                SELECT 1 FROM messages_fts JOIN messages AS m ON m.rowid = messages_fts.rowid
+                WHERE messages_fts MATCH ?{filters} LIMIT ?
+            )"""
+
+        try:
+            rows = [dict(row) for row in self._reader().execute(sql, params)]
+            matches = self._reader().execute(window_sql, [query] + filter_params + [SEARCH_WINDOW + 1]).fetchone()[0]
+        except sqlite3.OperationalError as e:
+            if FTS_QUERY_ERROR.search(str(e)):
+                raise ValueError(f"Invalid search query: {e}") from e
+            raise
+        return rows[:limit], len(rows) > limit, matches > SEARCH_WINDOW
+
+    def snapshot(self):
+        return {
+            "write_queue": self._writes.qsize(),
+            "batches": self.batches,
+            "rows_written": self.rows_written
+        }
@@ -0,0 +1,127 @@
+import hashlib
+import hmac
+import json
+import os
+import queue
+import threading
+
+from groups import normalize_group_jid
+
+# NDJSON file to append request metadata to; empty (the default) disables recording
+TRAFFIC_RECORD = os.environ.get("WA_TRAFFIC_RECORD", "")
+MAX_JSON_BYTES = 1024 * 1024  # larger JSON bodies are recorded without their fields
+
+
+def _parsed(request, attribute):
+    """Request JSON, or form/files if the handler already parsed them, else None.
+
+    Touching request.form on a request rejected before its handler ran would
+    read a possibly huge upload just to record it, so only cached form data
+    is used.
+    """
+    if attribute == "json":
+        if request.is_json and (request.content_length or 0) <= MAX_JSON_BYTES:
+            data = request.get_json(silent=True)
+            return data if isinstance(data, dict) else None
+        return None
+    return request.__dict__.get(attribute)
+
+
+class TrafficRecorder:
+    """Opt-in log of API traffic shape for replay with benchmarks/replay.py.
+
+    One NDJSON line per request: endpoint rule, status, timing, body and
+    response sizes, and for sends the file type and size, text length and
+    priority. Recipients become salted pseudonyms (the salt never leaves the
+    process) and no text or file content is kept. Lines are written by a
+    background thread; when it falls behind, records are dropped and
+    counted rather than slowing requests down.
+    """
+
+    def __init__(self, path=TRAFFIC_RECORD, max_queue=10000):
+        self.path = path
+        self.enabled = bool(path)
+        self.recorded = 0
+        self.dropped = 0
+        self._salt = os.urandom(16)
+        self._queue = queue.Queue(maxsize=max_queue)
+        if self.enabled:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            threading.Thread(target=self._run, name="traffic-recorder", daemon=True).start()
+            print(f"🎙️ Recording traffic metadata to {path}")
+
+    def pseudonym(self, recipient):
+        """Stable (per process) stand-in for a phone number or group JID"""
+        kind = "group" if normalize_group_jid(recipient) else "user"
+        digest = hmac.new(self._salt, recipient.encode(), hashlib.sha256).hexdigest()[:12]
+        return kind, digest
+
+    def record(self, request, response, duration, received_at):
+        if not self.enabled:
+            return
+        entry = {
+            "ts": round(received_at, 3),
+            "method": request.method,
+            "endpoint": request.url_rule.rule if request.url_rule else None,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 2),
+            "request_bytes": request.content_length or 0,
+            "response_bytes": response.content_length or 0,
+            "content_type": request.mimetype or None
+        }
+        fields = _parsed(request, "json") or _parsed(request, "form") or {}
+        recipient = fields.get("phone")
+        if isinstance(recipient, str) and recipient:
+            entry["recipient_type"], entry["recipient"] = self.pseudonym(recipient)
+        text = fields.get("message") or fields.get("caption")
+        if isinstance(text, str):
+            entry["text_length"] = len(text)
+        if fields.get("mention_all"):
+            entry["mention_all"] = True
+        priority = request.headers.get("X-Priority") or fields.get("priority")
+        if priority:
+            entry["priority"] = str(priority).lower()
+        timeout = request.headers.get("X-Request-Timeout") or fields.get("timeout")
+        deadline = request.headers.get("X-Request-Deadline")
+        try:
+            if timeout:
+                entry["timeout"] = float(timeout)
+            elif deadline:
+                entry["timeout"] = round(float(deadline) - received_at, 3)
+        except (TypeError, ValueError):
+            pass
+        files = _parsed(request, "files")
+        if files and "file" in files:
+            upload = files["file"]
+            try:
+                upload.stream.seek(0, os.SEEK_END)
+                entry["file"] = {
+                    "ext": os.path.splitext(upload.filename or "")[1].lstrip(".").lower(),
+                    "bytes": upload.stream.tell(),
+                    "mimetype": upload.mimetype or None
+                }
+            except (OSError, ValueError):
+                pass
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a") as f:
+            while True:
+                lines = [json.dumps(self._queue.get())]
+                while True:
+                    try:
+                        lines.append(json.dumps(self._queue.get_nowait()))
+                    except queue.Empty:
+                        break
+                f.write("\n".join(lines) + "\n")
+                f.flush()
+                self.recorded += len(lines)
+
+    def snapshot(self):
+        return {"enabled": self.enabled, "recorded": self.recorded, "dropped": self.dropped, "queued": self._queue.qsize()}
+
+
+recorder = TrafficRecorder()
@@ -0,0 +1,312 @@
+import json
+import os
+import re
+import threading
+import time
+
+from campaigns import CampaignTemplate
+from scheduler import DEFAULT_LANE, LANES
+
+# JSON file of auto-reply rules; empty (the default) disables the rules engine
+RULES_FILE = os.environ.get("WA_RULES_FILE", "")
+RELOAD_INTERVAL = 2.0    # seconds between checks of the rules file's mtime
+DEFAULT_COOLDOWN = 60.0  # seconds before the same rule answers the same chat again
+MAX_COOLDOWNS = 100000   # (chat, rule) entries kept before expired ones are pruned
+# Thread-safe bot method per reply type
+REPLY_METHODS = {
+    "text": "send_message",
+    "image": "send_image",
+    "document": "send_document",
+    "audio": "send_audio",
+    "video": "send_video",
+    "sticker": "send_sticker"
+}
+CAPTIONED = ("image", "document", "video")
+WORD = re.compile(r"\w+")
+NAMED_GROUP = re.compile(r"\(\?P<(\w+)>")
+NAMED_BACKREF = re.compile(r"\(\?P=(\w+)\)")
+NUMBERED_BACKREF = re.compile(r"\\[1-9]|\(\?\(\d")
+# A leading inline global flag group, e.g. "(?i)"; scoped to the rule as "(?i:...)" so rules can be joined
+GLOBAL_FLAGS = re.compile(r"^\(\?([aiLmsux]+)\)")
+
+
+def words(text):
+    return tuple(WORD.findall(text.casefold()))
+
+
+def scope_flags(pattern):
+    """Rewrite a leading global flag group "(?x)rest" as the scoped group "(?x:rest)".
+
+    Flags anywhere else are left for re.compile to reject.
+    """
+    found = GLOBAL_FLAGS.match(pattern)
+    if not found:
+        return pattern
+    flags = found.group(1)
+    rest = pattern[found.end():]
+    # In verbose mode a trailing comment would swallow the closing parenthesis
+    return f"(?{flags}:{rest}{chr(10) if 'x' in flags else ''})"
+
+
+class Rule:
+    """One parsed rule: how it matches and what it replies"""
+
+    def __init__(self, index, spec, base_dir, defaults):
+        if not isinstance(spec, dict):
+            raise ValueError("must be an object")
+        self.index = index
+        self.name = str(spec.get("name") or f"rule{index + 1}")
+        kinds = [kind for kind in ("keyword", "prefix", "regex") if spec.get(kind)]
+        if len(kinds) != 1:
+            raise ValueError("needs exactly one of keyword, prefix or regex")
+        self.kind = kinds[0]
+        value = spec[self.kind]
+        self.fields = {"text", "sender"}
+        if self.kind == "keyword":
+            self.keywords = [words(k) for k in ([value] if isinstance(value, str) else value)]
+            if not all(self.keywords):
+                raise ValueError("keywords must contain letters or digits")
+        elif self.kind == "prefix":
+            self.prefixes = [p.casefold() for p in ([value] if isinstance(value, str) else value)]
+            self.fields.add("rest")
+        else:
+            if NUMBERED_BACKREF.search(value):
+                raise ValueError("numbered backreferences are not supported, use named groups")
+            try:
+                self.pattern = re.compile(scope_flags(value), re.IGNORECASE)
+            except re.error as e:
+                if "global flags" in str(e):
+                    raise ValueError("inline flags such as (?i) are only supported at the start of the pattern")
+                raise
+            self.fields.update(self.pattern.groupindex)
+        self.cooldown = float(spec.get("cooldown", defaults["cooldown"]))
+        self.groups = bool(spec.get("groups", defaults["groups"]))
+        self.priority = spec.get("priority", defaults["priority"])
+        if self.priority not in LANES:
+            raise ValueError(f"priority must be one of {', '.join(LANES)}")
+        reply = spec.get("reply")
+        if isinstance(reply, str):
+            reply = {"type": "text", "message": reply}
+        if not isinstance(reply, dict) or reply.get("type", "text") not in REPLY_METHODS:
+            raise ValueError(f"reply must be text or an object with type {', '.join(REPLY_METHODS)}")
+        self.reply_type = reply.get("type", "text")
+        self.link_preview = bool(reply.get("link_preview", False))
+        self.filename = reply.get("filename")
+        text = reply.get("message") if self.reply_type == "text" else reply.get("caption", "")
+        if self.reply_type == "text" and not text:
+            raise ValueError("text reply needs a message")
+        self.template = CampaignTemplate(text or "")
+        unknown = set(self.template.fields) - self.fields
+        if unknown:
+            raise ValueError(f"unknown placeholders {', '.join(sorted(unknown))}")
+        self.file = None
+        if self.reply_type != "text":
+            self.file = os.path.join(base_dir, reply.get("file") or "")
+            if not os.path.isfile(self.file):
+                raise ValueError(f"reply file {self.file} not found")
+
+    def combined_pattern(self):
+        """This rule's regex as a lookahead alternative of the combined pattern, named groups renamed"""
+        prefix = f"r{self.index}_"
+        value = NAMED_GROUP.sub(lambda m: f"(?P<{prefix}{m.group(1)}>", self.pattern.pattern)
+        value = NAMED_BACKREF.sub(lambda m: f"(?P={prefix}{m.group(1)})", value)
+        return f"(?=(?s:.*?)(?P<r{self.index}>{value}))"
+
+
+class RuleSet:
+    """Rules compiled for matching; immutable once built, swapped whole on reload.
+
+    Keywords are looked up as word n-grams in one dict and prefixes by
+    length in another, so their cost does not grow with the rule count.
+    All regex rules are joined into one pattern anchored at the start of the
+    text, with each rule a lookahead searching the whole text, in file
+    order; the alternation stops at the first rule that matches anywhere.
+    When rules of several kinds match, the first in the file wins.
+    """
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.keywords = {}
+        self.prefixes = {}
+        regex_parts = []
+        for rule in rules:
+            if rule.kind == "keyword":
+                for keyword in rule.keywords:
+                    self.keywords.setdefault(keyword, rule)
+            elif rule.kind == "prefix":
+                for prefix in rule.prefixes:
+                    self.prefixes.setdefault(len(prefix), {}).setdefault(prefix, rule)
+            else:
+                regex_parts.append(rule.combined_pattern())
+        self.ngram_sizes = sorted({len(keyword) for keyword in self.keywords})
+        self.regex = re.compile("(?:" + "|".join(regex_parts) + ")", re.IGNORECASE) if regex_parts else None
+
+    def match(self, text):
+        """(rule, placeholder values) of the first rule matching `text`, or (None, None)"""
+        best = None
+        tokens = words(text)
+        for n in self.ngram_sizes:
+            for i in range(len(tokens) - n + 1):
+                rule = self.keywords.get(tokens[i:i + n])
+                if rule and (best is None or rule.index < best.index):
+                    best = rule
+        stripped = text.lstrip()
+        folded = stripped.casefold()
+        for length, prefixes in self.prefixes.items():
+            rule = prefixes.get(folded[:length])
+            if rule and (best is None or rule.index < best.index):
+                best, rest = rule, stripped[length:].strip()
+        found = self.regex.match(text) if self.regex else None
+        if found:
+            candidate = self.rules[int(found.lastgroup[1:])]
+            if best is None or candidate.index < best.index:
+                prefix = f"{found.lastgroup}_"
+                groups = {k[len(prefix):]: v or "" for k, v in found.groupdict().items() if k.startswith(prefix)}
+                return candidate, groups
+        if best is None:
+            return None, None
+        fields = {"rest": rest} if best.kind == "prefix" else {}
+        return best, fields
+
+
+class RulesEngine:
+    """Keyword, prefix and regex auto-replies for inbound messages.
+
+    Runs as an inbound handler, so matching and replying happen on the
+    per-chat handler threads, never on the bot loop. Replies go through
+    the bot's thread-safe send wrappers, with a per-chat, per-rule cooldown.
+    The rules file is re-read when its mtime changes; a file that fails to
+    load leaves the previous rules in place.
+    """
+
+    def __init__(self, bot, path=RULES_FILE):
+        self.bot = bot
+        self.path = path
+        self.enabled = bool(path)
+        self.ruleset = RuleSet([])
+        self.loaded_at = None
+        self.last_error = None
+        self.reloads = 0
+        self.stats = {}
+        self._mtime = None
+        self._checked = 0.0
+        self._cooldowns = {}
+        self._lock = threading.Lock()
+        if self.enabled:
+            self.reload()
+
+    def reload(self):
+        """Re-read the rules file; returns True if a new rule set is in use"""
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        # A broken file is reported once, then retried when it changes again
+        self._mtime = mtime
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                config = json.load(f)
+            if not isinstance(config, dict):
+                raise ValueError("expected an object with a rules list")
+            defaults = {
+                "cooldown": float(config.get("cooldown", DEFAULT_COOLDOWN)),
+                "groups": bool(config.get("groups", False)),
+                "priority": config.get("priority", DEFAULT_LANE)
+            }
+            base_dir = os.path.dirname(os.path.abspath(self.path))
+            rules = []
+            for i, spec in enumerate(config.get("rules", [])):
+                try:
+                    rules.append(Rule(i, spec, base_dir, defaults))
+                except (ValueError, TypeError, re.error) as e:
+                    raise ValueError(f"rule {i + 1}: {e}")
+                if rules[-1].name in {rule.name for rule in rules[:-1]}:
+                    raise ValueError(f"rule {i + 1}: duplicate name {rules[-1].name}")
+            ruleset = RuleSet(rules)
+        except (OSError, ValueError, TypeError, re.error) as e:
+            self.last_error = str(e)
+            print(f"❌ Error loading rules from {self.path}: {e}")
+            return False
+        self.ruleset = ruleset
+        self.loaded_at = time.time()
+        self.last_error = None
+        self.reloads += 1
+        print(f"📜 Loaded {len(rules)} reply rules from {self.path}")
+        return True
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if now - self._checked < RELOAD_INTERVAL:
+            return
+        self._checked = now
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return
+        if mtime != self._mtime:
+            with self._lock:
+                if mtime != self._mtime:
+                    self.reload()
+
+    def _count(self, rule, key):
+        with self._lock:
+            stats = self.stats.setdefault(rule.name, {"matched": 0, "replied": 0, "cooldown": 0, "failed": 0})
+            stats[key] += 1
+
+    def _start_cooldown(self, chat, rule):
+        """True if `rule` may answer `chat` now, starting its cooldown"""
+        now = time.monotonic()
+        key = (chat, rule.name)
+        with self._lock:
+            if self._cooldowns.get(key, 0) > now:
+                return False
+            if len(self._cooldowns) >= MAX_COOLDOWNS:
+                self._cooldowns = {k: until for k, until in self._cooldowns.items() if until > now}
+            self._cooldowns[key] = now + rule.cooldown
+            return True
+
+    def handle(self, message):
+        """Inbound handler: answer the first matching rule"""
+        self._maybe_reload()
+        text = message.get("text")
+        if not text or message.get("from_me"):
+            return
+        rule, fields = self.ruleset.match(text)
+        if rule is None:
+            return
+        chat = message["chat"]
+        if chat.endswith("@g.us") and not rule.groups:
+            return
+        self._count(rule, "matched")
+        if not self._start_cooldown(chat, rule):
+            self._count(rule, "cooldown")
+            return
+        reply = rule.template.render(dict(fields, text=text, sender=message.get("sender") or ""))
+        send = getattr(self.bot, REPLY_METHODS[rule.reply_type])
+        if rule.reply_type == "text":
+            result = send(chat, reply, link_preview=rule.link_preview, priority=rule.priority, dead_letter=False)
+        elif rule.reply_type == "document":
+            result = send(chat, rule.file, reply, rule.filename, priority=rule.priority, dead_letter=False)
+        elif rule.reply_type in CAPTIONED:
+            result = send(chat, rule.file, reply, priority=rule.priority, dead_letter=False)
+        else:
+            result = send(chat, rule.file, priority=rule.priority, dead_letter=False)
+        if result.get("status") == "success":
+            self._count(rule, "replied")
+        else:
+            self._count(rule, "failed")
+            print(f"❌ Rule {rule.name} reply to {chat} failed: {result.get('message')}")
+
+    def snapshot(self):
+        with self._lock:
+            stats = {name: dict(counts) for name, counts in self.stats.items()}
+            cooling = len(self._cooldowns)
+        return {
+            "enabled": self.enabled,
+            "rules": len(self.ruleset.rules),
+            "reloads": self.reloads,
+            "loaded_at": self.loaded_at,
+            "last_error": self.last_error,
+            "cooldowns": cooling,
+            "matches": stats
+        }
@@ -0,0 +1,225 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+LANES = ("transactional", "normal", "bulk")
+DEFAULT_LANE = "normal"
+LATENCY_SAMPLES = 500
+
+
+class ShuttingDown(Exception):
+    """Raised to sends still waiting for a slot when the scheduler is closed"""
+
+
+class LaneStats:
+    def __init__(self):
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.wait_samples = deque(maxlen=LATENCY_SAMPLES)
+        self.total_samples = deque(maxlen=LATENCY_SAMPLES)
+
+    @staticmethod
+    def _percentile(samples, pct):
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return round(ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] * 1000, 1)
+
+    def snapshot(self):
+        return {
+            "queued": self.queued,
+            "running": self.running,
+            "completed": self.completed,
+            "wait_p50_ms": self._percentile(self.wait_samples, 50),
+            "wait_p95_ms": self._percentile(self.wait_samples, 95),
+            "latency_p50_ms": self._percentile(self.total_samples, 50),
+            "latency_p95_ms": self._percentile(self.total_samples, 95)
+        }
+
+
+class PriorityScheduler:
+    """Priority lanes in front of the send_*_async coroutines.
+
+    `transactional` is served strictly first and owns `reserved` slots no
+    other lane may take, so OTPs never queue behind a campaign. `normal` and
+    `bulk` share the remaining slots by weighted round robin so bulk traffic
+    keeps moving without starving normal sends. Must only be used from the
+    bot loop.
+    """
+
+    def __init__(self, max_concurrency=16, reserved=4, weights=None):
+        self.max_concurrency = max_concurrency
+        self.reserved = reserved
+        self.weights = weights or {"normal": 3, "bulk": 1}
+        self.running = 0
+        self.shared_running = 0
+        self.closed = False
+        self._waiters = {lane: deque() for lane in LANES}
+        self._credits = dict(self.weights)
+        self.stats = {lane: LaneStats() for lane in LANES}
+
+    @asynccontextmanager
+    async def slot(self, lane=DEFAULT_LANE):
+        """Wait for a slot in `lane`, run the body, record wait and total latency"""
+        if lane not in self._waiters:
+            raise ValueError(f"Unknown priority {lane!r}, expected one of {', '.join(LANES)}")
+        stats = self.stats[lane]
+        queued_at = time.monotonic()
+        await self._acquire(lane)
+        started = time.monotonic()
+        stats.wait_samples.append(started - queued_at)
+        stats.running += 1
+        try:
+            yield
+        finally:
+            stats.running -= 1
+            stats.completed += 1
+            stats.total_samples.append(time.monotonic() - queued_at)
+            self._release(lane)
+
+    def _can_run(self, lane):
+        if self.running >= self.max_concurrency:
+            return False
+        if lane == "transactional":
+            return True
+        return self.shared_running < self.max_concurrency - self.reserved
+
+    def _take(self, lane):
+        self.running += 1
+        if lane != "transactional":
+            self.shared_running += 1
+
+    async def _acquire(self, lane):
+        if self.closed:
+            raise ShuttingDown()
+        if self._can_run(lane) and not any(self._waiters[l] for l in LANES):
+            self._take(lane)
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(waiter)
+        self.stats[lane].queued += 1
+        # A free reserved slot may already be usable by this lane
+        self._dispatch()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in self._waiters[lane]:
+                self._waiters[lane].remove(waiter)
+                self.stats[lane].queued -= 1
+            elif not waiter.cancelled() and waiter.exception() is None:
+                # Slot was handed over just as we were cancelled; give it back
+                self._release(lane)
+            raise
+
+    def _release(self, lane):
+        self.running -= 1
+        if lane != "transactional":
+            self.shared_running -= 1
+        self._dispatch()
+
+    def _next_lane(self):
+        """Strict priority for transactional, weighted round robin for the rest"""
+        if self._waiters["transactional"] and self._can_run("transactional"):
+            return "transactional"
+        shared = [lane for lane in ("normal", "bulk") if self._waiters[lane]]
+        if not shared or not self._can_run(shared[0]):
+            return None
+        if len(shared) == 1:
+            return shared[0]
+        if all(self._credits[lane] <= 0 for lane in shared):
+            self._credits = dict(self.weights)
+        for lane in shared:
+            if self._credits[lane] > 0:
+                self._credits[lane] -= 1
+                return lane
+        return None
+
+    def _dispatch(self):
+        while True:
+            lane = self._next_lane()
+            if lane is None:
+                return
+            waiter = self._waiters[lane].popleft()
+            self.stats[lane].queued -= 1
+            if waiter.done():
+                continue
+            self._take(lane)
+            waiter.set_result(None)
+
+    def waiting(self):
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def idle(self):
+        return self.running == 0 and not self.waiting()
+
+    def close(self):
+        """Refuse new sends and fail every waiting one with ShuttingDown; returns how many"""
+        self.closed = True
+        rejected = 0
+        for lane in LANES:
+            while self._waiters[lane]:
+                waiter = self._waiters[lane].popleft()
+                self.stats[lane].queued -= 1
+                if not waiter.done():
+                    waiter.set_exception(ShuttingDown())
+                    rejected += 1
+        return rejected
+
+    def snapshot(self):
+        return {
+            "max_concurrency": self.max_concurrency,
+            "reserved_transactional": self.reserved,
+            "running": self.running,
+            "lanes": {lane: self.stats[lane].snapshot() for lane in LANES}
+        }
+
+
+class ChatLanes:
+    """FIFO order per chat in front of the priority lanes.
+
+    Sends to one chat run one at a time, in the order they reached the bot
+    loop; sends to different chats run in parallel, bounded by the
+    PriorityScheduler slots they take next. A send that gives up while
+    queued keeps its place until the send before it finishes, so a timeout
+    never lets a later message overtake an earlier one. Must only be used
+    from the bot loop.
+    """
+
+    def __init__(self):
+        self._tails = {}
+        self.waiting = 0
+        self.ordered = 0  # sends that had to wait for an earlier send to their chat
+
+    @asynccontextmanager
+    async def turn(self, chat):
+        previous = self._tails.get(chat)
+        done = asyncio.get_running_loop().create_future()
+        self._tails[chat] = done
+        try:
+            if previous is not None and not previous.done():
+                self.waiting += 1
+                self.ordered += 1
+                try:
+                    await asyncio.shield(previous)
+                finally:
+                    self.waiting -= 1
+            yield
+        finally:
+            if previous is not None and not previous.done():
+                previous.add_done_callback(lambda _: self._finish(chat, done))
+            else:
+                self._finish(chat, done)
+
+    def idle(self):
+        """No send holds or waits for a chat turn"""
+        return not self._tails
+
+    def _finish(self, chat, done):
+        done.set_result(None)
+        if self._tails.get(chat) is done:
+            del self._tails[chat]
+
+    def snapshot(self):
+        return {"active_chats": len(self._tails), "waiting": self.waiting, "ordered": self.ordered}
@@ -0,0 +1,143 @@
+import os
+import sqlite3
+
+SESSION_DB = os.environ.get("WA_SESSION_DB", "data/db.sqlite3")
+SESSION_DB_MODE = os.environ.get("WA_SESSION_DB_MODE", "default")  # default | performance
+
+# Persistent settings, stored in the database file so neonize's own connections see them.
+# Per-connection pragmas (synchronous, cache_size, mmap_size) can't be applied from here:
+# neonize opens its connections itself, with SQLite defaults.
+PERFORMANCE_FILE_PRAGMAS = [
+    "PRAGMA journal_mode=WAL"
+]
+
+# Sender keys are only pruned for groups we have left; status@broadcast and DMs are kept
+PRUNABLE_SENDER_KEY_SUFFIX = "@g.us"
+DEFAULT_KEEP_PREKEYS = 1000
+
+
+def is_postgres(url):
+    return url.startswith("postgres://") or url.startswith("postgresql://")
+
+
+def prepare_session_db(path=SESSION_DB, mode=SESSION_DB_MODE):
+    """Return the name to hand to NewAClient, tuning a SQLite file first if asked.
+
+    Postgres URLs are passed through untouched; neonize opens them natively.
+    """
+    if is_postgres(path):
+        print("🐘 Session store: Postgres")
+        return path
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if mode == "performance":
+        conn = sqlite3.connect(path)
+        try:
+            for pragma in PERFORMANCE_FILE_PRAGMAS:
+                conn.execute(pragma)
+            conn.execute("PRAGMA optimize")
+        finally:
+            conn.close()
+        print("⚡ Session store: SQLite WAL mode")
+    return path
+
+
+class SessionMaintenance:
+    """Online size report and pruning for the neonize (whatsmeow) SQLite session store"""
+
+    def __init__(self, path=SESSION_DB):
+        self.path = path
+
+    def _connect(self):
+        # Waits out neonize's writers instead of failing with "database is locked"
+        return sqlite3.connect(self.path, timeout=5)
+
+    def supported(self):
+        return not is_postgres(self.path) and os.path.exists(self.path)
+
+    def report(self):
+        """Row counts and on-disk bytes per table, plus free (fragmented) pages"""
+        conn = self._connect()
+        try:
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name"
+            )]
+            sizes = {}
+            try:
+                for name, pages in conn.execute(
+                    "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name"
+                ):
+                    sizes[name] = pages
+            except sqlite3.OperationalError:
+                pass  # SQLite built without dbstat; row counts only
+
+            return {
+                "path": self.path,
+                "journal_mode": journal_mode,
+                "file_bytes": page_size * page_count,
+                "free_bytes": page_size * freelist,
+                "wal_bytes": os.path.getsize(self.path + "-wal") if os.path.exists(self.path + "-wal") else 0,
+                "tables": {
+                    name: {
+                        "rows": conn.execute(f'SELECT COUNT(*) FROM "{name}"').fetchone()[0],
+                        "bytes": sizes.get(name)
+                    }
+                    for name in tables
+                }
+            }
+        finally:
+            conn.close()
+
+    def prune(self, active_groups=None, keep_prekeys=DEFAULT_KEEP_PREKEYS, dry_run=True):
+        """Delete stale pre-keys and sender keys of groups we have left.
+
+        Pre-keys: uploaded keys beyond the newest `keep_prekeys` per account; the
+        server only hands out recent ones. Sender keys: only pruned when the
+        caller passes the set of groups we are still in.
+        """
+        conn = self._connect()
+        try:
+            result = {"dry_run": dry_run, "prekeys": 0, "sender_keys": 0}
+            with conn:
+                stale_prekeys = """
+                    FROM whatsmeow_pre_keys WHERE uploaded = true AND key_id NOT IN (
+                        SELECT key_id FROM whatsmeow_pre_keys AS recent
+                        WHERE recent.jid = whatsmeow_pre_keys.jid AND recent.uploaded = true
+                        ORDER BY key_id DESC LIMIT ?
+                    )"""
+                result["prekeys"] = conn.execute(
+                    "SELECT COUNT(*) " + stale_prekeys, (keep_prekeys,)
+                ).fetchone()[0]
+                if not dry_run and result["prekeys"]:
+                    conn.execute("DELETE " + stale_prekeys, (keep_prekeys,))
+
+                if active_groups is not None:
+                    active = set(active_groups)
+                    stale_chats = [
+                        chat for (chat,) in conn.execute(
+                            "SELECT DISTINCT chat_id FROM whatsmeow_sender_keys WHERE chat_id LIKE ?",
+                            ("%" + PRUNABLE_SENDER_KEY_SUFFIX,)
+                        )
+                        if chat not in active
+                    ]
+                    for chat in stale_chats:
+                        if dry_run:
+                            result["sender_keys"] += conn.execute(
+                                "SELECT COUNT(*) FROM whatsmeow_sender_keys WHERE chat_id = ?", (chat,)
+                            ).fetchone()[0]
+                        else:
+                            result["sender_keys"] += conn.execute(
+                                "DELETE FROM whatsmeow_sender_keys WHERE chat_id = ?", (chat,)
+                            ).rowcount
+
+            if not dry_run:
+                # Refresh planner statistics and trim the WAL after a large delete
+                conn.execute("PRAGMA optimize")
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            return result
+        finally:
+            conn.close()
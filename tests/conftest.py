@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+import fake_client  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def api(tmp_path_factory):
+    """app.py on the fake client, with its stores and uploads in a scratch directory.
+
+    The bot is a process-wide singleton, so every test module shares it.
+    """
+    cwd = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("bot"))
+    fake_client.install(send_delay=0.01)
+    import app
+    app.bot_instance.start()
+    until = time.monotonic() + 10
+    while not app.bot_instance.is_connected and time.monotonic() < until:
+        time.sleep(0.05)
+    yield app
+    os.chdir(cwd)
+
+
+@pytest.fixture
+def bot(api):
+    """The running bot, recording what it sends in bot.client.log; circuit closed before and after"""
+    bot = api.bot_instance
+    bot.breaker.record_success()
+    bot.client.log = []
+    yield bot
+    bot.client.log = None
+    bot.breaker.record_success()
+
+
+def wait_for(condition, timeout=5.0):
+    """Poll until condition() is true; returns its last value"""
+    until = time.monotonic() + timeout
+    while not condition() and time.monotonic() < until:
+        time.sleep(0.02)
+    return condition()
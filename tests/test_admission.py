@@ -0,0 +1,47 @@
+import io
+
+import pytest
+
+
+@pytest.fixture
+def client(api):
+    return api.app.test_client()
+
+
+def test_oversized_json_send_is_rejected_before_parsing(api, client):
+    body = b'{"phone": "6281234567890", "message": "' + b"x" * api.MAX_JSON_REQUEST_SIZE + b'"}'
+    response = client.post("/api/send-message", data=body, content_type="application/json")
+    assert response.status_code == 413
+    assert api.admission.inflight_bytes == 0
+
+
+def test_chunked_body_needs_content_length(client):
+    response = client.post("/api/send-image", input_stream=io.BytesIO(b"--x--"), headers={
+        "Transfer-Encoding": "chunked",
+        "Content-Type": "multipart/form-data; boundary=x"
+    })
+    assert response.status_code == 411
+
+
+def test_send_budget_exhausted_returns_429(api, client):
+    admission = api.admission
+    held = 0
+    while admission.try_admit(0) is None:
+        held += 1
+    try:
+        response = client.post("/api/send-message", json={"phone": "6281234567890", "message": "hi"})
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "1"
+    finally:
+        for _ in range(held):
+            admission.release(0)
+    assert admission.inflight_sends == 0
+
+
+def test_admitted_send_releases_its_budget(api, bot, client):
+    response = client.post("/api/send-message", json={
+        "phone": "6281234567890", "message": "hi", "link_preview": False
+    })
+    assert response.status_code == 200, response.get_json()
+    assert (api.admission.inflight_sends, api.admission.inflight_bytes) == (0, 0)
+    assert len(bot.client.log) == 1
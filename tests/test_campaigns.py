@@ -0,0 +1,112 @@
+import codecs
+import io
+
+import pytest
+
+from campaigns import CampaignManager, RowReader
+from conftest import wait_for
+
+ROWS = 60
+
+
+def phone(i):
+    return f"62812{i:08d}"
+
+
+def campaign_csv(rows=ROWS):
+    lines = ["phone,name"] + [f"{phone(i)},user{i}" for i in range(rows)]
+    return ("\n".join(lines) + "\n").encode()
+
+
+def test_row_reader_reopens_at_a_row_offset(tmp_path):
+    path = tmp_path / "rows.csv"
+    path.write_bytes(codecs.BOM_UTF8 + b"phone,name\n111,a\n\n222,\"b,\nc\"\n333,d\n")
+    reader = RowReader(str(path), "csv")
+    rows = reader.read()
+    assert reader.read() == []
+    reader.close()
+    assert [(row_no, row["name"]) for row_no, _, _, row in rows] == [(0, "a"), (1, "b,\nc"), (2, "d")]
+    assert rows[1][2] == rows[2][1]  # a row ends where the next one starts
+
+    _, offset, _, _ = rows[1]
+    resumed = RowReader(str(path), "csv", 1, offset)
+    assert resumed.read() == rows[1:]
+    resumed.close()
+
+    legacy = RowReader(str(path), "csv", 2)  # checkpointed without an offset
+    assert legacy.read() == rows[2:]
+    legacy.close()
+
+
+def test_row_reader_ndjson(tmp_path):
+    path = tmp_path / "rows.ndjson"
+    path.write_bytes(b'{"phone": "111"}\n\n{"phone": "222"}\n')
+    reader = RowReader(str(path), "ndjson")
+    rows = reader.read(count=1)
+    rows += reader.read(count=1)
+    reader.close()
+    assert [(row_no, row["phone"]) for row_no, _, _, row in rows] == [(0, "111"), (1, "222")]
+    resumed = RowReader(str(path), "ndjson", 1, rows[1][1])
+    assert resumed.read() == rows[1:]
+    resumed.close()
+
+
+def sent_to(bot):
+    return [recipient.split("@")[0] for recipient, _ in bot.client.log]
+
+
+def assert_sent_exactly_once(bot, rows=ROWS):
+    recipients = sent_to(bot)
+    assert sorted(recipients) == [phone(i) for i in range(rows)]
+
+
+def test_paused_campaign_resumes_without_resending(bot):
+    manager = bot.campaigns
+    campaign = manager.create(io.BytesIO(campaign_csv()), "csv", "Hi {name}", rate=200, concurrency=4)
+    campaign_id = campaign["id"]
+    assert wait_for(lambda: len(bot.client.log) >= 10)
+    manager.pause(campaign_id)
+    assert wait_for(lambda: not manager.running_tasks())
+    paused = len(bot.client.log)
+    assert manager.status(campaign_id)["status"] == "paused"
+    assert paused < ROWS
+
+    manager.resume(campaign_id)
+    assert wait_for(lambda: manager.status(campaign_id)["status"] == "completed")
+    status = manager.status(campaign_id)
+    assert (status["sent"], status["failed"], status["rows_dispatched"]) == (ROWS, 0, ROWS)
+    assert_sent_exactly_once(bot)
+    assert bot.client.log[0][1].conversation == "Hi user0"
+
+
+@pytest.fixture
+def managers(bot, tmp_path):
+    """Two CampaignManagers on one database, as two processes in turn would be"""
+    db, folder = str(tmp_path / "campaigns.sqlite3"), str(tmp_path / "campaigns")
+    return CampaignManager(bot, db, folder), lambda: CampaignManager(bot, db, folder)
+
+
+def test_campaign_stopped_for_shutdown_resumes_in_next_process(bot, managers):
+    first, next_process = managers
+    campaign_id = first.create(io.BytesIO(campaign_csv()), "csv", "Hi {name}", rate=200)["id"]
+    assert wait_for(lambda: len(bot.client.log) >= 10)
+    first.stop()
+    assert wait_for(lambda: not first.running_tasks())
+    assert first.status(campaign_id)["status"] == "running"  # left for the next start
+    assert len(bot.client.log) < ROWS
+
+    second = next_process()
+    second.resume_all()
+    assert wait_for(lambda: second.status(campaign_id)["status"] == "completed")
+    assert second.status(campaign_id)["sent"] == ROWS
+    assert_sent_exactly_once(bot)
+
+
+def test_invalid_rows_fail_without_sending(bot, managers):
+    manager, _ = managers
+    body = b"phone\n123\n" + phone(1).encode() + b"\n"
+    campaign_id = manager.create(io.BytesIO(body), "csv", "Hi", rate=200)["id"]
+    assert wait_for(lambda: manager.status(campaign_id)["status"] == "completed")
+    status = manager.status(campaign_id)
+    assert (status["sent"], status["failed"]) == (1, 1)
+    assert sent_to(bot) == [phone(1)]
@@ -0,0 +1,52 @@
+import inspect
+import os
+
+import pytest
+
+from conftest import wait_for
+from handover import HandoverStore
+
+
+@pytest.fixture
+def handover(bot, tmp_path):
+    """A fresh HandoverStore in tmp_path swapped into the bot"""
+    saved = bot.handover
+    bot.handover = HandoverStore(str(tmp_path / "handover.json"), str(tmp_path / "handover"))
+    yield bot.handover
+    bot.handover = saved
+
+
+def hand_over(store, method, args, kwargs, priority="normal", tag=None):
+    """Record a call the way @prioritized does when the scheduler closes under it"""
+    from bot import WhatsAppBot
+    return store.add_send(inspect.unwrap(getattr(WhatsAppBot, method)), args, kwargs, priority, tag)
+
+
+def test_handed_over_sends_are_replayed_in_order_by_next_process(bot, handover, tmp_path):
+    upload = tmp_path / "terms.pdf"
+    upload.write_bytes(b"%PDF-1.4 terms")
+    result = hand_over(handover, "send_message_async", ("6281234567890", "first"), {"link_preview": False})
+    assert result["code"] == "handed_over"
+    hand_over(handover, "send_document_async", ("6281234567890", str(upload)), {"caption": "second"}, tag="t1")
+    upload.unlink()  # the request handler deletes its upload once it has a response
+    handover.save({"reason": "test"})
+    kept = handover.sends[1]["arguments"]["filepath"]
+    assert os.path.exists(kept)
+
+    # the next process starts with an empty store pointed at the same file
+    bot.handover = HandoverStore(handover.path, handover.folder)
+    bot.loop.call_soon_threadsafe(bot._resume_handover)
+    assert wait_for(lambda: len(bot.client.log) == 2)
+    first, second = (message for _, message in bot.client.log)
+    assert first.conversation == "first"
+    assert second.documentMessage.caption == "second"
+    assert bot.restart["resumed_sends"] == 2
+    assert not os.path.exists(handover.path)
+    assert wait_for(lambda: not os.path.exists(kept))
+
+
+def test_unreadable_handover_file_is_dropped(handover):
+    with open(handover.path, "w") as f:
+        f.write("{not json")
+    assert handover.take() is None
+    assert not os.path.exists(handover.path)
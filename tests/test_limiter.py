@@ -0,0 +1,108 @@
+import asyncio
+import time
+
+import pytest
+
+from limiter import AIMDLimiter, CircuitBreaker
+
+
+def run_calls(limiter, delays, fail=False):
+    async def call(delay):
+        async with limiter.slot():
+            await asyncio.sleep(delay)
+            if fail:
+                raise RuntimeError("server returned error 500")
+
+    async def run():
+        for delay in delays:
+            try:
+                await call(delay)
+            except RuntimeError:
+                pass
+
+    asyncio.run(run())
+
+
+def test_limit_grows_additively_while_latency_is_steady():
+    limiter = AIMDLimiter("send", initial=4, max_limit=8)
+    run_calls(limiter, [0.001] * 20)
+    assert 4 < limiter.limit <= 8
+    assert limiter.successes == 20
+
+
+def test_failure_cuts_limit_multiplicatively():
+    limiter = AIMDLimiter("send", initial=8, backoff=0.5)
+    run_calls(limiter, [0], fail=True)
+    assert limiter.limit == 4
+    assert limiter.failures == 1
+
+
+def test_slowdown_cuts_limit():
+    limiter = AIMDLimiter("send", initial=8, backoff=0.5, tolerance=2.0)
+    run_calls(limiter, [0.005, 0.05])
+    assert limiter.limit == (8 + 1 / 8) * 0.5
+
+
+def test_limit_never_drops_below_minimum():
+    limiter = AIMDLimiter("send", initial=2, min_limit=1, backoff=0.5)
+    run_calls(limiter, [0] * 5, fail=True)
+    assert limiter.limit == 1
+
+
+def test_cancelled_call_is_neutral():
+    limiter = AIMDLimiter("send", initial=8)
+
+    async def run():
+        async with limiter.slot():
+            pass
+        baseline = limiter.baseline
+        task = asyncio.ensure_future(slow(limiter))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return baseline
+
+    baseline = asyncio.run(run())
+    assert limiter.cancelled == 1 and limiter.failures == 0
+    assert limiter.inflight == 0
+    assert limiter.baseline == baseline
+    assert limiter.limit == 8 + 1 / 8
+
+
+async def slow(limiter):
+    async with limiter.slot():
+        await asyncio.sleep(1)
+
+
+def test_breaker_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.snapshot()["rejected"] == 1
+
+
+def test_breaker_probes_once_per_timeout_then_closes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()  # the probe
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # one probe at a time
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.times_opened == 1
@@ -0,0 +1,102 @@
+import asyncio
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import linkpreview
+from linkpreview import HTTPPool, LinkPreviewer
+
+PAGE = b"""<html><head><title>Fallback</title>
+<meta property="og:title" content="Spring sale">
+<meta property="og:description" content="Everything half price">
+</head><body>...</body></html>"""
+
+
+class StandIn(BaseHTTPRequestHandler):
+    hosts = []
+
+    def do_GET(self):
+        self.hosts.append(self.headers["Host"])
+        if self.path == "/moved":
+            self.send_response(302)
+            self.send_header("Location", "/")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.path == "/slow":
+            time.sleep(0.6)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(linkpreview, "ALLOW_PRIVATE_HOSTS", True)
+    StandIn.hosts = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def fake_dns(monkeypatch, address):
+    """Resolve every name to `address`, counting lookups"""
+    lookups = []
+
+    def getaddrinfo(host, port, *args, **kwargs):
+        lookups.append(host)
+        return [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", (address, port))]
+    monkeypatch.setattr(linkpreview.socket, "getaddrinfo", getaddrinfo)
+    return lookups
+
+
+def test_fetch_follows_redirect_and_reads_open_graph(server):
+    preview = LinkPreviewer()._fetch(f"http://127.0.0.1:{server}/moved")
+    assert preview["title"] == "Spring sale"
+    assert preview["description"] == "Everything half price"
+    assert StandIn.hosts == [f"127.0.0.1:{server}"] * 2
+
+
+def test_connects_to_checked_address_with_host_header(server, monkeypatch):
+    lookups = fake_dns(monkeypatch, "127.0.0.1")
+    pool = HTTPPool()
+    status, content_type, body = pool.get(f"http://preview.test:{server}/", 1024)
+    assert (status, body) == (200, PAGE)
+    assert StandIn.hosts == [f"preview.test:{server}"]
+    assert lookups.count("preview.test") == 1  # the connection itself goes to the address
+
+
+def test_refuses_private_address(server, monkeypatch):
+    monkeypatch.setattr(linkpreview, "ALLOW_PRIVATE_HOSTS", False)
+    fake_dns(monkeypatch, "127.0.0.1")
+    with pytest.raises(ValueError):
+        HTTPPool().get(f"http://preview.test:{server}/", 1024)
+    assert StandIn.hosts == []
+
+
+def test_prefetch_gives_up_but_keeps_fetching(server):
+    previewer = LinkPreviewer()
+    text = f"See http://127.0.0.1:{server}/slow"
+
+    async def run():
+        started = time.monotonic()
+        await previewer.prefetch(text, timeout=0.1)
+        waited = time.monotonic() - started
+        missing = previewer.cached(text)
+        await asyncio.sleep(1.0)
+        return waited, missing, previewer.cached(text)
+
+    waited, missing, later = asyncio.run(run())
+    assert waited < 0.5
+    assert missing is None
+    assert later["title"] == "Spring sale"
@@ -0,0 +1,173 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import linkpreview
+from limiter import AIMDLimiter
+from scheduler import ChatLanes, PriorityScheduler, ShuttingDown
+
+PAGE = b"<html><head><title>Slow page</title></head></html>"
+
+
+def test_chat_lanes_keep_arrival_order_per_chat():
+    lanes = ChatLanes()
+    order = []
+
+    async def send(chat, name, delay):
+        async with lanes.turn(chat):
+            await asyncio.sleep(delay)
+            order.append(name)
+
+    async def run():
+        await asyncio.gather(
+            send("a", "a1", 0.05), send("a", "a2", 0), send("b", "b1", 0.01), send("a", "a3", 0)
+        )
+
+    asyncio.run(run())
+    assert [name for name in order if name.startswith("a")] == ["a1", "a2", "a3"]
+    assert order.index("b1") < order.index("a1")  # other chats are not held up
+    assert lanes.idle() and lanes.ordered == 2
+
+
+def test_chat_lanes_hold_place_of_cancelled_send():
+    lanes = ChatLanes()
+    order = []
+
+    async def send(name, delay):
+        async with lanes.turn("a"):
+            await asyncio.sleep(delay)
+            order.append(name)
+
+    async def run():
+        first = asyncio.ensure_future(send("first", 0.1))
+        await asyncio.sleep(0)
+        waiting = asyncio.ensure_future(send("gave up", 0))
+        third = asyncio.ensure_future(send("third", 0))
+        await asyncio.sleep(0.01)
+        waiting.cancel()
+        await asyncio.gather(first, third, return_exceptions=True)
+
+    asyncio.run(run())
+    assert order == ["first", "third"]
+
+
+def test_transactional_served_first_and_bulk_keeps_moving():
+    scheduler = PriorityScheduler(max_concurrency=1, reserved=0, weights={"normal": 3, "bulk": 1})
+    order = []
+
+    async def send(lane, name):
+        async with scheduler.slot(lane):
+            order.append(name)
+            await asyncio.sleep(0.001)
+
+    async def run():
+        blocker = asyncio.ensure_future(send("normal", "blocker"))
+        await asyncio.sleep(0)
+        sends = [send("bulk", f"b{i}") for i in range(3)] + [send("normal", f"n{i}") for i in range(6)]
+        sends.append(send("transactional", "otp"))
+        await asyncio.gather(blocker, *sends)
+
+    asyncio.run(run())
+    assert order[1] == "otp"
+    # 3:1 weighted round robin between normal and bulk
+    assert order[2:10] == ["n0", "n1", "n2", "b0", "n3", "n4", "n5", "b1"]
+
+
+def test_reserved_slots_only_for_transactional():
+    scheduler = PriorityScheduler(max_concurrency=2, reserved=1)
+    started = []
+
+    async def send(lane, name, delay):
+        async with scheduler.slot(lane):
+            started.append(name)
+            await asyncio.sleep(delay)
+
+    async def run():
+        bulk = [asyncio.ensure_future(send("bulk", f"b{i}", 0.05)) for i in range(2)]
+        await asyncio.sleep(0.01)
+        otp = asyncio.ensure_future(send("transactional", "otp", 0))
+        await asyncio.sleep(0.01)
+        assert started == ["b0", "otp"]
+        await asyncio.gather(*bulk, otp)
+
+    asyncio.run(run())
+
+
+def test_cancel_after_close_releases_nothing():
+    scheduler = PriorityScheduler(max_concurrency=1, reserved=0)
+
+    async def run():
+        holder = asyncio.ensure_future(hold(scheduler, 0.05))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(hold(scheduler, 0))
+        await asyncio.sleep(0)
+        scheduler.close()
+        waiter.cancel()
+        with pytest.raises((ShuttingDown, asyncio.CancelledError)):
+            await waiter
+        await holder
+
+    asyncio.run(run())
+    assert scheduler.running == 0 and scheduler.idle()
+
+
+async def hold(scheduler, delay):
+    async with scheduler.slot("normal"):
+        await asyncio.sleep(delay)
+
+
+def test_limiter_lets_transactional_waiter_through_first():
+    limiter = AIMDLimiter("send", initial=1, max_limit=1)
+    order = []
+
+    async def call(name, priority):
+        async with limiter.slot(priority=priority):
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        await asyncio.gather(call("running", 1), call("bulk1", 1), call("bulk2", 1), call("otp", 0))
+
+    asyncio.run(run())
+    assert order == ["running", "otp", "bulk1", "bulk2"]
+
+
+class SlowPage(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(0.3)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(PAGE)))
+        self.end_headers()
+        self.wfile.write(PAGE)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def slow_page(monkeypatch):
+    monkeypatch.setattr(linkpreview, "ALLOW_PRIVATE_HOSTS", True)
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), SlowPage)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}/"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_document_does_not_overtake_text_waiting_for_preview(bot, slow_page, tmp_path):
+    document = tmp_path / "terms.pdf"
+    document.write_bytes(b"%PDF-1.4 terms")
+    with ThreadPoolExecutor(2) as pool:
+        text = pool.submit(bot.send_message, "6281234567890", f"Terms: {slow_page}")
+        time.sleep(0.05)
+        doc = pool.submit(bot.send_document, "6281234567890", str(document))
+        assert text.result()["status"] == "success"
+        assert doc.result()["status"] == "success"
+    kinds = ["document" if message.HasField("documentMessage") else "text" for _, message in bot.client.log]
+    assert kinds == ["text", "document"]
+    assert bot.client.log[0][1].HasField("extendedTextMessage")  # went out with its preview
@@ -0,0 +1,92 @@
+import asyncio
+import sys
+
+import pytest
+
+from errors import (
+    PERMANENT_MEDIA, PERMANENT_RECIPIENT, RATE_LIMITED, SESSION, TRANSIENT, UNKNOWN, DeliveryUnknown, classify,
+    send_error
+)
+
+
+@pytest.mark.parametrize("error, expected", [
+    (asyncio.TimeoutError(), TRANSIENT),
+    (ConnectionResetError("reset by peer"), TRANSIENT),
+    (Exception("server returned error 503"), TRANSIENT),
+    (Exception("rate-overlimit"), RATE_LIMITED),
+    (Exception("server returned error 429"), RATE_LIMITED),
+    (Exception("server returned error 404: item-not-found"), PERMANENT_RECIPIENT),
+    (FileNotFoundError("photo.jpg"), PERMANENT_MEDIA),
+    (Exception("not logged in"), SESSION),
+    (Exception("something odd"), UNKNOWN),
+])
+def test_classify(error, expected):
+    assert classify(error) == expected
+
+
+def test_only_transient_and_rate_limited_are_retryable():
+    assert send_error(Exception("server returned error 503"))["retryable"]
+    assert send_error(Exception("rate-overlimit"))["retryable"]
+    assert not send_error(Exception("server returned error 404"))["retryable"]
+    assert not send_error(Exception("not logged in"))["retryable"]
+
+
+def test_delivery_unknown_keeps_class_but_is_not_retryable():
+    result = send_error(DeliveryUnknown(asyncio.TimeoutError("send timed out")))
+    assert result["code"] == TRANSIENT
+    assert result["retryable"] is False
+    assert result["delivery"] == "unknown"
+
+
+@pytest.fixture
+def failing_send(bot, monkeypatch):
+    """Make client.send_message raise the given exception; records each attempt"""
+    monkeypatch.setattr(sys.modules["bot"], "RETRY_BASE_DELAY", 0.001)
+    attempts = []
+
+    def fail_with(error):
+        async def send_message(jid, message):
+            attempts.append(jid)
+            raise error
+        monkeypatch.setattr(bot.client, "send_message", send_message)
+        return attempts
+    return fail_with
+
+
+def test_failure_before_send_is_retried_then_dead_lettered(bot, failing_send):
+    attempts = failing_send(Exception("websocket not connected"))
+    result = bot.send_message("6281234567890", "hello", link_preview=False)
+    assert result["code"] == TRANSIENT
+    assert result["attempts"] == sys.modules["bot"].SEND_ATTEMPTS == len(attempts)
+    entry = bot.dead_letters.get(result["dead_letter_id"])
+    assert entry["error_class"] == TRANSIENT
+    assert entry["arguments"]["message"] == "hello"
+
+
+def test_timeout_after_send_is_not_resent(bot, failing_send):
+    attempts = failing_send(asyncio.TimeoutError("info query timed out"))
+    result = bot.send_message("6281234567890", "OTP 123456", link_preview=False)
+    assert len(attempts) == 1
+    assert (result["attempts"], result["retryable"], result["delivery"]) == (1, False, "unknown")
+    assert bot.breaker.consecutive_failures == 1  # one failure per attempt
+
+
+def test_permanent_recipient_error_is_not_retried_nor_counted(bot, failing_send):
+    attempts = failing_send(Exception("server returned error 404: item-not-found"))
+    result = bot.send_message("6281234567890", "hello", link_preview=False)
+    assert len(attempts) == 1
+    assert result["code"] == PERMANENT_RECIPIENT and result["attempts"] == 1
+    assert "dead_letter_id" in result
+    assert bot.breaker.consecutive_failures == 0
+
+
+def test_missing_file_fails_without_sending(bot):
+    result = bot.send_image("6281234567890", "does-not-exist.jpg")
+    assert result["code"] == PERMANENT_MEDIA and result["attempts"] == 1
+    assert bot.client.log == []
+
+
+def test_dead_letter_opt_out(bot, failing_send):
+    failing_send(Exception("server returned error 404: item-not-found"))
+    result = bot.send_message("6281234567890", "hello", link_preview=False, dead_letter=False)
+    assert "dead_letter_id" not in result
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from rules import RulesEngine
+
+RULES = [
+    {"name": "otp", "regex": r"code (?P<code>\d{6})", "reply": "Got {code}"},
+    {"name": "price", "keyword": ["price", "how much"], "reply": "Price list"},
+    {"name": "order", "prefix": "order", "reply": "Ordering {rest}"},
+    {"name": "shout", "regex": r"(?-i:HELP)", "reply": "Helping"},
+    {"name": "case", "regex": r"(?i)case \w+", "reply": "Case"},
+    {"name": "verbose", "regex": "(?x) ticket \\s+ (?P<id>\\d+)  # trailing comment", "reply": "Ticket {id}"},
+    {"name": "any-digits", "regex": r"\d+", "reply": "Number"},
+]
+
+
+class Sender:
+    """Stands in for the bot; records text replies"""
+
+    def __init__(self):
+        self.sent = []
+
+    def send_message(self, chat, message, **kwargs):
+        self.sent.append((chat, message))
+        return {"status": "success"}
+
+
+def load(tmp_path, rules, **config):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(dict(config, rules=rules)))
+    return RulesEngine(Sender(), str(path))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = load(tmp_path, RULES, cooldown=0)
+    assert engine.last_error is None
+    return engine
+
+
+def reply(engine, text, chat="6281234567890@s.whatsapp.net"):
+    engine.bot.sent.clear()
+    engine.handle({"text": text, "chat": chat, "sender": chat})
+    return engine.bot.sent[0][1] if engine.bot.sent else None
+
+
+@pytest.mark.parametrize("text, expected", [
+    # earlier rules win whatever their kind or where in the text they match
+    ("order 2, how much? code 123456", "Got 123456"),
+    ("order 2, how much?", "Price list"),
+    ("Order two boxes", "Ordering two boxes"),
+    ("room 101", "Number"),
+    ("HELP", "Helping"),
+    ("help", None),
+    ("CASE closed", "Case"),
+    ("re: ticket   42", "Ticket 42"),
+])
+def test_first_rule_in_file_wins(engine, text, expected):
+    assert reply(engine, text) == expected
+
+
+def test_later_regex_does_not_shadow_earlier_one(tmp_path):
+    engine = load(tmp_path, [
+        {"name": "late-match", "regex": r"refund", "reply": "Refunds"},
+        {"name": "early-match", "regex": r"hi", "reply": "Hello"},
+    ], cooldown=0)
+    assert reply(engine, "hi, I want a refund") == "Refunds"
+
+
+def test_inline_flag_mid_pattern_is_rejected(tmp_path):
+    engine = load(tmp_path, [{"regex": r"code (?i)\d+", "reply": "x"}])
+    assert engine.last_error == (
+        "rule 1: inline flags such as (?i) are only supported at the start of the pattern"
+    )
+
+
+def test_cooldown_and_groups(tmp_path):
+    engine = load(tmp_path, RULES)
+    assert reply(engine, "price?") == "Price list"
+    assert reply(engine, "price?") is None
+    assert engine.snapshot()["matches"]["price"] == {"matched": 2, "replied": 1, "cooldown": 1, "failed": 0}
+    assert reply(engine, "price?", chat="123456789-1@g.us") is None
@@ -0,0 +1,85 @@
+import asyncio
+import io
+
+import pytest
+
+from scheduler import PriorityScheduler
+from tracing import InMemoryExporter, tracer
+
+JPEG = b"\xff\xd8\xff\xe0" + b"\x00" * 2048 + b"\xff\xd9"
+
+
+@pytest.fixture
+def exporter(api):
+    saved = tracer.exporter, tracer.enabled, tracer.sample_ratio
+    tracer.exporter, tracer.enabled, tracer.sample_ratio = InMemoryExporter(), True, 1.0
+    yield tracer.exporter
+    tracer.exporter, tracer.enabled, tracer.sample_ratio = saved
+
+
+def test_http_send_span_tree(api, exporter):
+    response = api.app.test_client().post("/api/send-image", data={
+        "phone": "6281234567890",
+        "file": (io.BytesIO(JPEG), "photo.jpg")
+    }, content_type="multipart/form-data")
+    assert response.status_code == 200, response.get_json()
+
+    spans = {span.name: span for span in exporter.get_finished_spans()}
+    root = spans["POST /api/send-image"]
+    send = spans["bot.image"]
+    assert {span.trace_id for span in spans.values()} == {root.trace_id}
+    assert spans["parse_multipart"].parent_id == root.span_id
+    assert spans["loop_handoff"].parent_id == root.span_id
+    assert send.parent_id == root.span_id
+    for name in ("priority_queue", "build_upload", "send_message"):
+        assert spans[name].parent_id == send.span_id, name
+        assert spans[name].status == "unset", name
+    assert spans["media_prep"].parent_id == spans["build_upload"].span_id
+    assert spans["build_upload"].attributes["message.bytes"] == len(JPEG)
+
+
+def single_slot_sender():
+    """Just what @prioritized needs, with one slot"""
+    from bot import prioritized
+
+    class Sender:
+        scheduler = PriorityScheduler(max_concurrency=1, reserved=0)
+
+        @prioritized
+        async def send(self, delay):
+            await asyncio.sleep(delay)
+            return {"status": "success"}
+    return Sender()
+
+
+def queue_spans(exporter):
+    return [span for span in exporter.get_finished_spans() if span.name == "priority_queue"]
+
+
+def test_queue_span_ends_when_cancelled(exporter):
+    async def run():
+        sender = single_slot_sender()
+        with tracer.span("request"):
+            running = asyncio.ensure_future(sender.send(0.2))
+            await asyncio.sleep(0)
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(sender.send(0), 0.05)
+            await running
+
+    asyncio.run(run())
+    statuses = sorted((span.status, span.status_message) for span in queue_spans(exporter))
+    assert statuses == [("error", "cancelled"), ("unset", None)]
+
+
+def test_queue_span_ends_at_shutdown(exporter):
+    from bot import shutting_down_result
+
+    async def run():
+        sender = single_slot_sender()
+        sender.scheduler.close()
+        with tracer.span("request"):
+            return await sender.send(0)
+
+    assert asyncio.run(run()) == shutting_down_result()
+    [span] = queue_spans(exporter)
+    assert (span.status, span.status_message) == ("error", "shutting down")
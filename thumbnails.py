@@ -0,0 +1,77 @@
+import io
+import threading
+from collections import OrderedDict
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Thumbnails are then unavailable
+    Image = None
+
+THUMBNAIL_SIZES = (64, 128, 256, 512)  # longest side in pixels; a fixed set keeps the cache effective
+THUMBNAIL_QUALITY = 75
+
+
+def render_thumbnail(path, size):
+    """Blocking: JPEG bytes of the image at path scaled to fit size x size"""
+    with Image.open(path) as image:
+        image.draft("RGB", (size, size))  # JPEGs decode straight at a reduced scale
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        out = io.BytesIO()
+        image.convert("RGB").save(out, "JPEG", quality=THUMBNAIL_QUALITY)
+    return out.getvalue()
+
+
+class ThumbnailCache:
+    """Image thumbnails rendered on demand and kept in an LRU bounded by total bytes.
+
+    Keys are (content hash, size), so entries never go stale. Rendering
+    runs on the calling request thread; two requests missing the same key
+    at once both render it.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.available = Image is not None
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sha256, path, size):
+        """JPEG thumbnail bytes; raises if the file is not an image Pillow can read"""
+        key = (sha256, size)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        try:
+            data = render_thumbnail(path, size)
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = data
+                self.bytes += len(data)
+            while self.bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+        return data
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "available": self.available,
+                "cached": len(self._entries),
+                "bytes": self.bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures
+            }
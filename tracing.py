@@ -0,0 +1,246 @@
+import contextvars
+import json
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+TRACING_EXPORTER = os.environ.get("WA_TRACING_EXPORTER", "none")  # none | console | memory | otlp
+TRACING_SAMPLE_RATIO = float(os.environ.get("WA_TRACING_SAMPLE_RATIO", "0.1"))
+OTLP_ENDPOINT = os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4318")
+SERVICE_NAME = os.environ.get("OTEL_SERVICE_NAME", "whatsapp-api")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """One timed operation, shaped like an OpenTelemetry span (W3C trace/span ids)"""
+
+    def __init__(self, tracer, name, trace_id, span_id, parent_id, sampled, attributes=None, start_ns=None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.parent_id = parent_id
+        self.sampled = sampled
+        self.attributes = dict(attributes or {})
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns = None
+        self.status = "unset"
+        self.status_message = None
+
+    def set_attribute(self, key, value):
+        if self.sampled:
+            self.attributes[key] = value
+
+    def set_error(self, message):
+        if self.sampled:
+            self.status = "error"
+            self.status_message = str(message)
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            if self.sampled:
+                self.tracer.exporter.export(self)
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-{'01' if self.sampled else '00'}"
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3) if self.end_ns else None,
+            "attributes": self.attributes,
+            "status": self.status,
+            "status_message": self.status_message
+        }
+
+
+class InMemoryExporter:
+    """Keeps finished spans in a list; for tests"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def get_finished_spans(self):
+        with self._lock:
+            return list(self.spans)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+class ConsoleExporter:
+    def export(self, span):
+        print(json.dumps(span.to_dict()))
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OTLPExporter:
+    """Batches spans on a background thread and POSTs them as OTLP/HTTP JSON.
+
+    A bounded queue drops spans rather than slowing requests when the
+    collector is unreachable.
+    """
+
+    def __init__(self, endpoint=OTLP_ENDPOINT, max_queue=2048, batch_size=512, interval=2.0):
+        self.url = endpoint.rstrip("/") + "/v1/traces"
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.batch_size = batch_size
+        self.interval = interval
+        self.dropped = 0
+        threading.Thread(target=self._run, name="otlp-exporter", daemon=True).start()
+
+    def export(self, span):
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size and time.monotonic() < deadline:
+                try:
+                    batch.append(self.queue.get(timeout=max(0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            try:
+                self._post(batch)
+            except Exception as e:
+                print(f"⚠️ Trace export failed ({len(batch)} spans): {e}")
+
+    def _post(self, spans):
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+                "scopeSpans": [{
+                    "scope": {"name": "whatsapp-api"},
+                    "spans": [{
+                        "traceId": s.trace_id,
+                        "spanId": s.span_id,
+                        "parentSpanId": s.parent_id or "",
+                        "name": s.name,
+                        "kind": 1,
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns),
+                        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+                        "status": {"code": 2 if s.status == "error" else 0, "message": s.status_message or ""}
+                    } for s in spans]
+                }]
+            }]
+        }
+        request = urllib.request.Request(
+            self.url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+class NoopExporter:
+    def export(self, span):
+        pass
+
+
+EXPORTERS = {
+    "none": NoopExporter,
+    "console": ConsoleExporter,
+    "memory": InMemoryExporter,
+    "otlp": OTLPExporter
+}
+
+
+class Tracer:
+    """Minimal tracer: parent-based ratio sampling, contextvar propagation.
+
+    Unsampled traces still carry ids so children follow their root's
+    decision, but record nothing; with the `none` exporter every span is
+    unsampled and costs only an object allocation.
+    """
+
+    def __init__(self, exporter="none", sample_ratio=TRACING_SAMPLE_RATIO):
+        self.exporter = EXPORTERS[exporter]() if isinstance(exporter, str) else exporter
+        self.enabled = not isinstance(self.exporter, NoopExporter)
+        self.sample_ratio = sample_ratio
+
+    def start_span(self, name, attributes=None, parent=None, start_ns=None):
+        """Create a span (child of `parent` or the current span) without activating it"""
+        parent = parent or _current_span.get()
+        if parent is not None:
+            trace_id, parent_id, sampled = parent.trace_id, parent.span_id, parent.sampled
+        else:
+            trace_id, parent_id = f"{random.getrandbits(128):032x}", None
+            sampled = self.enabled and random.random() < self.sample_ratio
+        return Span(self, name, trace_id, f"{random.getrandbits(64):016x}", parent_id,
+                    sampled, attributes if sampled else None, start_ns)
+
+    @contextmanager
+    def span(self, name, attributes=None, start_ns=None):
+        """Start a child span, make it current for the block, end it afterwards"""
+        span = self.start_span(name, attributes, start_ns=start_ns)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(e)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def attach(self, span):
+        """Make `span` current; returns a token for detach()"""
+        return _current_span.set(span)
+
+    def detach(self, token):
+        _current_span.reset(token)
+
+    @contextmanager
+    def activate(self, span):
+        """Make an existing span current, e.g. inside a task started from another thread"""
+        token = self.attach(span)
+        try:
+            yield span
+        finally:
+            self.detach(token)
+
+    def current_span(self):
+        return _current_span.get()
+
+    def from_traceparent(self, header):
+        """Remote parent from a W3C `traceparent` header, or None"""
+        try:
+            version, trace_id, span_id, flags = header.strip().split("-")
+            if len(trace_id) != 32 or len(span_id) != 16 or int(trace_id, 16) == 0:
+                return None
+            return Span(self, "remote", trace_id, span_id, None, self.enabled and int(flags, 16) & 1 == 1)
+        except (AttributeError, ValueError):
+            return None
+
+
+tracer = Tracer(TRACING_EXPORTER)